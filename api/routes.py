@@ -16,7 +16,7 @@ router = APIRouter(prefix="/api/v1", tags=["MikroTik"])
 
 
 @router.post("/verify-connection", response_model=ConnectionStatus)
-async def verify_connection(credentials: MikrotikCredentials):
+def verify_connection(credentials: MikrotikCredentials):
     """
     Verifica la conexión al RouterOS de MikroTik
 
@@ -49,7 +49,7 @@ async def verify_connection(credentials: MikrotikCredentials):
 
 
 @router.post("/queues", response_model=QueueListResponse)
-async def get_queues(credentials: MikrotikCredentials):
+def get_queues(credentials: MikrotikCredentials):
     """
     Obtiene la lista de todas las queues simples del RouterOS
 
@@ -76,7 +76,7 @@ async def get_queues(credentials: MikrotikCredentials):
 
 
 @router.post("/queues/search/{queue_name}", response_model=QueueSearchResponse)
-async def search_queue(queue_name: str, credentials: MikrotikCredentials):
+def search_queue(queue_name: str, credentials: MikrotikCredentials):
     """
     Busca una queue específica por su nombre
 
@@ -104,7 +104,7 @@ async def search_queue(queue_name: str, credentials: MikrotikCredentials):
 
 
 @router.post("/arp")
-async def get_arp_list(credentials: MikrotikCredentials):
+def get_arp_list(credentials: MikrotikCredentials):
     """
     Obtiene la lista completa de entradas ARP del RouterOS
 
@@ -132,7 +132,7 @@ async def get_arp_list(credentials: MikrotikCredentials):
 
 
 @router.post("/arp/export")
-async def export_arp_to_csv(credentials: MikrotikCredentials):
+def export_arp_to_csv(credentials: MikrotikCredentials):
     """
     Exporta la tabla ARP a formato CSV
 
@@ -182,7 +182,7 @@ async def health_check():
 
 
 @router.post("/system/resources")
-async def get_system_resources(credentials: MikrotikCredentials):
+def get_system_resources(credentials: MikrotikCredentials):
     """
     Obtiene información de recursos del sistema (CPU, Memoria, Disco, etc)
     """
@@ -207,7 +207,7 @@ async def get_system_resources(credentials: MikrotikCredentials):
 
 
 @router.post("/interfaces")
-async def get_interfaces(credentials: MikrotikCredentials):
+def get_interfaces(credentials: MikrotikCredentials):
     """
     Obtiene estadísticas detalladas de todas las interfaces
     """
@@ -234,7 +234,7 @@ async def get_interfaces(credentials: MikrotikCredentials):
 
 
 @router.post("/dhcp/leases")
-async def get_dhcp_leases(credentials: MikrotikCredentials):
+def get_dhcp_leases(credentials: MikrotikCredentials):
     """
     Obtiene la lista de leases DHCP
     """
@@ -259,7 +259,7 @@ async def get_dhcp_leases(credentials: MikrotikCredentials):
 
 
 @router.post("/logs")
-async def get_logs(credentials: MikrotikCredentials):
+def get_logs(credentials: MikrotikCredentials):
     """
     Obtiene los últimos logs del router
     """
@@ -284,7 +284,7 @@ async def get_logs(credentials: MikrotikCredentials):
 
 
 @router.post("/dhcp/bind", response_model=ProvisionResponse)
-async def bind_dhcp_lease(request: BindDhcpLeaseRequest):
+def bind_dhcp_lease(request: BindDhcpLeaseRequest):
     """
     Amarra una IP a una MAC (Static Lease)
     """
@@ -318,7 +318,7 @@ async def bind_dhcp_lease(request: BindDhcpLeaseRequest):
 
 
 @router.post("/queues/create", response_model=ProvisionResponse)
-async def create_simple_queue(request: CreateSimpleQueueRequest):
+def create_simple_queue(request: CreateSimpleQueueRequest):
     """
     Crea o actualiza una Simple Queue
     """
@@ -352,7 +352,7 @@ async def create_simple_queue(request: CreateSimpleQueueRequest):
 
 
 @router.post("/provision/simple-flow", response_model=ProvisionResponse)
-async def provision_simple_flow(
+def provision_simple_flow(
     lease_request: BindDhcpLeaseRequest,
     queue_request: CreateSimpleQueueRequest
 ):
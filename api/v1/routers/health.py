@@ -1,38 +1,71 @@
 from fastapi import APIRouter
 from services.mikrotik_service import mikrotik_service
 from services.collector_service import collector_service
-from core.database import influx_db
+from services.circuit_breaker import router_breakers, CLOSED, OPEN
+from services.sharding import shard_assignment
+from services.pipeline import collector_pipeline
+from services.history_cache import history_cache
+from services.rollups import rollup_manager
+from services.anomaly_detector import anomaly_detector
+from core.config import settings
+from core.database import storage
 import asyncio
 
 router = APIRouter()
 
 @router.get("/health")
-async def health_check():
-    """Verifica estado de servicios dependientes y conectividad con todos los routers"""
-    influx_status = influx_db.check_health()
-    
-    # Check all routers
+async def health_check(probe: bool = False):
+    """
+    Verifica estado de servicios dependientes y de los routers.
+
+    Por defecto no contacta a los routers: informa el estado que dejó el
+    collector en el circuit breaker de cada uno. Con `probe=true` se prueba
+    la conexión de los routers cuyo circuito lo permite.
+    """
+    storage_status = await storage.check_health_async()
+
     routers = collector_service.get_router_inventory()
     mikrotik_results = {}
-    
+    breaker_results = {}
+
     if routers:
-        tasks = [mikrotik_service.check_connection(r) for r in routers]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for router, res in zip(routers, results):
-            status = "connected" if res is True else "disconnected"
-            mikrotik_results[router.alias] = status
+        if probe:
+            tasks = [mikrotik_service.check_connection(r) for r in routers]
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        breakers = router_breakers.stats()
+        for r in routers:
+            breaker = breakers.get(r.alias)
+            if breaker is None or (breaker["state"] == CLOSED and breaker["last_success"] is None):
+                status = "unknown"  # Todavía no se contactó
+            elif breaker["state"] == CLOSED:
+                status = "connected"
+            elif breaker["state"] == OPEN:
+                status = "disconnected"
+            else:
+                status = "probing"
+            mikrotik_results[r.alias] = status
+            if breaker is not None:
+                breaker_results[r.alias] = breaker
     else:
         mikrotik_results["error"] = "No routers in inventory"
 
     # Status is healthy if Influx is OK and at least one router is reachable (or depending on policy)
     # For now, if Influx is UP, we say healthy, but report individual router status.
-    status = "healthy" if influx_status else "degraded"
-    
+    status = "healthy" if storage_status else "degraded"
+
     return {
         "status": status,
         "components": {
-            "influxdb": "connected" if influx_status else "disconnected",
-            "routers": mikrotik_results
+            storage.name: "connected" if storage_status else "disconnected",
+            "write_buffer": storage.buffer_stats(),
+            "routers": mikrotik_results,
+            "breakers": breaker_results,
+            "shard": shard_assignment.stats(),
+            "scheduler": collector_service.scheduler.stats(),
+            "history_cache": history_cache.stats(),
+            "rollups": rollup_manager.stats(),
+            "anomalies": anomaly_detector.stats(),
+            "pipeline": collector_pipeline.stats() if settings.COLLECTOR_MODE == "process" else None
         }
     }
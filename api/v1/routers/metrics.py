@@ -1,69 +1,312 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from services.collector_service import collector_service
-from core.database import influx_db
-from typing import List, Dict, Any
+from services.pipeline import collector_pipeline
+from services.latest_store import latest_store, TOP_METRICS
+from services.history_cache import history_cache
+from services.usage_accounting import usage_accounting, PERIODS
+from services.anomaly_detector import anomaly_detector
+from services.counter_index import carry_seconds
+from services.rollups import duration_seconds
+from services.sharding import shard_assignment
+from models.alerts import ALERT_KINDS
+from core.config import settings
+from core.database import storage
+from models.history import BulkHistoryRequest, DURATION_PATTERN, AGGREGATION_FUNCTIONS
+from typing import AsyncIterator, List, Dict, Any, Optional
+import csv
+import io
+import json
+import time
 
 router = APIRouter()
 
 @router.post("/sync/force")
 async def force_sync(background_tasks: BackgroundTasks):
     """Forza una recolección manual de métricas"""
-    background_tasks.add_task(collector_service.collect_metrics)
+    if settings.COLLECTOR_MODE == "process":
+        collector_pipeline.run_now()
+    else:
+        background_tasks.add_task(collector_service.collect_metrics)
     return {"message": "Recolección iniciada en segundo plano"}
 
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+async def _point_lines(chunks: AsyncIterator[list], format: str) -> AsyncIterator[bytes]:
+    """Una línea por punto (NDJSON o CSV); se emite una tanda por cada tanda del backend"""
+    if format == "csv":
+        yield b"time,field,value\n"
+    async for points in chunks:
+        if format == "csv":
+            lines = [f"{p.time.isoformat()},{p.field},{p.value}\n" for p in points]
+        else:
+            lines = [
+                json.dumps({"time": p.time.isoformat(), "field": p.field, "value": p.value}) + "\n"
+                for p in points
+            ]
+        yield "".join(lines).encode()
+
+async def _stream_response(chunks: AsyncIterator[list], render) -> StreamingResponse:
+    """
+    Respuesta que se escribe a medida que el backend entrega los puntos.
+    La primera tanda se pide antes de responder: un error del backend sigue siendo un 500.
+    """
+    try:
+        first = await anext(chunks, [])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def replay() -> AsyncIterator[list]:
+        try:
+            yield first
+            async for records in chunks:
+                yield records
+        finally:
+            await chunks.aclose()
+
+    return render(replay())
+
 @router.get("/user/{username}/history")
-async def get_user_history(username: str, range: str = "1h"):
+async def get_user_history(
+    username: str,
+    range: str = Query("1h", pattern=DURATION_PATTERN),
+    every: str = Query("1m", pattern=DURATION_PATTERN),
+    fn: str = "mean",
+    format: str = "json",
+):
     """
     Obtiene historial de consumo para un usuario.
-    Range ejemplos: 1h, 24h, 7d
-    """
-    query = f'''
-    from(bucket: "{influx_db.bucket}")
-      |> range(start: -{range})
-      |> filter(fn: (r) => r["_measurement"] == "mikrotik_traffic")
-      |> filter(fn: (r) => r["user_name"] == "{username}")
-      |> filter(fn: (r) => r["_field"] == "upload_bps" or r["_field"] == "download_bps")
-      |> aggregateWindow(every: 1m, fn: mean, createEmpty: false)
-      |> yield(name: "mean")
-    '''
-    
-    try:
-        tables = influx_db.query_api.query(query, org=influx_db.client.org)
+    Range ejemplos: 1h, 24h, 7d. `every` y `fn` definen la agregación (1m, mean).
+
+    Con `format=json` el resultado se guarda en caché hasta que el collector
+    escribe datos nuevos del usuario o vence HISTORY_CACHE_TTL_SECONDS.
+    Con `format=ndjson` o `format=csv` se envía en streaming, con memoria
+    acotada sin importar el rango (sin caché).
+
+    Con `fn` mean o max se lee el nivel de rollup más grueso que sirva para
+    `every` (ver services/rollups.py).
+    """
+    if fn not in AGGREGATION_FUNCTIONS:
+        raise HTTPException(status_code=400, detail=f"fn debe ser una de: {', '.join(AGGREGATION_FUNCTIONS)}")
+    if format != "json" and format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format debe ser json, {' o '.join(STREAM_FORMATS)}")
+
+    if format in STREAM_FORMATS:
+        return await _stream_response(
+            storage.history_stream([username], None, range, every, fn),
+            lambda chunks: StreamingResponse(_point_lines(chunks, format), media_type=STREAM_FORMATS[format])
+        )
+
+    async def load() -> List[Dict[str, Any]]:
         result = []
-        for table in tables:
-            for record in table.records:
+        async for points in storage.history_stream([username], None, range, every, fn):
+            for point in points:
                 result.append({
-                    "time": record.get_time(),
-                    "field": record.get_field(),
-                    "value": record.get_value()
+                    "time": point.time,
+                    "field": point.field,
+                    "value": point.value
                 })
-        return {"data": result}
+        return result
+
+    try:
+        result = await history_cache.get_or_load((username, range, every, fn), load)
+        return {"data": result, "tier": storage.history_tier(every, fn, range)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _series_lines(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    Una línea NDJSON por serie (usuario, router, campo). Los puntos de una
+    serie llegan juntos, así que cada serie se emite apenas termina.
+    """
+    series = None
+    current = None
+    async for points in chunks:
+        for point in points:
+            if point.series != current:
+                if series is not None:
+                    yield (json.dumps(series) + "\n").encode()
+                current = point.series
+                series = {
+                    "user_name": point.user_name,
+                    "router_alias": point.router_alias,
+                    "field": point.field,
+                    "points": [],
+                }
+            series["points"].append([point.time.isoformat(), point.value])
+    if series is not None:
+        yield (json.dumps(series) + "\n").encode()
+
+async def _bulk_csv_lines(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Una fila por punto; a diferencia de NDJSON no retiene ninguna serie completa"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(("time", "user_name", "router_alias", "field", "value"))
+    async for points in chunks:
+        writer.writerows(
+            (p.time.isoformat(), p.user_name, p.router_alias, p.field, p.value)
+            for p in points
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+@router.post("/history/bulk")
+async def get_bulk_history(request: BulkHistoryRequest):
+    """
+    Historial de muchos usuarios (o de todos los de un router) con una sola
+    consulta al backend. La respuesta (NDJSON o CSV) se envía a medida que se decodifica.
+    """
+    chunks = storage.history_stream(request.usernames, request.router_alias, request.range, request.every, request.fn)
+    if request.format == "csv":
+        return await _stream_response(
+            chunks, lambda chunks: StreamingResponse(_bulk_csv_lines(chunks), media_type="text/csv")
+        )
+    return await _stream_response(
+        chunks, lambda chunks: StreamingResponse(_series_lines(chunks), media_type="application/x-ndjson")
+    )
+
+def _current_max_age() -> int:
+    """Fotos más viejas que dos intervalos se consideran de un router caído"""
+    return settings.COLLECTOR_INTERVAL_SECONDS * 2
+
+def _memory_has_all_routers() -> bool:
+    """
+    La memoria de este proceso solo tiene los routers que recolecta: con el
+    collector en otros procesos, repartido en shards, o si otro proceso tiene
+    el lease de algún router (p. ej. varios workers de uvicorn), responde el backend.
+    """
+    if settings.COLLECTOR_MODE == "process" or shard_assignment.ring.shard_count != 1:
+        return False
+    return shard_assignment.holds_all(collector_service.get_router_inventory())
+
+def _memory_is_current() -> bool:
+    """
+    Además de tener todos los routers, cada uno tiene que tener una foto
+    reciente: un router recién agregado o que dejó de responder dejaría
+    respuestas incompletas o viejas, y en ese caso responde el backend.
+    """
+    if not _memory_has_all_routers():
+        return False
+    routers = collector_service.get_router_inventory()
+    return bool(routers) and all(
+        latest_store.is_fresh(r.alias, 2 * (r.interval_seconds or settings.COLLECTOR_INTERVAL_SECONDS))
+        for r in routers
+    )
+
+@router.get("/user/{username}/current")
+async def get_user_current(username: str):
+    """Valores actuales de un usuario (última recolección), desde memoria"""
+    if _memory_is_current():
+        queues = latest_store.find_queue(username)
+        if not queues:
+            raise HTTPException(status_code=404, detail=f"Usuario '{username}' no encontrado")
+        return {"data": queues, "source": "memory"}
+
+    # Sin foto completa y reciente en memoria: último punto guardado. Con escritura
+    # delta, una cola sin cambios puede no tener punto hasta el próximo keyframe
+    try:
+        queues = await storage.latest_values(username, carry_seconds())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not queues:
+        raise HTTPException(status_code=404, detail=f"Usuario '{username}' no encontrado")
+    return {"data": queues, "source": storage.name}
+
+@router.get("/router/{alias}/current")
+async def get_router_current(alias: str):
+    """Totales actuales de un router (última recolección), desde memoria"""
+    snapshot = latest_store.router(alias)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Sin datos recientes del router '{alias}'")
+    return {"router_alias": alias, "timestamp": snapshot.timestamp, "totals": snapshot.totals}
+
+@router.get("/top")
+async def get_top_talkers(metric: str = "download_bps", router: Optional[str] = None, limit: int = 10):
+    """
+    Colas que más consumen ahora (download_bps, upload_bps) o que más
+    paquetes descartaron en el último intervalo (dropped), por router o en
+    toda la red. Se responde con los top que arma el collector en cada ciclo,
+    así que solo está disponible con el collector en este proceso y sin shards.
+    """
+    if metric not in TOP_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric debe ser una de: {', '.join(TOP_METRICS)}")
+    if not _memory_has_all_routers():
+        raise HTTPException(status_code=503, detail="Top no disponible: este proceso no recolecta todos los routers")
+    if not latest_store:
+        raise HTTPException(status_code=503, detail="Sin datos en memoria todavía")
+    if router is not None and latest_store.router(router) is None:
+        raise HTTPException(status_code=404, detail=f"Sin datos recientes del router '{router}'")
+    return {
+        "metric": metric,
+        "router_alias": router,
+        "data": latest_store.top(metric, router, max(1, limit), max_age=_current_max_age()),
+    }
+
+@router.get("/alerts")
+async def get_alerts(
+    range: str = Query("1h", pattern=DURATION_PATTERN),
+    router: Optional[str] = None,
+    kind: Optional[str] = None,
+    active: bool = False,
+    limit: int = 100,
+):
+    """
+    Alertas de saturación (uso sostenido cerca del max-limit) y de descartes
+    que detecta el collector. Por defecto, los eventos (start/end) del rango,
+    del más nuevo al más viejo. Con `active=true`, las alertas que siguen
+    abiertas.
+    """
+    if kind is not None and kind not in ALERT_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind debe ser uno de: {', '.join(ALERT_KINDS)}")
+    limit = max(1, limit)
+    if _memory_has_all_routers():
+        # El collector corre en este proceso: los eventos están en memoria
+        if active:
+            events = anomaly_detector.active(router, kind)[:limit]
+        else:
+            since = int(time.time()) - duration_seconds(range)
+            events = anomaly_detector.events(since, router, kind, limit)
+        return {"data": [e.to_dict() for e in events], "source": "memory"}
+
+    try:
+        events = await storage.recent_alerts(range, router, kind, settings.ANOMALY_EVENTS_MAX if active else limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if active:
+        # Abiertas: el último evento de cada (router, cola, tipo) dentro del rango es un start
+        latest = {}
+        for event in events:
+            latest.setdefault((event.router_alias, event.user_name, event.kind), event)
+        events = [e for e in latest.values() if e.state == "start"][:limit]
+    return {"data": [e.to_dict() for e in events], "source": storage.name}
+
+@router.get("/router/{alias}/usage")
+async def get_router_usage(alias: str, period: str = "month", key: Optional[str] = None):
+    """
+    Consumo en bytes de todas las colas de un router en un período
+    (hour, day o month). Sin `key` se devuelve el período en curso; con
+    `key` (p. ej. 2026-10, 2026-10-17, 2026-10-17T22) uno ya cerrado.
+    """
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period debe ser uno de: {', '.join(PERIODS)}")
+    report = usage_accounting.report(alias, period, key)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Sin consumo registrado para '{alias}' ({period} {key or 'actual'})")
+    return report
 
 @router.get("/network/current_load")
 async def get_network_load():
     """Obtiene la carga total de la red actual (Suma de todos los usuarios)"""
-    query = f'''
-    from(bucket: "{influx_db.bucket}")
-      |> range(start: -5m)
-      |> filter(fn: (r) => r["_measurement"] == "mikrotik_traffic")
-      |> filter(fn: (r) => r["_field"] == "upload_bps" or r["_field"] == "download_bps")
-      |> last()
-      |> group(columns: ["_field"])
-      |> sum()
-    '''
-    
+    if _memory_is_current():
+        totals = latest_store.totals(max_age=_current_max_age())
+        return {
+            "current_load": {"upload_bps": totals["upload_bps"], "download_bps": totals["download_bps"]},
+            "source": "memory",
+        }
+
     try:
-        tables = influx_db.query_api.query(query, org=influx_db.client.org)
-        load = {"upload_bps": 0, "download_bps": 0}
-        
-        for table in tables:
-            for record in table.records:
-                field = record.get_field()
-                if field in load:
-                    load[field] = record.get_value()
-                    
-        return {"current_load": load}
+        load = await storage.current_load(carry_seconds())
+        return {"current_load": load, "source": storage.name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -21,7 +21,7 @@ router = APIRouter()
 
 
 @router.post("/verify-connection", response_model=ConnectionStatus)
-async def verify_connection(credentials: MikrotikCredentials):
+def verify_connection(credentials: MikrotikCredentials):
     """
     Verifica la conexión al RouterOS de MikroTik
 
@@ -54,7 +54,7 @@ async def verify_connection(credentials: MikrotikCredentials):
 
 
 @router.post("/queues", response_model=QueueListResponse)
-async def get_queues(credentials: MikrotikCredentials):
+def get_queues(credentials: MikrotikCredentials):
     """
     Obtiene la lista de todas las queues simples del RouterOS
 
@@ -81,7 +81,7 @@ async def get_queues(credentials: MikrotikCredentials):
 
 
 @router.post("/queues/search/{queue_name}", response_model=QueueSearchResponse)
-async def search_queue(queue_name: str, credentials: MikrotikCredentials):
+def search_queue(queue_name: str, credentials: MikrotikCredentials):
     """
     Busca una queue específica por su nombre
 
@@ -109,7 +109,7 @@ async def search_queue(queue_name: str, credentials: MikrotikCredentials):
 
 
 @router.post("/arp")
-async def get_arp_list(credentials: MikrotikCredentials):
+def get_arp_list(credentials: MikrotikCredentials):
     """
     Obtiene la lista completa de entradas ARP del RouterOS
 
@@ -137,7 +137,7 @@ async def get_arp_list(credentials: MikrotikCredentials):
 
 
 @router.post("/arp/export")
-async def export_arp_to_csv(credentials: MikrotikCredentials):
+def export_arp_to_csv(credentials: MikrotikCredentials):
     """
     Exporta la tabla ARP a formato CSV
 
@@ -174,7 +174,7 @@ async def export_arp_to_csv(credentials: MikrotikCredentials):
         )
 
 @router.post("/system/resources")
-async def get_system_resources(credentials: MikrotikCredentials):
+def get_system_resources(credentials: MikrotikCredentials):
     """
     Obtiene información de recursos del sistema (CPU, Memoria, Disco, etc)
     """
@@ -199,7 +199,7 @@ async def get_system_resources(credentials: MikrotikCredentials):
 
 
 @router.post("/interfaces")
-async def get_interfaces(credentials: MikrotikCredentials):
+def get_interfaces(credentials: MikrotikCredentials):
     """
     Obtiene estadísticas detalladas de todas las interfaces
     """
@@ -224,7 +224,7 @@ async def get_interfaces(credentials: MikrotikCredentials):
 
 
 @router.post("/dhcp/leases")
-async def get_dhcp_leases(credentials: MikrotikCredentials):
+def get_dhcp_leases(credentials: MikrotikCredentials):
     """
     Obtiene la lista de leases DHCP
     """
@@ -249,7 +249,7 @@ async def get_dhcp_leases(credentials: MikrotikCredentials):
 
 
 @router.post("/dhcp/servers")
-async def get_dhcp_servers(credentials: MikrotikCredentials):
+def get_dhcp_servers(credentials: MikrotikCredentials):
     """
     Obtiene la lista de servidores DHCP disponibles
     """
@@ -274,7 +274,7 @@ async def get_dhcp_servers(credentials: MikrotikCredentials):
 
 
 @router.post("/logs")
-async def get_logs(credentials: MikrotikCredentials):
+def get_logs(credentials: MikrotikCredentials):
     """
     Obtiene los últimos logs del router
     """
@@ -311,7 +311,7 @@ async def health_check():
 
 
 @router.post("/dhcp/bind", response_model=ProvisionResponse)
-async def bind_dhcp_lease(request: BindDhcpLeaseRequest):
+def bind_dhcp_lease(request: BindDhcpLeaseRequest):
     """
     Amarra una IP a una MAC (Static Lease)
     """
@@ -345,7 +345,7 @@ async def bind_dhcp_lease(request: BindDhcpLeaseRequest):
 
 
 @router.post("/queues/create", response_model=ProvisionResponse)
-async def create_simple_queue(request: CreateSimpleQueueRequest):
+def create_simple_queue(request: CreateSimpleQueueRequest):
     """
     Crea o actualiza una Simple Queue
     """
@@ -379,7 +379,7 @@ async def create_simple_queue(request: CreateSimpleQueueRequest):
 
 
 @router.post("/provision/simple-flow", response_model=ProvisionResponse)
-async def provision_simple_flow(request: ProvisionFlowRequest):
+def provision_simple_flow(request: ProvisionFlowRequest):
     """
     Flujo completo de provisionamiento: Amarrar IP a MAC y crear Simple Queue
 
@@ -0,0 +1,173 @@
+"""
+Benchmark del camino caliente del collector con datos sintéticos.
+
+Uso: python bench_collector.py [colas_por_router]
+"""
+import asyncio
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from influxdb_client import Point, WritePrecision
+from core.embedded_store import EmbeddedStore
+from core.line_protocol import serialize_samples
+from models.influx import InfluxPoint
+from models.mikrotik import QueueMetrics
+from services.queue_parser import parse_queue_batch
+
+
+def make_rows(count: int):
+    """Filas como las devuelve '/queue/simple/print' con el proplist del collector"""
+    return [
+        {
+            "name": f"cliente_{i}",
+            "target": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}/32",
+            "bytes": f"{i * 123456789}/{i * 987654321}",
+            "packets": f"{i * 1234}/{i * 9876}",
+            "dropped": f"{i % 7}/{i % 11}",
+            "rate": f"{i * 1000 % 50_000_000}/{i * 3000 % 200_000_000}",
+        }
+        for i in range(count)
+    ]
+
+
+def split_pair(value: str):
+    try:
+        up, down = value.split('/')
+        return int(up), int(down)
+    except (AttributeError, ValueError):
+        return 0, 0
+
+
+def parse_row(row: dict) -> QueueMetrics:
+    """Camino anterior, como referencia: una fila -> un QueueMetrics"""
+    up_bytes, down_bytes = split_pair(row.get('bytes', '0/0'))
+    up_packets, down_packets = split_pair(row.get('packets', '0/0'))
+    up_dropped, down_dropped = split_pair(row.get('dropped', '0/0'))
+    up_bps, down_bps = split_pair(row.get('rate', '0/0'))
+    target = row.get('target')
+    return QueueMetrics(
+        name=row.get('name'), target_ip=target.split('/')[0] if target else "unknown", plan_profile="unknown",
+        upload_bps=up_bps, download_bps=down_bps, upload_bytes=up_bytes, download_bytes=down_bytes,
+        packet_rate_upload=0, packet_rate_download=0,
+        dropped_packets_upload=up_dropped, dropped_packets_download=down_dropped,
+        total_packets_upload=up_packets, total_packets_download=down_packets,
+    )
+
+
+def bench(name: str, fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {name:<36} {best * 1000:9.2f} ms")
+    return best
+
+
+def bench_parser(rows):
+    print(f"\n[PARSER] {len(rows)} colas por router (mejor de 5)")
+    per_row = bench("parse_row por fila", lambda: [parse_row(r) for r in rows])
+    batch = bench("parse_queue_batch", lambda: parse_queue_batch(rows))
+    print(f"  speedup: x{per_row / batch:.1f}  |  60 routers: "
+          f"{per_row * 60:.2f}s -> {batch * 60:.2f}s")
+
+    # Mismos resultados por ambos caminos
+    cols = parse_queue_batch(rows)
+    metrics = [parse_row(r) for r in rows]
+    same = all(
+        m.upload_bytes == cols.upload_bytes[i] and m.download_bps == cols.download_bps[i]
+        and m.dropped_packets_download == cols.dropped_download[i] and m.target_ip == cols.target_ips[i]
+        for i, m in enumerate(metrics)
+    )
+    print(f"  {'PASS' if same else 'FAIL'}: resultados idénticos")
+
+
+def peak_memory(fn) -> float:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def pydantic_path(rows, timestamp):
+    """Camino anterior: dict -> QueueMetrics -> InfluxPoint -> Point"""
+    points = []
+    for r in rows:
+        q = parse_row(r)
+        points.append(InfluxPoint(
+            measurement="mikrotik_traffic",
+            tags={"user_name": q.name, "target_ip": q.target_ip,
+                  "plan_profile": q.plan_profile, "router_alias": "bench"},
+            fields={"upload_bps": q.upload_bps, "download_bps": q.download_bps,
+                    "upload_bytes": q.upload_bytes, "download_bytes": q.download_bytes,
+                    "dropped_upload": q.dropped_packets_upload,
+                    "dropped_download": q.dropped_packets_download,
+                    # Sin historial el collector usa el rate instantáneo y 0 pps
+                    "upload_avg_bps": q.upload_bps, "download_avg_bps": q.download_bps,
+                    "upload_pps": 0, "download_pps": 0},
+            time=timestamp,
+        ))
+    batch = []
+    for point in points:
+        p = Point(point.measurement)
+        for key, value in point.tags.items():
+            p.tag(key, value)
+        for key, value in point.fields.items():
+            p.field(key, value)
+        p.time(point.time)
+        batch.append(p)
+    return '\n'.join(p.to_line_protocol(WritePrecision.S) for p in batch).encode()
+
+
+def samples_path(rows, timestamp):
+    """Camino actual: dict -> QueueSamples -> line protocol"""
+    return serialize_samples(parse_queue_batch(rows, "bench", timestamp))
+
+
+def bench_pipeline(rows):
+    timestamp = datetime.utcnow()
+    print(f"\n[PIPELINE] parse + serialización de {len(rows)} colas (mejor de 5)")
+    old = bench("QueueMetrics/InfluxPoint/Point", lambda: pydantic_path(rows, timestamp))
+    new = bench("QueueSamples/serialize_samples", lambda: samples_path(rows, timestamp))
+    print(f"  speedup: x{old / new:.1f}")
+    print(f"  memoria pico: {peak_memory(lambda: pydantic_path(rows, timestamp)):.1f} MB -> "
+          f"{peak_memory(lambda: samples_path(rows, timestamp)):.1f} MB")
+    same = pydantic_path(rows, timestamp) == samples_path(rows, timestamp)
+    print(f"  {'PASS' if same else 'FAIL'}: line protocol idéntico")
+
+
+def bench_serializer(rows, routers: int = 60):
+    samples = parse_queue_batch(rows, "bench", datetime.utcnow())
+    print(f"\n[SERIALIZER] ciclo de {routers} routers x {len(rows)} colas = {routers * len(rows)} puntos")
+    bench("serialize_samples", lambda: [serialize_samples(samples) for _ in range(routers)], repeat=3)
+
+
+def bench_storage(rows, cycles: int = 12):
+    """Escritura y lectura en el almacén embebido (sin red ni InfluxDB)"""
+    print(f"\n[STORAGE] almacén embebido: {cycles} ciclos x {len(rows)} colas")
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddedStore(directory)
+        now = int(time.time())
+        start = time.perf_counter()
+        for cycle in range(cycles):
+            timestamp = datetime.utcfromtimestamp(now - (cycles - cycle) * 300)
+            asyncio.run(store.write_samples_async(parse_queue_batch(rows, "bench", timestamp)))
+        elapsed = time.perf_counter() - start
+        print(f"  {'write_samples_async por ciclo':<36} {elapsed / cycles * 1000:9.2f} ms")
+
+        async def history():
+            async for _ in store.history_stream(None, "bench", "1h", "5m", "mean"):
+                pass
+        bench("history_stream de todo el router", lambda: asyncio.run(history()), repeat=3)
+
+
+if __name__ == "__main__":
+    queues = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rows = make_rows(queues)
+    bench_parser(rows)
+    bench_pipeline(rows)
+    bench_serializer(rows)
+    bench_storage(rows)
@@ -11,15 +11,72 @@ class Settings(BaseSettings):
     # Inventory Settings
     ROUTERS_JSON_PATH: str = "routers.json"
     ROUTERS_JSON_ENV: Optional[str] = None # JSON string if config is passed via env
+    INVENTORY_POLL_SECONDS: int = 15  # Cada cuánto se revisa si cambió routers.json
     
-    # InfluxDB Settings
-    INFLUXDB_URL: str
-    INFLUXDB_TOKEN: str
-    INFLUXDB_ORG: str
+    # Storage Settings
+    STORAGE_BACKEND: str = "influxdb"  # "influxdb" o "embedded" (almacén local, sin servidor)
+    EMBEDDED_STORE_DIR: str = "data/tsdb"
+    EMBEDDED_STORE_RETENTION_DAYS: int = 30  # 0 para no borrar nunca
+    EMBEDDED_STORE_OPEN_FILES: int = 8192  # Archivos de series abiertos entre ciclos (LRU)
+
+    # InfluxDB Settings (solo obligatorios con STORAGE_BACKEND=influxdb)
+    INFLUXDB_URL: str = "http://localhost:8086"
+    INFLUXDB_TOKEN: str = ""
+    INFLUXDB_ORG: str = ""
     INFLUXDB_BUCKET: str = "mikrotik_metrics"
+    INFLUX_WRITE_QUEUE_SIZE: int = 64  # Lotes en espera antes de frenar al collector
+    INFLUX_WRITE_COALESCE: int = 10  # Lotes agrupados por request HTTP
+    INFLUX_SPILL_DIR: str = "data/spill"  # Buffer en disco si InfluxDB no responde
+    INFLUX_SPILL_MAX_BYTES: int = 512 * 1024 * 1024
+    INFLUX_SPILL_SEGMENT_BYTES: int = 8 * 1024 * 1024
+    INFLUX_SPILL_REPLAY_SECONDS: int = 10
+    HISTORY_CACHE_TTL_SECONDS: int = 60  # 0 desactiva la caché de historial
+    HISTORY_CACHE_MAX_ENTRIES: int = 1024
+    INFLUX_ROLLUP_TIERS: str = "1h,1d"  # Tareas de downsampling; vacío para no crearlas
+    INFLUX_ROLLUP_RETRY_SECONDS: int = 60
     
     # Collector Settings
     COLLECTOR_INTERVAL_SECONDS: int = 300  # 5 minutes
+    COLLECTOR_WRITE_CHUNK_SIZE: int = 1000  # Puntos por escritura mientras se hace streaming
+    COLLECTOR_DELTA_ENABLED: bool = True  # Escribir solo las colas cuyos contadores cambiaron
+    COLLECTOR_KEYFRAME_CYCLES: int = 12  # Cada cuántos ciclos se escriben todas las colas
+    COLLECTOR_MAX_CONCURRENT_ROUTERS: int = 32  # Routers recolectando a la vez
+    TOP_TALKERS_SIZE: int = 50  # Colas que se guardan en cada top (por router y global)
+    COLLECTOR_SHARD_COUNT: int = 1
+    COLLECTOR_SHARD_ID: Optional[int] = None  # Sin definir: se reclama el primer shard libre
+    COLLECTOR_LEASE_DIR: str = "data/leases"  # Vacío para desactivar los leases por router
+    COLLECTOR_MODE: str = "inline"  # "inline" (en el proceso de la API) o "process" (pipeline multiproceso)
+    COLLECTOR_IO_WORKERS: int = 1
+    COLLECTOR_CPU_WORKERS: int = 2
+    COLLECTOR_PIPELINE_QUEUE_SIZE: int = 64  # Lotes en vuelo entre etapas
+    COLLECTOR_PIPELINE_STOP_TIMEOUT: int = 30
+
+    # Usage Accounting
+    USAGE_DIR: str = "data/usage"  # Totales por hora/día/mes de cada cola
+    USAGE_TIMEZONE: str = "UTC"  # Zona horaria en la que se cortan los días y meses
+
+    # Anomaly Detection
+    ANOMALY_DETECTION_ENABLED: bool = True
+    ANOMALY_EWMA_ALPHA: float = 0.3  # Peso de la última muestra en los promedios móviles
+    ANOMALY_SATURATION_RATIO: float = 0.9  # Uso promedio / max-limit que abre una alerta
+    ANOMALY_SATURATION_CLEAR_RATIO: float = 0.75  # Y por debajo del cual se cierra
+    ANOMALY_DROP_MIN_PPS: float = 10.0  # Descartes por segundo mínimos para alertar
+    ANOMALY_DROP_ZSCORE: float = 3.0  # Desvíos sobre el promedio móvil de descartes
+    ANOMALY_EVENTS_MAX: int = 1000  # Eventos recientes que se guardan en memoria
+
+    # RouterOS Connection Pool
+    ROUTEROS_POOL_MAX_PER_ROUTER: int = 4
+    ROUTEROS_POOL_IDLE_SECONDS: int = 300
+    ROUTEROS_POOL_HEALTHCHECK_SECONDS: int = 30  # Validar conexiones ociosas más viejas que esto
+    ROUTEROS_POOL_ACQUIRE_TIMEOUT: int = 15
+    ROUTEROS_CONNECT_TIMEOUT: int = 10  # TCP/TLS + login (por defecto; RouterConfig puede cambiarlo)
+    ROUTEROS_READ_TIMEOUT: int = 30  # Máximo silencio del router en medio de una respuesta
+    ROUTEROS_MAX_PENDING_SENTENCES: int = 50000  # Filas sin consumir por orden antes de cancelarla
+
+    # Circuit breaker por router
+    ROUTER_BREAKER_FAILURES: int = 3  # Fallos seguidos para abrir el circuito
+    ROUTER_BREAKER_BACKOFF_SECONDS: int = 60  # Primera espera con el circuito abierto
+    ROUTER_BREAKER_MAX_BACKOFF_SECONDS: int = 3600
 
     # Security Settings
     SECURITY_TOKEN: Optional[str] = None
@@ -1,50 +1,323 @@
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+from influxdb_client import InfluxDBClient, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
 from core.config import settings
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import logging
+import textwrap
 import time
-from models.influx import InfluxPoint
+from models.alerts import AlertEvent
+from models.samples import QueueSamples
+from core.line_protocol import serialize_samples, TRAFFIC_MEASUREMENT, ALERT_MEASUREMENT
+from core.spill_buffer import SpillBuffer
+from core.storage import StorageBackend, SeriesPoint, OnWritten, HISTORY_FIELDS, iterate_in_thread
+from services.counter_index import carry_seconds
+from services.rollups import rollup_manager, gap_fill_flux, duration_seconds
+from services.sharding import shard_assignment
+
+logger = logging.getLogger(__name__)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Errores de escritura que vale la pena reintentar: red, 5xx y 429. Un 4xx
+    (line protocol inválido, 422 por retención, permisos) fallaría igual.
+    """
+    status = getattr(error, 'status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status', None)  # InfluxDBError
+    if not isinstance(status, int):
+        return True
+    return status == 429 or status >= 500
+
+
+def flux_string(value: str) -> str:
+    """
+    Literal de string Flux. Se escapan `\\`, `"` y `${` (interpolación en
+    Flux). El resto, incluido UTF-8, va tal cual: Flux no tiene escapes `\\uXXXX`.
+    """
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('${', '\\${')
+    return f'"{escaped}"'
+
+
+class InfluxClient(StorageBackend):
+    name = "influxdb"
 
-class InfluxClient:
     def __init__(self):
         self.client = InfluxDBClient(
             url=settings.INFLUXDB_URL,
             token=settings.INFLUXDB_TOKEN,
             org=settings.INFLUXDB_ORG
         )
-        self.write_api = self.client.write_api(write_options=WriteOptions(batch_size=500, flush_interval=10_000))
+        self._spill: Optional[SpillBuffer] = None
+        # Escritura síncrona para el writer del collector: corre en un hilo, nunca en el event loop
+        self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
         self.query_api = self.client.query_api()
         self.bucket = settings.INFLUXDB_BUCKET
 
-    def write_point(self, point: InfluxPoint):
-        """Escribe un solo punto"""
-        p = Point(point.measurement)
-        for key, value in point.tags.items():
-            p.tag(key, value)
-        for key, value in point.fields.items():
-            p.field(key, value)
-        if point.time:
-            p.time(point.time)
-            
-        self.write_api.write(bucket=self.bucket, org=settings.INFLUXDB_ORG, record=p)
-
-    def write_batch(self, points: List[InfluxPoint]):
-        """Escribe un lote de puntos"""
-        batch = []
-        for point in points:
-            p = Point(point.measurement)
-            for key, value in point.tags.items():
-                p.tag(key, value)
-            for key, value in point.fields.items():
-                p.field(key, value)
-            if point.time:
-                p.time(point.time)
-            batch.append(p)
-        
-        self.write_api.write(bucket=self.bucket, org=settings.INFLUXDB_ORG, record=batch)
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+
+    @property
+    def spill(self) -> SpillBuffer:
+        """Buffer en disco; se abre al primer uso, en el directorio del shard reclamado"""
+        if self._spill is None:
+            self._spill = SpillBuffer(
+                shard_assignment.state_dir(settings.INFLUX_SPILL_DIR),
+                max_bytes=settings.INFLUX_SPILL_MAX_BYTES,
+                segment_bytes=settings.INFLUX_SPILL_SEGMENT_BYTES,
+            )
+        return self._spill
+
+    # --- Camino asíncrono ---
+
+    async def start_writer(self):
+        """Arranca la tarea que vacía la cola de escritura hacia InfluxDB"""
+        if self._writer_task:
+            return
+        self._write_queue = asyncio.Queue(maxsize=settings.INFLUX_WRITE_QUEUE_SIZE)
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        self._replay_task = asyncio.create_task(self._replay_loop())
+
+    async def stop_writer(self):
+        """Escribe lo pendiente y detiene la tarea"""
+        if not self._writer_task:
+            return
+        await self._write_queue.join()
+        for task in (self._writer_task, self._replay_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._writer_task = None
+        self._replay_task = None
+        self._write_queue = None
+
+    async def write_samples_async(self, samples: QueueSamples, on_written: OnWritten = None):
+        """
+        Serializa el lote y lo encola para el writer.
+
+        Si la cola está llena espera (backpressure) en lugar de acumular en memoria.
+        `on_written` lo llama el writer después de entregar el lote, no al encolarlo.
+        """
+        await self.write_payload_async(serialize_samples(samples), on_written)
+
+    async def write_payload_async(self, payload: bytes, on_written: OnWritten = None):
+        """Encola line protocol ya serializado (precisión en segundos)"""
+        if not payload:
+            return
+        if self._write_queue is None:
+            await asyncio.to_thread(self._deliver, payload)
+            if on_written:
+                on_written()
+            return
+        await self._write_queue.put((payload, on_written))
+
+    async def _writer_loop(self):
+        queue = self._write_queue
+        while True:
+            items = [await queue.get()]
+            # Agrupar lo que ya esté en cola para hacer menos requests HTTP
+            while len(items) < settings.INFLUX_WRITE_COALESCE and not queue.empty():
+                items.append(queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._deliver, b'\n'.join(payload for payload, _ in items))
+            except Exception as e:
+                logger.error(f"Error escribiendo {len(items)} lotes en InfluxDB: {e}")
+            finally:
+                for _, on_written in items:
+                    if on_written:
+                        on_written()
+                    queue.task_done()
+
+    def _deliver(self, payload: bytes, precision: str = WritePrecision.S):
+        """Escribe en InfluxDB o, si no se puede, al buffer en disco"""
+        if self.spill:
+            # Hay atraso pendiente: se encola detrás para respetar el orden
+            self.spill.append(payload, precision)
+            return
+        try:
+            self._write_payload(payload, precision)
+        except Exception as e:
+            if not is_retryable(e):
+                self.spill.quarantine(payload, str(e))
+                return
+            logger.error(f"InfluxDB no disponible, lote enviado al buffer en disco: {e}")
+            self.spill.append(payload, precision)
+
+    def _write_payload(self, payload: bytes, precision: str = WritePrecision.S):
+        self.write_api.write(
+            bucket=self.bucket, org=settings.INFLUXDB_ORG,
+            record=payload, write_precision=precision
+        )
+
+    async def _replay_loop(self):
+        """Reinyecta el buffer en disco, un lote a la vez, cuando InfluxDB vuelve"""
+        while True:
+            await asyncio.sleep(settings.INFLUX_SPILL_REPLAY_SECONDS)
+            if not self.spill or not await self.check_health_async():
+                continue
+            replayed = 0
+            while True:
+                record = await asyncio.to_thread(self.spill.peek)
+                if record is None:
+                    break
+                seq, next_offset, payload, precision = record
+                try:
+                    # Cada lote espera la confirmación del anterior (backpressure)
+                    await asyncio.to_thread(self._write_payload, payload, precision)
+                    replayed += 1
+                except Exception as e:
+                    if is_retryable(e):
+                        logger.error(f"Reinyección interrumpida, se reintenta luego: {e}")
+                        break
+                    # Rechazo permanente: se aparta para no bloquear el resto del buffer
+                    await asyncio.to_thread(self.spill.quarantine, payload, str(e))
+                self.spill.ack(seq, next_offset)
+            if replayed:
+                logger.info(f"Reinyectados {replayed} lotes desde el buffer en disco")
+
+    def buffer_stats(self) -> dict:
+        """Profundidad de la cola en memoria y del buffer en disco"""
+        stats = self.spill.stats()
+        stats["queued_batches"] = self._write_queue.qsize() if self._write_queue else 0
+        return stats
+
+    async def query_async(self, query: str):
+        """Ejecuta una consulta Flux fuera del event loop"""
+        return await asyncio.to_thread(self.query_api.query, query, org=self.client.org)
+
+    async def query_stream_async(self, query: str, chunk_size: int = 1000) -> AsyncIterator[list]:
+        """
+        Ejecuta una consulta Flux y entrega los registros en tandas a medida
+        que se decodifican, sin armar la respuesta completa en memoria.
+        """
+        records = await asyncio.to_thread(self.query_api.query_stream, query, org=self.client.org)
+        # Cerrar el generador cierra la respuesta HTTP aunque el cliente se haya ido
+        async for chunk in iterate_in_thread(records, chunk_size, close=records.close):
+            yield chunk
+
+    # --- Consultas de /metrics ---
+
+    def history_tier(self, every: str, fn: str, range: str) -> str:
+        return rollup_manager.select(every, fn, range)[1] or "raw"
+
+    async def history_stream(
+        self, usernames: Optional[List[str]], router_alias: Optional[str],
+        range: str, every: str, fn: str,
+    ) -> AsyncIterator[List[SeriesPoint]]:
+        conditions = []
+        if usernames:
+            if len(usernames) == 1:
+                conditions.append(f'r["user_name"] == {flux_string(usernames[0])}')
+            else:
+                names = ", ".join(flux_string(name) for name in usernames)
+                conditions.append(f'contains(value: r["user_name"], set: [{names}])')
+        if router_alias:
+            conditions.append(f'r["router_alias"] == {flux_string(router_alias)}')
+        fields = " or ".join(f'r["_field"] == "{f}"' for f in HISTORY_FIELDS)
+
+        measurement, tier = rollup_manager.select(every, fn, range)
+        start = f"-{range}"
+        fill = ""
+        if tier is None and settings.COLLECTOR_DELTA_ENABLED:
+            # Datos crudos con huecos de la escritura delta: se lee también el punto anterior al rango
+            start = f"-{range}{carry_seconds()}s"
+            step = min(duration_seconds(every), settings.COLLECTOR_INTERVAL_SECONDS)
+            fill = textwrap.indent(gap_fill_flux(step, f"-{range}"), " " * 8)
+        query = f'''
+        from(bucket: "{self.bucket}")
+          |> range(start: {start})
+          |> filter(fn: (r) => r["_measurement"] == "{measurement}")
+          |> filter(fn: (r) => {" and ".join(conditions)})
+          |> filter(fn: (r) => {fields}){fill}
+          |> group(columns: ["router_alias", "user_name", "_field"])
+          |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)
+        '''
+        async for records in self.query_stream_async(query):
+            yield [
+                SeriesPoint(
+                    r.table, r.values.get("user_name"), r.values.get("router_alias"),
+                    r.get_field(), r.get_time(), r.get_value(),
+                )
+                for r in records
+            ]
+
+    async def latest_values(self, username: str, max_age: int) -> List[Dict[str, Any]]:
+        query = f'''
+        from(bucket: "{self.bucket}")
+          |> range(start: -{max_age}s)
+          |> filter(fn: (r) => r["_measurement"] == "{TRAFFIC_MEASUREMENT}")
+          |> filter(fn: (r) => r["user_name"] == {flux_string(username)})
+          |> last()
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        '''
+        tables = await self.query_async(query)
+        queues = []
+        for table in tables:
+            for record in table.records:
+                data = {k: v for k, v in record.values.items() if not k.startswith('_') and k not in ("result", "table")}
+                data["name"] = data.pop("user_name", username)
+                data["timestamp"] = record.get_time()
+                queues.append(data)
+        return queues
+
+    async def current_load(self, max_age: int) -> Dict[str, Any]:
+        query = f'''
+        from(bucket: "{self.bucket}")
+          |> range(start: -{max_age}s)
+          |> filter(fn: (r) => r["_measurement"] == "{TRAFFIC_MEASUREMENT}")
+          |> filter(fn: (r) => r["_field"] == "upload_bps" or r["_field"] == "download_bps")
+          |> last()
+          |> group(columns: ["_field"])
+          |> sum()
+        '''
+        tables = await self.query_async(query)
+        load = {"upload_bps": 0, "download_bps": 0}
+        for table in tables:
+            for record in table.records:
+                field = record.get_field()
+                if field in load:
+                    load[field] = record.get_value()
+        return load
+
+    async def recent_alerts(
+        self, range: str, router_alias: Optional[str], kind: Optional[str], limit: int,
+    ) -> List[AlertEvent]:
+        conditions = [f'r["_measurement"] == "{ALERT_MEASUREMENT}"']
+        if router_alias:
+            conditions.append(f'r["router_alias"] == {flux_string(router_alias)}')
+        if kind:
+            conditions.append(f'r["kind"] == {flux_string(kind)}')
+        query = f'''
+        from(bucket: "{self.bucket}")
+          |> range(start: -{range})
+          |> filter(fn: (r) => {" and ".join(conditions)})
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> group()
+          |> sort(columns: ["_time"], desc: true)
+          |> limit(n: {int(limit)})
+        '''
+        tables = await self.query_async(query)
+        return [
+            AlertEvent(
+                int(record.get_time().timestamp()), record.values.get("router_alias"),
+                record.values.get("user_name"), record.values.get("kind"), record.values.get("state"),
+                record.values.get("value") or 0, record.values.get("limit") or 0,
+            )
+            for table in tables for record in table.records
+        ]
+
+    async def check_health_async(self) -> bool:
+        return await asyncio.to_thread(self.check_health)
 
     def close(self):
+        self.write_api.close()
         self.client.close()
+        if self._spill is not None:
+            self._spill.close()
 
     def check_health(self) -> bool:
         try:
@@ -52,5 +325,20 @@ class InfluxClient:
         except:
             return False
 
+
+def create_storage() -> StorageBackend:
+    """Backend según STORAGE_BACKEND; el cliente de InfluxDB solo se crea si se usa"""
+    if settings.STORAGE_BACKEND == "embedded":
+        if settings.COLLECTOR_SHARD_COUNT > 1:
+            # Cada shard tendría su propio almacén y las consultas no verían los routers de los demás
+            raise ValueError("STORAGE_BACKEND=embedded no admite COLLECTOR_SHARD_COUNT > 1: usar InfluxDB")
+        from core.embedded_store import EmbeddedStore
+        return EmbeddedStore(settings.EMBEDDED_STORE_DIR)
+    if settings.STORAGE_BACKEND != "influxdb":
+        raise ValueError(f"STORAGE_BACKEND desconocido: '{settings.STORAGE_BACKEND}'")
+    if not settings.INFLUXDB_TOKEN or not settings.INFLUXDB_ORG:
+        raise ValueError("INFLUXDB_TOKEN e INFLUXDB_ORG son obligatorios con STORAGE_BACKEND=influxdb")
+    return InfluxClient()
+
 # Global instance
-influx_db = InfluxClient()
+storage = create_storage()
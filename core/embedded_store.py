@@ -0,0 +1,543 @@
+"""
+Almacén embebido de series de tiempo (STORAGE_BACKEND=embedded).
+
+Guarda `mikrotik_traffic` en disco local, sin servidor:
+
+    <dir>/series.jsonl       una línea por serie: id, router_alias, user_name, target_ip, plan_profile
+    <dir>/series/<id>.bin    registros fijos de 11 int64: timestamp (s) + TRAFFIC_FIELDS
+    <dir>/alerts.jsonl       eventos de `mikrotik_alerts`, uno por línea
+
+Cada serie (router, usuario) es un archivo append-only ordenado por tiempo.
+Para leer se mapea con mmap y se ubica el inicio del rango con búsqueda
+binaria sobre la columna de tiempo; las ventanas de agregación se calculan
+al leer, alineadas a epoch igual que `aggregateWindow`. Con escritura delta,
+los huecos se completan antes de agregar igual que en InfluxDB
+(`services/rollups.py`).
+
+Un punto con el mismo timestamp que el último reemplaza al anterior (como
+en InfluxDB); uno más viejo se descarta y se cuenta en `out_of_order`. Los
+registros más viejos que EMBEDDED_STORE_RETENTION_DAYS se compactan una
+vez por hora.
+
+Los archivos de las series que se escriben quedan abiertos entre ciclos, en
+un LRU de hasta EMBEDDED_STORE_OPEN_FILES descriptores: un ciclo con miles
+de colas no abre y cierra un archivo por cola. Si hace falta se sube el
+límite de descriptores del proceso (RLIMIT_NOFILE) hasta el máximo
+permitido; si aun así no alcanza, el LRU se achica.
+
+El índice de series se relee si creció, así el proceso de la API ve las
+series que crea el writer del collector multiproceso.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import resource
+import statistics
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from core.config import settings
+from core.line_protocol import TRAFFIC_MEASUREMENT, ALERT_MEASUREMENT, to_epoch_seconds
+from core.storage import StorageBackend, SeriesPoint, OnWritten, TRAFFIC_FIELDS, HISTORY_FIELDS, iterate_in_thread
+from models.alerts import AlertEvent
+from models.samples import QueueSamples
+from services.counter_index import carry_seconds
+from services.rollups import duration_seconds
+
+logger = logging.getLogger(__name__)
+
+WIDTH = 1 + len(TRAFFIC_FIELDS)
+RECORD = struct.Struct(f'<{WIDTH}q')
+_COLUMN = {field: 1 + i for i, field in enumerate(TRAFFIC_FIELDS)}
+
+# Descriptores que se dejan para sockets, logs y el resto del proceso
+_FD_RESERVE = 256
+
+_AGGREGATES = {
+    "mean": lambda values: sum(values) / len(values),
+    "median": statistics.median,
+    "max": max,
+    "min": min,
+    "sum": sum,
+    "last": lambda values: values[-1],
+}
+
+# Line protocol propio (core/line_protocol.py): separadores sin escapar
+_SPLIT_SPACE = re.compile(r'(?<!\\) ')
+_SPLIT_COMMA = re.compile(r'(?<!\\),')
+_SPLIT_EQUAL = re.compile(r'(?<!\\)=')
+_UNESCAPE = re.compile(r'\\([,= ])')
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, str], Dict[str, int], Optional[int]]:
+    """(measurement, tags, campos, timestamp) de una línea con campos enteros"""
+    parts = _SPLIT_SPACE.split(line)
+    key, fields = parts[0], parts[1]
+    measurement, *pairs = _SPLIT_COMMA.split(key)
+    tags = {}
+    for pair in pairs:
+        name, value = _SPLIT_EQUAL.split(pair, 1)
+        tags[name] = _UNESCAPE.sub(r'\1', value)
+    values = {}
+    for pair in fields.split(','):
+        name, value = pair.split('=', 1)
+        values[name] = int(value.rstrip('i'))
+    return measurement, tags, values, int(parts[2]) if len(parts) > 2 else None
+
+
+class _TimeColumn:
+    """Vista de la columna de tiempo para `bisect`"""
+
+    def __init__(self, view: memoryview, count: int):
+        self.view = view
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> int:
+        return self.view[i * WIDTH]
+
+
+def _open_files_limit(wanted: int) -> int:
+    """Tamaño del LRU de archivos abiertos que permite RLIMIT_NOFILE"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = wanted + _FD_RESERVE
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError) as e:
+            logger.warning(f"No se pudo subir el límite de archivos abiertos a {target}: {e}")
+    if soft == resource.RLIM_INFINITY:
+        return wanted
+    return max(1, min(wanted, soft - _FD_RESERVE))
+
+
+def _filled(
+    view: memoryview, first: int, count: int, column: int,
+    step: int, carry: int, start: int, end: int,
+) -> Iterator[Tuple[int, int]]:
+    """
+    (inicio, valor) de cada slot de `step` segundos entre `start` y `end`:
+    el último punto del slot o, si no hubo, el último escrito mientras no
+    tenga más de `carry` segundos. Igual que `gap_fill_flux` en InfluxDB.
+    """
+    written = value = None
+    i = first
+    slot = view[first * WIDTH] // step
+    last_slot = end // step
+    while slot <= last_slot:
+        while i < count and view[i * WIDTH] // step == slot:
+            written = view[i * WIDTH]
+            value = view[i * WIDTH + column]
+            i += 1
+        slot_start = slot * step
+        if slot_start >= start and slot_start - written <= carry:
+            yield slot_start, value
+        slot += 1
+        if slot * step - written > carry:
+            # Sin valor vigente: se salta al slot del próximo punto
+            if i == count:
+                return
+            slot = view[i * WIDTH] // step
+
+
+class _Series:
+    __slots__ = ('id', 'router_alias', 'user_name', 'target_ip', 'plan_profile', 'path', 'last_time')
+
+    def __init__(self, id: int, router_alias: str, user_name: str, target_ip: str, plan_profile: str, path: str):
+        self.id = id
+        self.router_alias = router_alias
+        self.user_name = user_name
+        self.target_ip = target_ip
+        self.plan_profile = plan_profile
+        self.path = path
+        self.last_time: Optional[int] = None  # Se lee del archivo al primer append
+
+    def read_last(self) -> Optional[Tuple[int, ...]]:
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                size -= size % RECORD.size
+                if not size:
+                    return None
+                return RECORD.unpack(os.pread(f.fileno(), RECORD.size, size - RECORD.size))
+        except FileNotFoundError:
+            return None
+
+
+class _MappedFile:
+    """Archivo de una serie mapeado en memoria como columna de int64"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.view = None
+
+    def __enter__(self) -> Tuple[Optional[memoryview], int]:
+        try:
+            self.file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None, 0
+        size = os.fstat(self.file.fileno()).st_size
+        size -= size % RECORD.size
+        if not size:
+            return None, 0
+        self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map).cast('q')
+        return self.view, size // RECORD.size
+
+    def __exit__(self, *exc):
+        if self.view is not None:
+            self.view.release()
+        if self.map is not None:
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+
+
+class EmbeddedStore(StorageBackend):
+    name = "embedded"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.series_dir = os.path.join(directory, "series")
+        self.index_path = os.path.join(directory, "series.jsonl")
+        self.alerts_path = os.path.join(directory, "alerts.jsonl")
+        os.makedirs(self.series_dir, exist_ok=True)
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._by_user: Dict[str, List[_Series]] = {}
+        self._by_router: Dict[str, List[_Series]] = {}
+        self._index_offset = 0
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[int, int]" = OrderedDict()  # id de serie -> fd abierto para escribir
+        self.max_open_files = _open_files_limit(settings.EMBEDDED_STORE_OPEN_FILES)
+        self._compact_task: Optional[asyncio.Task] = None
+        self.out_of_order = 0
+        self._refresh_index()
+
+    # --- Índice de series ---
+
+    def _refresh_index(self):
+        """Incorpora las series agregadas al índice desde la última lectura"""
+        try:
+            if os.path.getsize(self.index_path) <= self._index_offset:
+                return
+        except FileNotFoundError:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        complete = data.rfind(b'\n') + 1  # Una línea a medio escribir se lee la próxima vez
+        for line in data[:complete].splitlines():
+            item = json.loads(line)
+            if (item["router_alias"], item["user_name"]) not in self._series:
+                self._register(_Series(
+                    item["id"], item["router_alias"], item["user_name"],
+                    item["target_ip"], item["plan_profile"],
+                    os.path.join(self.series_dir, f"{item['id']}.bin"),
+                ))
+        self._index_offset += complete
+
+    def _register(self, series: _Series):
+        self._series[(series.router_alias, series.user_name)] = series
+        self._by_user.setdefault(series.user_name, []).append(series)
+        self._by_router.setdefault(series.router_alias, []).append(series)
+
+    def _series_for(self, router_alias: str, user_name: str, target_ip: str, plan_profile: str) -> _Series:
+        series = self._series.get((router_alias, user_name))
+        if series is None:
+            self._refresh_index()
+            series = self._series.get((router_alias, user_name))
+        if series is None:
+            series_id = len(self._series)
+            series = _Series(
+                series_id, router_alias, user_name, target_ip, plan_profile,
+                os.path.join(self.series_dir, f"{series_id}.bin"),
+            )
+            item = {
+                "id": series_id, "router_alias": router_alias, "user_name": user_name,
+                "target_ip": target_ip, "plan_profile": plan_profile,
+            }
+            with open(self.index_path, 'ab') as f:
+                f.write(json.dumps(item).encode() + b'\n')
+            self._index_offset = os.path.getsize(self.index_path)
+            self._register(series)
+        return series
+
+    # --- Escritura ---
+
+    def _append(self, series: _Series, timestamp: int, values: Tuple[int, ...]):
+        if series.last_time is None:
+            last = series.read_last()
+            series.last_time = last[0] if last else -1
+        if timestamp < series.last_time:
+            self.out_of_order += 1
+            return
+        record = RECORD.pack(timestamp, *values)
+        fd, end = self._open_for_append(series)
+        end -= end % RECORD.size  # Un registro truncado (corte de luz) se pisa
+        if timestamp == series.last_time and end:
+            end -= RECORD.size  # Mismo timestamp: reemplaza el último punto
+        os.pwrite(fd, record, end)
+        os.ftruncate(fd, end + RECORD.size)
+        series.last_time = timestamp
+
+    def _open_for_append(self, series: _Series) -> Tuple[int, int]:
+        """Descriptor del archivo de la serie (del LRU o recién abierto) y su tamaño"""
+        fd = self._files.get(series.id)
+        if fd is not None:
+            stat = os.fstat(fd)
+            if stat.st_nlink:
+                self._files.move_to_end(series.id)
+                return fd, stat.st_size
+            # Otro proceso reemplazó el archivo (compactación): se reabre
+            self._close_file(series.id)
+        fd = os.open(series.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._files[series.id] = fd
+        while len(self._files) > self.max_open_files:
+            os.close(self._files.popitem(last=False)[1])
+        return fd, os.fstat(fd).st_size
+
+    def _close_file(self, series_id: int):
+        fd = self._files.pop(series_id, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _write_samples(self, samples: QueueSamples, plan_profile: str = "unknown"):
+        timestamp = to_epoch_seconds(samples.timestamp or datetime.utcnow())
+        columns = [getattr(samples, field) for field in TRAFFIC_FIELDS]
+        with self._lock:
+            for row, (name, ip) in enumerate(zip(samples.names, samples.target_ips)):
+                series = self._series_for(samples.router_alias, name, ip, plan_profile)
+                self._append(series, timestamp, tuple(column[row] for column in columns))
+
+    def _write_payload(self, payload: bytes):
+        now = int(time.time())
+        alerts = []
+        with self._lock:
+            for line in payload.decode('utf-8').splitlines():
+                if not line:
+                    continue
+                measurement, tags, values, timestamp = parse_line(line)
+                if measurement == ALERT_MEASUREMENT:
+                    alerts.append(AlertEvent(
+                        timestamp or now, tags.get("router_alias", ""), tags.get("user_name", ""),
+                        tags.get("kind", ""), tags.get("state", ""), values.get("value", 0), values.get("limit", 0),
+                    ))
+                    continue
+                if measurement != TRAFFIC_MEASUREMENT:
+                    continue
+                series = self._series_for(
+                    tags.get("router_alias", ""), tags.get("user_name", ""),
+                    tags.get("target_ip", ""), tags.get("plan_profile", "unknown"),
+                )
+                self._append(series, timestamp or now, tuple(values.get(field, 0) for field in TRAFFIC_FIELDS))
+            if alerts:
+                with open(self.alerts_path, 'ab') as f:
+                    f.write(b''.join(json.dumps(list(event)).encode() + b'\n' for event in alerts))
+
+    async def write_samples_async(self, samples: QueueSamples, on_written: OnWritten = None):
+        if len(samples):
+            await asyncio.to_thread(self._write_samples, samples)
+            if on_written:
+                on_written()
+
+    async def write_payload_async(self, payload: bytes):
+        if payload:
+            await asyncio.to_thread(self._write_payload, payload)
+
+    async def start_writer(self):
+        if not self._compact_task:
+            self._compact_task = asyncio.create_task(self._compact_loop())
+
+    async def stop_writer(self):
+        if self._compact_task:
+            self._compact_task.cancel()
+            try:
+                await self._compact_task
+            except asyncio.CancelledError:
+                pass
+            self._compact_task = None
+
+    # --- Retención ---
+
+    async def _compact_loop(self):
+        while True:
+            try:
+                dropped = await asyncio.to_thread(self.compact, settings.EMBEDDED_STORE_RETENTION_DAYS * 86400)
+                if dropped:
+                    logger.info(f"Almacén embebido: {dropped} registros fuera de retención eliminados")
+            except Exception as e:
+                logger.error(f"Error compactando el almacén embebido: {e}")
+            await asyncio.sleep(3600)
+
+    def compact(self, retention_seconds: int) -> int:
+        """Reescribe las series que tienen registros más viejos que la retención"""
+        if retention_seconds <= 0:
+            return 0
+        cutoff = int(time.time()) - retention_seconds
+        dropped = 0
+        for series in list(self._series.values()):
+            with self._lock:
+                with _MappedFile(series.path) as (view, count):
+                    if not count:
+                        continue
+                    start = bisect.bisect_left(_TimeColumn(view, count), cutoff)
+                    if not start:
+                        continue
+                    tail = view[start * WIDTH:count * WIDTH].tobytes()
+                    view.release()
+                temp = f"{series.path}.tmp"
+                with open(temp, 'wb') as f:
+                    f.write(tail)
+                # Los lectores con el archivo viejo mapeado lo siguen viendo completo
+                os.replace(temp, series.path)
+                self._close_file(series.id)
+                dropped += start
+        with self._lock:
+            dropped += self._compact_alerts(cutoff)
+        return dropped
+
+    def _compact_alerts(self, cutoff: int) -> int:
+        events = self._read_alerts()
+        keep = [event for event in events if event.time >= cutoff]
+        if len(keep) == len(events):
+            return 0
+        temp = f"{self.alerts_path}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(b''.join(json.dumps(list(event)).encode() + b'\n' for event in keep))
+        os.replace(temp, self.alerts_path)
+        return len(events) - len(keep)
+
+    # --- Lectura ---
+
+    def _select(self, usernames: Optional[List[str]], router_alias: Optional[str]) -> List[_Series]:
+        self._refresh_index()
+        if usernames:
+            selected = [s for name in usernames for s in self._by_user.get(name, ())]
+            if router_alias:
+                selected = [s for s in selected if s.router_alias == router_alias]
+        else:
+            selected = list(self._by_router.get(router_alias, ()))
+        return sorted(selected, key=lambda s: (s.router_alias, s.user_name))
+
+    def _history(self, selected: List[_Series], start: int, every: int, fn: str) -> Iterator[SeriesPoint]:
+        aggregate = _AGGREGATES[fn]
+        # Escritura delta: los huecos se completan como en InfluxDB (`gap_fill_flux`)
+        step = min(every, settings.COLLECTOR_INTERVAL_SECONDS) if settings.COLLECTOR_DELTA_ENABLED else None
+        carry = carry_seconds()
+        end = int(time.time())
+        table = 0
+        for series in selected:
+            with _MappedFile(series.path) as (view, count):
+                if not count:
+                    continue
+                first = bisect.bisect_left(_TimeColumn(view, count), start - carry if step else start)
+                if first == count:
+                    continue
+                for field in HISTORY_FIELDS:
+                    column = _COLUMN[field]
+                    if step:
+                        points = _filled(view, first, count, column, step, carry, start, end)
+                    else:
+                        points = ((view[i * WIDTH], view[i * WIDTH + column]) for i in range(first, count))
+                    window = None
+                    values = []
+                    for timestamp, value in points:
+                        current = timestamp // every
+                        if current != window:
+                            if values:
+                                stop = datetime.fromtimestamp((window + 1) * every, tz=timezone.utc)
+                                yield SeriesPoint(table, series.user_name, series.router_alias, field, stop, aggregate(values))
+                            window = current
+                            values = []
+                        values.append(value)
+                    if values:
+                        stop = datetime.fromtimestamp((window + 1) * every, tz=timezone.utc)
+                        yield SeriesPoint(table, series.user_name, series.router_alias, field, stop, aggregate(values))
+                    table += 1
+
+    async def history_stream(
+        self, usernames: Optional[List[str]], router_alias: Optional[str],
+        range: str, every: str, fn: str,
+    ) -> AsyncIterator[List[SeriesPoint]]:
+        selected = self._select(usernames, router_alias)
+        start = int(time.time()) - duration_seconds(range)
+        points = self._history(selected, start, duration_seconds(every), fn)
+        async for chunk in iterate_in_thread(points, close=points.close):
+            yield chunk
+
+    def _latest(self, selected: List[_Series], max_age: int) -> List[Tuple[_Series, Tuple[int, ...]]]:
+        cutoff = int(time.time()) - max_age
+        found = []
+        for series in selected:
+            last = series.read_last()
+            if last is not None and last[0] >= cutoff:
+                found.append((series, last))
+        return found
+
+    async def latest_values(self, username: str, max_age: int) -> List[Dict[str, Any]]:
+        found = await asyncio.to_thread(self._latest, self._select([username], None), max_age)
+        queues = []
+        for series, last in found:
+            data = {
+                "name": series.user_name, "router_alias": series.router_alias,
+                "target_ip": series.target_ip, "plan_profile": series.plan_profile,
+                "timestamp": datetime.fromtimestamp(last[0], tz=timezone.utc),
+            }
+            data.update(zip(TRAFFIC_FIELDS, last[1:]))
+            queues.append(data)
+        return queues
+
+    async def current_load(self, max_age: int) -> Dict[str, Any]:
+        self._refresh_index()
+        found = await asyncio.to_thread(self._latest, list(self._series.values()), max_age)
+        return {
+            "upload_bps": sum(last[_COLUMN["upload_bps"]] for _, last in found),
+            "download_bps": sum(last[_COLUMN["download_bps"]] for _, last in found),
+        }
+
+    def _read_alerts(self) -> List[AlertEvent]:
+        try:
+            with open(self.alerts_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        complete = data.rfind(b'\n') + 1
+        return [AlertEvent(*json.loads(line)) for line in data[:complete].splitlines()]
+
+    async def recent_alerts(
+        self, range: str, router_alias: Optional[str], kind: Optional[str], limit: int,
+    ) -> List[AlertEvent]:
+        since = int(time.time()) - duration_seconds(range)
+        events = await asyncio.to_thread(self._read_alerts)
+        found = []
+        for event in reversed(events):
+            if len(found) >= limit:
+                break
+            if event.time >= since and (router_alias is None or event.router_alias == router_alias) \
+                    and (kind is None or event.kind == kind):
+                found.append(event)
+        return found
+
+    def buffer_stats(self) -> Dict[str, Any]:
+        return {"series": len(self._series), "open_files": len(self._files), "out_of_order": self.out_of_order}
+
+    async def check_health_async(self) -> bool:
+        return os.access(self.series_dir, os.W_OK)
+
+    def close(self):
+        with self._lock:
+            for series_id in list(self._files):
+                self._close_file(series_id)
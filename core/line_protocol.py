@@ -0,0 +1,92 @@
+"""
+Serializador directo a line protocol de InfluxDB para `mikrotik_traffic` y
+`mikrotik_alerts`.
+
+Evita construir un `influxdb_client.Point` por muestra: cada lote de
+QueueSamples se arma con f-strings en un solo `join`, con tags ordenados por
+clave, enteros con sufijo `i` y timestamp en segundos.
+"""
+import re
+from calendar import timegm
+from datetime import datetime, timezone
+from typing import List
+from models.alerts import AlertEvent
+from models.samples import QueueSamples
+
+TRAFFIC_MEASUREMENT = "mikrotik_traffic"
+ALERT_MEASUREMENT = "mikrotik_alerts"
+
+# Mismo escape de tags que influxdb_client (coma, igual, espacio, saltos)
+_ESCAPE_TAG = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+_NEEDS_ESCAPE = re.compile(r'[,= \n\t\r]')
+
+
+def escape_tag(value: str) -> str:
+    return value.translate(_ESCAPE_TAG)
+
+
+def escape_tags(values: List[str]) -> List[str]:
+    """Escapa una columna de tags completa con un solo `translate` sobre el lote unido"""
+    joined = '\x00'.join(values)
+    if not _NEEDS_ESCAPE.search(joined):
+        return values
+    escaped = joined.translate(_ESCAPE_TAG).split('\x00')
+    if len(escaped) != len(values):
+        # Algún valor traía '\x00': se escapa uno por uno
+        return [v.translate(_ESCAPE_TAG) for v in values]
+    return escaped
+
+
+def to_epoch_seconds(ts: datetime) -> int:
+    """Los datetime sin zona se interpretan como UTC (igual que influxdb_client)"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return timegm(ts.utctimetuple())
+
+
+def serialize_samples(samples: QueueSamples, plan_profile: str = "unknown") -> bytes:
+    """Una línea por cola del lote"""
+    if not len(samples):
+        return b''
+
+    # Tags en orden alfabético: plan_profile, router_alias, target_ip, user_name
+    prefix = (
+        f"{TRAFFIC_MEASUREMENT},plan_profile={escape_tag(plan_profile)}"
+        f",router_alias={escape_tag(samples.router_alias)}"
+    )
+    suffix = f" {to_epoch_seconds(samples.timestamp)}" if samples.timestamp else ""
+
+    # Campos también en orden alfabético
+    lines = [
+        f"{prefix},target_ip={ip},user_name={name}"
+        f" download_avg_bps={d_avg}i,download_bps={d_bps}i,download_bytes={d_bytes}i"
+        f",download_pps={d_pps}i,dropped_download={d_drop}i,dropped_upload={u_drop}i"
+        f",upload_avg_bps={u_avg}i,upload_bps={u_bps}i,upload_bytes={u_bytes}i"
+        f",upload_pps={u_pps}i{suffix}"
+        for name, ip, u_bps, d_bps, u_bytes, d_bytes, u_drop, d_drop, u_avg, d_avg, u_pps, d_pps in zip(
+            escape_tags(samples.names), escape_tags(samples.target_ips),
+            samples.upload_bps, samples.download_bps,
+            samples.upload_bytes, samples.download_bytes,
+            samples.dropped_upload, samples.dropped_download,
+            samples.upload_avg_bps, samples.download_avg_bps,
+            samples.upload_pps, samples.download_pps,
+        )
+    ]
+    return '\n'.join(lines).encode('utf-8')
+
+
+def serialize_alerts(events: List[AlertEvent]) -> bytes:
+    """Una línea por evento; kind y state van como tags para filtrar sin pivot"""
+    return '\n'.join(
+        f"{ALERT_MEASUREMENT},kind={e.kind},router_alias={escape_tag(e.router_alias)}"
+        f",state={e.state},user_name={escape_tag(e.user_name)}"
+        f" limit={e.limit}i,value={e.value}i {e.time}"
+        for e in events
+    ).encode('utf-8')
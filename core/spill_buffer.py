@@ -0,0 +1,183 @@
+"""
+Buffer de escritura en disco (write-ahead) para caídas de InfluxDB.
+
+Los lotes de line protocol que no se pudieron escribir se agregan a
+segmentos append-only (`000000000001.seg`, `000000000002.seg`, ...). Cada
+registro es `<longitud u32 big-endian><precisión 2 bytes><payload>`. La
+reinyección lee los segmentos en orden y borra cada uno cuando se confirmó
+completo.
+
+La entrega es "al menos una vez": si el proceso muere a mitad de un
+segmento, al reiniciar se reenvían sus registros desde el principio. InfluxDB
+sobrescribe puntos con la misma serie y timestamp, así que el reenvío no
+duplica datos.
+
+Un lote que InfluxDB rechaza de forma permanente (4xx) no se reintenta: se
+aparta en `rejected.lp` (hasta el tamaño de un segmento) para revisarlo a
+mano, y la reinyección sigue con el siguiente.
+"""
+import logging
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>I2s')
+_SUFFIX = '.seg'
+_REJECTED = 'rejected.lp'
+
+
+class SpillBuffer:
+    def __init__(self, directory: str, max_bytes: int, segment_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max_bytes)
+        self._lock = threading.Lock()
+        self._segments: List[int] = []
+        self._sizes: Dict[int, int] = {}
+        self._active = None  # Archivo abierto del último segmento
+        self._read_offset = 0  # Posición confirmada dentro del segmento más viejo
+
+        self.spilled_batches = 0
+        self.replayed_batches = 0
+        self.dropped_bytes = 0
+        self.rejected_batches = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(_SUFFIX) and name[:-len(_SUFFIX)].isdigit():
+                seq = int(name[:-len(_SUFFIX)])
+                self._segments.append(seq)
+                self._sizes[seq] = os.path.getsize(self._path(seq))
+        if self._segments:
+            logger.warning(f"Spill buffer: {len(self._segments)} segmentos pendientes en {directory}")
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{_SUFFIX}")
+
+    @property
+    def pending_bytes(self) -> int:
+        return sum(self._sizes.values()) - self._read_offset
+
+    def __bool__(self) -> bool:
+        return self.pending_bytes > 0
+
+    # --- Escritura ---
+
+    def append(self, payload: bytes, precision: str):
+        """Agrega un lote al final del buffer y lo lleva a disco antes de volver"""
+        record = _HEADER.pack(len(payload), precision.encode()) + payload
+        with self._lock:
+            if self._active is None or self._sizes[self._segments[-1]] + len(record) > self.segment_bytes:
+                self._rotate()
+            seq = self._segments[-1]
+            self._active.write(record)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._sizes[seq] += len(record)
+            self.spilled_batches += 1
+            self._enforce_cap()
+
+    def _rotate(self):
+        if self._active is not None:
+            self._active.close()
+        seq = self._segments[-1] + 1 if self._segments else 1
+        self._segments.append(seq)
+        self._sizes[seq] = 0
+        self._active = open(self._path(seq), 'ab')
+
+    def _enforce_cap(self):
+        # Al superar el tope se descartan los segmentos más viejos (nunca el activo)
+        while self.pending_bytes > self.max_bytes and len(self._segments) > 1:
+            seq = self._segments[0]
+            lost = self._sizes[seq] - self._read_offset
+            self._drop_oldest()
+            self.dropped_bytes += lost
+            logger.error(f"Spill buffer lleno: descartados {lost} bytes del segmento {seq}")
+
+    def _drop_oldest(self):
+        seq = self._segments.pop(0)
+        del self._sizes[seq]
+        self._read_offset = 0
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+
+    def quarantine(self, payload: bytes, reason: str):
+        """Aparta un lote rechazado por InfluxDB; si el archivo ya está lleno, se descarta"""
+        path = os.path.join(self.directory, _REJECTED)
+        with self._lock:
+            self.rejected_batches += 1
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            if size + len(payload) > self.segment_bytes:
+                logger.error(f"Lote rechazado por InfluxDB y descartado ({len(payload)} bytes): {reason}")
+                return
+            with open(path, 'ab') as f:
+                f.write(payload.rstrip(b'\n') + b'\n')
+        logger.error(f"Lote rechazado por InfluxDB, apartado en {path}: {reason}")
+
+    # --- Reinyección ---
+
+    def peek(self) -> Optional[Tuple[int, int, bytes, str]]:
+        """Devuelve (segmento, offset siguiente, payload, precisión) del registro más viejo sin confirmar"""
+        with self._lock:
+            while self._segments:
+                seq = self._segments[0]
+                offset = self._read_offset
+                if offset < self._sizes[seq]:
+                    with open(self._path(seq), 'rb') as f:
+                        f.seek(offset)
+                        header = f.read(_HEADER.size)
+                        if len(header) == _HEADER.size:
+                            length, precision = _HEADER.unpack(header)
+                            payload = f.read(length)
+                            if len(payload) == length:
+                                precision = precision.rstrip(b'\x00').decode()
+                                return seq, offset + _HEADER.size + length, payload, precision
+                    # Registro truncado (corte a mitad de escritura): se descarta el resto
+                    logger.error(f"Spill buffer: segmento {seq} truncado en el byte {offset}")
+                    self.dropped_bytes += self._sizes[seq] - offset
+                    self._sizes[seq] = offset
+                if len(self._segments) == 1 and self._active is not None:
+                    return None
+                self._drop_oldest()
+            return None
+
+    def ack(self, seq: int, next_offset: int):
+        """Confirma que el registro devuelto por `peek` ya está en InfluxDB"""
+        with self._lock:
+            if not self._segments or self._segments[0] != seq:
+                return  # El segmento fue descartado por el tope mientras se escribía
+            self._read_offset = next_offset
+            self.replayed_batches += 1
+            if next_offset < self._sizes[seq]:
+                return
+            if len(self._segments) == 1 and self._active is not None:
+                # Se vació el segmento activo: el próximo append abre uno nuevo
+                self._active.close()
+                self._active = None
+            self._drop_oldest()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "pending_bytes": self.pending_bytes,
+                "max_bytes": self.max_bytes,
+                "spilled_batches": self.spilled_batches,
+                "replayed_batches": self.replayed_batches,
+                "dropped_bytes": self.dropped_bytes,
+                "rejected_batches": self.rejected_batches,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
@@ -0,0 +1,112 @@
+"""
+Interfaz de los backends de almacenamiento de métricas.
+
+El collector y los endpoints `/metrics/*` usan `storage` (core/database.py)
+y no dependen de InfluxDB directamente. STORAGE_BACKEND elige la
+implementación:
+
+- "influxdb" (por defecto): InfluxClient, consultas Flux, buffer en disco.
+- "embedded": core/embedded_store.py, almacén columnar local sin servidor,
+  pensado para el borde de la red y para medir el collector sin red.
+"""
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional
+from models.alerts import AlertEvent
+from models.samples import QueueSamples
+
+# Se llama en el event loop cuando el lote quedó escrito (o en el buffer en disco)
+OnWritten = Optional[Callable[[], None]]
+
+# Campos de `mikrotik_traffic` que guardan todos los backends (orden del line protocol)
+TRAFFIC_FIELDS = (
+    'download_avg_bps', 'download_bps', 'download_bytes', 'download_pps',
+    'dropped_download', 'dropped_upload',
+    'upload_avg_bps', 'upload_bps', 'upload_bytes', 'upload_pps',
+)
+HISTORY_FIELDS = ('download_bps', 'upload_bps')
+
+
+class SeriesPoint(NamedTuple):
+    """Un punto de historial; `series` cambia de valor cuando empieza otra serie"""
+    series: int
+    user_name: Optional[str]
+    router_alias: Optional[str]
+    field: str
+    time: datetime
+    value: Any
+
+
+class StorageBackend(ABC):
+    name = ""
+
+    # --- Escritura ---
+
+    async def start_writer(self):
+        pass
+
+    async def stop_writer(self):
+        pass
+
+    @abstractmethod
+    async def write_samples_async(self, samples: QueueSamples, on_written: OnWritten = None):
+        """Escribe un lote; `on_written` se llama recién cuando la escritura terminó"""
+
+    @abstractmethod
+    async def write_payload_async(self, payload: bytes):
+        """Line protocol ya serializado (lo usa el writer del collector multiproceso)"""
+
+    def buffer_stats(self) -> Dict[str, Any]:
+        return {}
+
+    # --- Consultas ---
+
+    @abstractmethod
+    def history_stream(
+        self, usernames: Optional[List[str]], router_alias: Optional[str],
+        range: str, every: str, fn: str,
+    ) -> AsyncIterator[List[SeriesPoint]]:
+        """
+        Historial agregado de upload_bps/download_bps en tandas de puntos,
+        agrupado por (router, usuario, campo) y con cada serie contigua.
+        """
+
+    def history_tier(self, every: str, fn: str, range: str) -> str:
+        """Nivel de datos que se usaría para una consulta de historial"""
+        return "raw"
+
+    @abstractmethod
+    async def latest_values(self, username: str, max_age: int) -> List[Dict[str, Any]]:
+        """Último punto de cada serie del usuario más reciente que `max_age` segundos"""
+
+    @abstractmethod
+    async def current_load(self, max_age: int) -> Dict[str, Any]:
+        """Suma del último upload_bps/download_bps de todas las series"""
+
+    @abstractmethod
+    async def recent_alerts(
+        self, range: str, router_alias: Optional[str], kind: Optional[str], limit: int,
+    ) -> List[AlertEvent]:
+        """Eventos de `mikrotik_alerts` del rango, del más nuevo al más viejo"""
+
+    async def check_health_async(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+async def iterate_in_thread(items: Iterable, chunk_size: int = 1000, close=None) -> AsyncIterator[list]:
+    """Consume un iterable bloqueante en un hilo, de a `chunk_size` elementos"""
+    iterator = iter(items)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(itertools.islice(iterator, chunk_size)))
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if close is not None:
+            await asyncio.to_thread(close)
@@ -6,17 +6,37 @@ from contextlib import asynccontextmanager
 from api.v1.routers import metrics, health, mikrotik
 from services.collector_service import collector_service
 from core.config import settings
-from core.database import influx_db
+from core.database import storage
+from services.connection_pool import router_pool, async_router_pool
+from services.pipeline import collector_pipeline
+from services.rollups import rollup_manager
+from services.sharding import shard_assignment
 # ------------------------------------------------
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await collector_service.start()
+    # Antes que todo lo demás: el buffer en disco y los procesos hijos usan el shard reclamado
+    shard_assignment.claim()
+    if storage.name == "influxdb":
+        await rollup_manager.start(storage.client, storage.bucket)
+    if settings.COLLECTOR_MODE == "process":
+        # Recolección y escritura en procesos aparte (ver services/pipeline.py)
+        await collector_pipeline.start()
+    else:
+        await storage.start_writer()
+        await collector_service.start()
     yield
     # Shutdown
-    await collector_service.stop()
-    influx_db.close()
+    await rollup_manager.stop()
+    if settings.COLLECTOR_MODE == "process":
+        await collector_pipeline.stop()
+    else:
+        await collector_service.stop()
+        await storage.stop_writer()
+    storage.close()
+    router_pool.close_all()
+    await async_router_pool.close_all()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -0,0 +1,26 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, NamedTuple
+
+# Tipos de alerta: uso sostenido cerca del max-limit (por sentido) y pico de descartes
+ALERT_KINDS = ("upload_saturation", "download_saturation", "drops")
+ALERT_STATES = ("start", "end")
+
+
+class AlertEvent(NamedTuple):
+    """
+    Cambio de estado de una alerta de una cola. `value` es el promedio móvil
+    del tráfico (bps) o los descartes por segundo; `limit` es el max-limit
+    (bps) o el umbral de descartes con el que se comparó.
+    """
+    time: int  # Epoch en segundos
+    router_alias: str
+    user_name: str
+    kind: str
+    state: str
+    value: int
+    limit: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = self._asdict()
+        data["time"] = datetime.fromtimestamp(self.time, tz=timezone.utc).isoformat()
+        return data
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
+
+# Duraciones Flux (1m, 24h, 7d...) y funciones de agregación admitidas
+DURATION_PATTERN = r"^\d+(s|m|h|d|w|mo|y)$"
+AGGREGATION_FUNCTIONS = ("mean", "median", "max", "min", "sum", "last")
+
+class BulkHistoryRequest(BaseModel):
+    usernames: Optional[List[str]] = None
+    router_alias: Optional[str] = None  # Todos los usuarios de un router
+    range: str = Field("24h", pattern=DURATION_PATTERN)
+    every: str = Field("1h", pattern=DURATION_PATTERN)
+    fn: str = "mean"
+    format: str = "ndjson"  # "ndjson" (una línea por serie) o "csv" (una fila por punto)
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if not self.usernames and not self.router_alias:
+            raise ValueError("Se requiere 'usernames' o 'router_alias'")
+        if self.fn not in AGGREGATION_FUNCTIONS:
+            raise ValueError(f"fn debe ser una de: {', '.join(AGGREGATION_FUNCTIONS)}")
+        if self.format not in ("ndjson", "csv"):
+            raise ValueError("format debe ser ndjson o csv")
+        return self
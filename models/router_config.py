@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class RouterConfig(BaseModel):
     host: str
@@ -8,3 +9,6 @@ class RouterConfig(BaseModel):
     alias: str
     use_ssl: bool = False
     ssl_verify: bool = False
+    interval_seconds: Optional[int] = None  # Si no se indica: COLLECTOR_INTERVAL_SECONDS
+    connect_timeout: Optional[float] = None  # Si no se indica: ROUTEROS_CONNECT_TIMEOUT
+    read_timeout: Optional[float] = None  # Si no se indica: ROUTEROS_READ_TIMEOUT
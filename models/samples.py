@@ -0,0 +1,58 @@
+from array import array
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# (atributo RouterOS, columna upload, columna download)
+PAIR_COLUMNS: Tuple[Tuple[str, str, str], ...] = (
+    ('bytes', 'upload_bytes', 'download_bytes'),
+    ('packets', 'upload_packets', 'download_packets'),
+    ('dropped', 'dropped_upload', 'dropped_download'),
+    ('rate', 'upload_bps', 'download_bps'),
+    ('max-limit', 'upload_max_limit', 'download_max_limit'),  # 0: sin límite
+)
+
+# Columnas calculadas por el collector a partir de deltas de contadores
+RATE_COLUMNS: Tuple[str, ...] = ('upload_avg_bps', 'download_avg_bps', 'upload_pps', 'download_pps')
+
+
+class QueueSamples:
+    """
+    Muestras de las colas de un router en un instante (struct-of-arrays).
+
+    Registro interno del collector: va del parser a la serialización sin
+    pasar por QueueMetrics/InfluxPoint, que quedan para la API HTTP.
+    """
+
+    __slots__ = (
+        'router_alias', 'timestamp',
+        'names', 'target_ips',
+        'upload_bytes', 'download_bytes',
+        'upload_packets', 'download_packets',
+        'dropped_upload', 'dropped_download',
+        'upload_bps', 'download_bps',
+        'upload_max_limit', 'download_max_limit',
+        'upload_avg_bps', 'download_avg_bps',
+        'upload_pps', 'download_pps',
+    )
+
+    def __init__(self, router_alias: str = "", timestamp: Optional[datetime] = None):
+        self.router_alias = router_alias
+        self.timestamp = timestamp
+        self.names: List[str] = []
+        self.target_ips: List[str] = []
+        for _, up, down in PAIR_COLUMNS:
+            setattr(self, up, array('q'))
+            setattr(self, down, array('q'))
+        for name in RATE_COLUMNS:
+            setattr(self, name, array('q'))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def take(self, indices: List[int]) -> "QueueSamples":
+        """Nuevo lote solo con las filas indicadas (mismo router y timestamp)"""
+        subset = QueueSamples(self.router_alias, self.timestamp)
+        for name in self.__slots__[2:]:
+            source = getattr(self, name)
+            getattr(subset, name).extend([source[i] for i in indices])
+        return subset
@@ -0,0 +1,235 @@
+"""
+Detección de saturación y de descartes por cola, durante la recolección.
+
+Con cada lote (ya con los promedios del intervalo que calcula el índice de
+contadores) se actualiza por cola:
+
+- El promedio móvil exponencial (EWMA) del uso de subida y de bajada
+  respecto del `max-limit`, que llega en la misma lectura de
+  '/queue/simple/print'. Una alerta `*_saturation` se abre cuando el uso
+  supera ANOMALY_SATURATION_RATIO y se cierra cuando baja de
+  ANOMALY_SATURATION_CLEAR_RATIO. Las colas sin max-limit no se evalúan.
+- El promedio y la varianza móviles de los paquetes descartados por
+  segundo. Una alerta `drops` se abre cuando los descartes del intervalo
+  superan ANOMALY_DROP_MIN_PPS y el promedio en ANOMALY_DROP_ZSCORE
+  desvíos, y se cierra cuando vuelven a quedar debajo del mínimo.
+
+Solo se emiten eventos en los cambios de estado (start/end). El collector
+los escribe en `mikrotik_alerts` y quedan los últimos en memoria para
+`/metrics/alerts`. No se hace ninguna consulta extra a los routers.
+"""
+import math
+import time
+from array import array
+from calendar import timegm
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from core.config import settings
+from models.alerts import AlertEvent
+from models.samples import QueueSamples
+from services.counter_index import counter_delta
+
+# (tipo de alerta, columna de tráfico, columna de max-limit)
+_SATURATION = (
+    ('upload_saturation', 'upload_avg_bps', 'upload_max_limit'),
+    ('download_saturation', 'download_avg_bps', 'download_max_limit'),
+)
+
+
+class RouterAnomalies:
+    """Promedios móviles y alertas abiertas de las colas de un router"""
+
+    def __init__(self, alias: str, detector: "AnomalyDetector"):
+        self.alias = alias
+        self.detector = detector
+        self.cycle = 0
+        self._now = 0
+        self._slots: Dict[str, int] = {}
+        self._seen = array('q')
+        self._last_ts = array('q')
+        self._dropped = array('q')  # Último contador de descartes (subida + bajada)
+        self._drop_mean = array('d')
+        self._drop_var = array('d')
+        self._usage = {kind: array('d') for kind, _, _ in _SATURATION}  # -1: sin dato
+        self.open: Dict[Tuple[str, str], AlertEvent] = {}  # (cola, tipo) -> evento de apertura
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def begin_cycle(self):
+        self.cycle += 1
+
+    def abort_cycle(self):
+        """Ciclo cortado por un error: las colas que no llegaron no se dan por borradas"""
+        self.cycle -= 1
+
+    def _event(self, name: str, kind: str, state: str, value: float, limit: float) -> AlertEvent:
+        event = AlertEvent(self._now, self.alias, name, kind, state, int(value), int(limit))
+        if state == "start":
+            self.open[(name, kind)] = event
+        else:
+            self.open.pop((name, kind), None)
+        self.detector.recent.append(event)
+        return event
+
+    def check(self, samples: QueueSamples) -> List[AlertEvent]:
+        """Actualiza las colas del lote y devuelve las alertas que se abrieron o cerraron"""
+        detector = self.detector
+        if not detector.enabled:
+            return []
+        self._now = now = timegm(samples.timestamp.utctimetuple()) if samples.timestamp else int(time.time())
+        alpha = detector.alpha
+        slots, seen, cycle = self._slots, self._seen, self.cycle
+        last_ts, last_dropped = self._last_ts, self._dropped
+        drop_mean, drop_var = self._drop_mean, self._drop_var
+        saturation = [
+            (kind, getattr(samples, rate), getattr(samples, limit), self._usage[kind])
+            for kind, rate, limit in _SATURATION
+        ]
+        dropped_up, dropped_down = samples.dropped_upload, samples.dropped_download
+        is_open = self.open
+        events: List[AlertEvent] = []
+
+        for i, name in enumerate(samples.names):
+            dropped = dropped_up[i] + dropped_down[i]
+            slot = slots.get(name)
+            new = slot is None
+            if new:
+                slot = slots[name] = len(seen)
+                seen.append(cycle)
+                last_ts.append(now)
+                last_dropped.append(dropped)
+                drop_mean.append(0.0)
+                drop_var.append(0.0)
+                for _, _, _, usage in saturation:
+                    usage.append(-1.0)
+            else:
+                seen[slot] = cycle
+
+            for kind, rates, limits, usage in saturation:
+                limit = limits[i]
+                if limit <= 0:
+                    usage[slot] = -1.0
+                    if (name, kind) in is_open:
+                        events.append(self._event(name, kind, "end", 0, 0))
+                    continue
+                ratio = rates[i] / limit
+                previous = usage[slot]
+                if previous < 0:
+                    usage[slot] = ratio  # Primera muestra: solo inicia el promedio
+                    continue
+                ratio = previous + alpha * (ratio - previous)
+                usage[slot] = ratio
+                if (name, kind) in is_open:
+                    if ratio < detector.clear_ratio:
+                        events.append(self._event(name, kind, "end", ratio * limit, limit))
+                elif ratio >= detector.saturation_ratio:
+                    events.append(self._event(name, kind, "start", ratio * limit, limit))
+
+            if new:
+                continue  # Los descartes necesitan una muestra anterior
+            elapsed = now - last_ts[slot]
+            delta = counter_delta(last_dropped[slot], dropped)
+            last_ts[slot] = now
+            last_dropped[slot] = dropped
+            if elapsed <= 0:
+                continue
+            rate = delta / elapsed
+            mean, var = drop_mean[slot], drop_var[slot]
+            if (name, 'drops') in is_open:
+                if rate < detector.drop_min_pps:
+                    events.append(self._event(name, 'drops', "end", rate, detector.drop_min_pps))
+            elif rate >= detector.drop_min_pps:
+                threshold = mean + detector.drop_zscore * math.sqrt(var)
+                if rate > threshold:
+                    events.append(self._event(name, 'drops', "start", rate, max(threshold, detector.drop_min_pps)))
+            # Promedio y varianza exponenciales (la muestra actual entra después de comparar)
+            diff = rate - mean
+            increment = alpha * diff
+            drop_mean[slot] = mean + increment
+            drop_var[slot] = (1 - alpha) * (var + diff * increment)
+
+        return events
+
+    def end_cycle(self) -> List[AlertEvent]:
+        """Olvida las colas que ya no están en el router y cierra sus alertas"""
+        if len(self._seen) == sum(1 for s in self._seen if s == self.cycle):
+            return []
+        keep = [(name, slot) for name, slot in self._slots.items() if self._seen[slot] == self.cycle]
+        events = [
+            self._event(name, kind, "end", 0, 0)
+            for name, kind in list(self.open)
+            if self._seen[self._slots[name]] != self.cycle
+        ]
+        self._slots = {name: new for new, (name, _) in enumerate(keep)}
+        self._seen = array('q', (self.cycle for _ in keep))
+        self._last_ts = array('q', (self._last_ts[slot] for _, slot in keep))
+        self._dropped = array('q', (self._dropped[slot] for _, slot in keep))
+        self._drop_mean = array('d', (self._drop_mean[slot] for _, slot in keep))
+        self._drop_var = array('d', (self._drop_var[slot] for _, slot in keep))
+        self._usage = {kind: array('d', (usage[slot] for _, slot in keep)) for kind, usage in self._usage.items()}
+        return events
+
+
+class AnomalyDetector:
+    def __init__(self, enabled: bool, alpha: float, saturation_ratio: float, clear_ratio: float,
+                 drop_min_pps: float, drop_zscore: float, max_events: int):
+        self.enabled = enabled
+        self.alpha = alpha
+        self.saturation_ratio = saturation_ratio
+        self.clear_ratio = clear_ratio
+        self.drop_min_pps = drop_min_pps
+        self.drop_zscore = drop_zscore
+        self.recent: Deque[AlertEvent] = deque(maxlen=max_events)
+        self._routers: Dict[str, RouterAnomalies] = {}
+
+    def for_router(self, alias: str) -> RouterAnomalies:
+        anomalies = self._routers.get(alias)
+        if anomalies is None:
+            anomalies = self._routers[alias] = RouterAnomalies(alias, self)
+        return anomalies
+
+    def discard(self, alias: str):
+        """Olvida un router (sus alertas abiertas se descartan sin evento de cierre)"""
+        self._routers.pop(alias, None)
+
+    def events(self, since: int, router_alias: Optional[str] = None, kind: Optional[str] = None,
+               limit: Optional[int] = None) -> List[AlertEvent]:
+        """Eventos recientes en memoria, del más nuevo al más viejo"""
+        found = []
+        for event in reversed(self.recent):
+            if event.time < since or (limit is not None and len(found) >= limit):
+                break
+            if (router_alias is None or event.router_alias == router_alias) and (kind is None or event.kind == kind):
+                found.append(event)
+        return found
+
+    def active(self, router_alias: Optional[str] = None, kind: Optional[str] = None) -> List[AlertEvent]:
+        """Eventos de apertura de las alertas que siguen abiertas"""
+        if router_alias is None:
+            routers = list(self._routers.values())
+        else:
+            routers = [self._routers[router_alias]] if router_alias in self._routers else []
+        return sorted(
+            (e for r in routers for e in r.open.values() if kind is None or e.kind == kind),
+            key=lambda e: e.time, reverse=True,
+        )
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "open": sum(len(r.open) for r in self._routers.values()),
+            "recent_events": len(self.recent),
+        }
+
+
+# Global Instance
+anomaly_detector = AnomalyDetector(
+    enabled=settings.ANOMALY_DETECTION_ENABLED,
+    alpha=settings.ANOMALY_EWMA_ALPHA,
+    saturation_ratio=settings.ANOMALY_SATURATION_RATIO,
+    clear_ratio=settings.ANOMALY_SATURATION_CLEAR_RATIO,
+    drop_min_pps=settings.ANOMALY_DROP_MIN_PPS,
+    drop_zscore=settings.ANOMALY_DROP_ZSCORE,
+    max_events=settings.ANOMALY_EVENTS_MAX,
+)
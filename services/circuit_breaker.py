@@ -0,0 +1,103 @@
+"""
+Circuit breaker por router.
+
+Tras ROUTER_BREAKER_FAILURES fallos seguidos el circuito se abre y el router
+deja de consultarse. La espera crece exponencialmente (backoff, con un poco
+de jitter) hasta ROUTER_BREAKER_MAX_BACKOFF_SECONDS. Vencida la espera, el
+circuito pasa a semiabierto y se deja pasar un único intento de prueba: si
+sale bien se cierra, si falla vuelve a abrirse con la espera siguiente.
+"""
+import random
+import time
+from typing import Any, Dict, Optional
+from core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, base_backoff: float, max_backoff: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failures = 0  # Fallos seguidos
+        self.trips = 0  # Aperturas seguidas (exponente del backoff)
+        self.retry_at = 0.0
+        self.probe_started = 0.0
+        self.last_error: Optional[str] = None
+        self.last_success: Optional[float] = None
+
+    def allow(self) -> bool:
+        """True si se puede intentar contactar al router ahora"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN  # Solo pasa este intento de prueba
+            self.probe_started = now
+            return True
+        if self.state == HALF_OPEN and now - self.probe_started >= self.base_backoff:
+            # La prueba anterior nunca informó resultado (p. ej. se canceló)
+            self.probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.last_error = None
+        self.last_success = time.time()
+
+    def record_failure(self, error: Any):
+        self.failures += 1
+        self.last_error = str(error) or type(error).__name__
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trips += 1
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.trips - 1))
+            self.retry_at = time.monotonic() + backoff * random.uniform(0.9, 1.1)
+            self.state = OPEN
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(max(0.0, self.retry_at - time.monotonic()), 1) if self.state == OPEN else None,
+            "last_error": self.last_error,
+            "last_success": self.last_success,
+        }
+
+
+class CircuitBreakerRegistry:
+    """Un breaker por alias de router, creado a demanda"""
+
+    def __init__(self, failure_threshold: int, base_backoff: float, max_backoff: float):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def for_router(self, alias: str) -> CircuitBreaker:
+        breaker = self._breakers.get(alias)
+        if breaker is None:
+            breaker = self._breakers[alias] = CircuitBreaker(
+                self.failure_threshold, self.base_backoff, self.max_backoff
+            )
+        return breaker
+
+    def discard(self, alias: str):
+        self._breakers.pop(alias, None)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {alias: b.stats() for alias, b in self._breakers.items()}
+
+
+# Global Instance
+router_breakers = CircuitBreakerRegistry(
+    failure_threshold=settings.ROUTER_BREAKER_FAILURES,
+    base_backoff=settings.ROUTER_BREAKER_BACKOFF_SECONDS,
+    max_backoff=settings.ROUTER_BREAKER_MAX_BACKOFF_SECONDS,
+)
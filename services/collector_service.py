@@ -1,14 +1,23 @@
 import asyncio
 import logging
-import json
-import os
-from typing import List
+from contextlib import aclosing
+from typing import List, Optional, Set
 from datetime import datetime
 from services.mikrotik_service import mikrotik_service
-from core.database import influx_db
-from models.influx import InfluxPoint
+from core.database import storage
+from core.line_protocol import serialize_alerts
 from core.config import settings
 from models.router_config import RouterConfig
+from services.connection_pool import async_router_pool
+from services.counter_index import counter_index
+from services.scheduler import PollingScheduler
+from services.circuit_breaker import router_breakers
+from services.inventory import InventoryDiff, router_inventory
+from services.sharding import shard_assignment
+from services.latest_store import latest_store
+from services.history_cache import history_cache
+from services.usage_accounting import usage_accounting
+from services.anomaly_detector import anomaly_detector
 
 logger = logging.getLogger(__name__)
 
@@ -16,35 +25,55 @@ class CollectorService:
     def __init__(self):
         self.is_running = False
         self._task = None
+        self._owned: Set[str] = set()
+        self.scheduler = PollingScheduler(
+            self._collect_from_router,
+            default_interval=settings.COLLECTOR_INTERVAL_SECONDS,
+            max_concurrent=settings.COLLECTOR_MAX_CONCURRENT_ROUTERS,
+        )
         
     def get_router_inventory(self) -> List[RouterConfig]:
-        """Carga el inventario de routers desde JSON o ENV"""
-        inventory = []
-        try:
-            # 1. Try ENV variable
-            if settings.ROUTERS_JSON_ENV:
-                data = json.loads(settings.ROUTERS_JSON_ENV)
-                for item in data:
-                    inventory.append(RouterConfig(**item))
-                return inventory
-            
-            # 2. Try JSON file
-            if os.path.exists(settings.ROUTERS_JSON_PATH):
-                with open(settings.ROUTERS_JSON_PATH, 'r') as f:
-                    data = json.load(f)
-                    for item in data:
-                        inventory.append(RouterConfig(**item))
-                return inventory
-                
-        except Exception as e:
-            logger.error(f"Error cargando inventario de routers: {e}")
-            
-        return inventory
+        """Inventario de routers (cacheado; se recarga por polling en `_loop`)"""
+        return router_inventory.routers()
+
+    def _sync_schedule(self, routers: List[RouterConfig]) -> List[RouterConfig]:
+        """Planifica solo los routers de este shard cuyo lease se obtuvo"""
+        owned = shard_assignment.owned(routers)
+        self.scheduler.sync(owned)
+        aliases = {r.alias for r in owned}
+        # Un router que pasó a otro proceso: su estado en memoria ya no es el último
+        for alias in self._owned - aliases:
+            self._forget(alias)
+        self._owned = aliases
+        return owned
+
+    @staticmethod
+    def _forget(alias: str):
+        counter_index.discard(alias)
+        latest_store.discard(alias)
+        usage_accounting.discard(alias)
+        anomaly_detector.discard(alias)
+
+    async def apply_inventory_changes(self, diff: InventoryDiff):
+        """Propaga al scheduler, al pool y a los índices solo los routers que cambiaron"""
+        for router in diff.removed:
+            await async_router_pool.discard(router)
+            router_breakers.discard(router.alias)
+            self._forget(router.alias)
+        for previous, router in diff.changed:
+            # Credenciales o dirección nuevas: la conexión vieja ya no sirve
+            await async_router_pool.discard(previous)
+            router_breakers.discard(router.alias)
+        self._sync_schedule(router_inventory.routers())
+        logger.info(f"Inventario de routers actualizado ({diff})")
 
     async def start(self):
         if self.is_running:
             return
         self.is_running = True
+        shard_assignment.claim()
+        self._sync_schedule(self.get_router_inventory())
+        await self.scheduler.start()
         self._task = asyncio.create_task(self._loop())
         logger.info("Collector Service Started")
 
@@ -56,86 +85,143 @@ class CollectorService:
                 await self._task
             except asyncio.CancelledError:
                 pass
+        await self.scheduler.stop()
+        shard_assignment.release_all()
+        self._owned = set()
         logger.info("Collector Service Stopped")
 
     async def collect_metrics(self):
-        """Ejecución de recolección en paralelo (Fan-out)"""
+        """Recolección inmediata de todos los routers (Fan-out), p. ej. desde /sync/force"""
         try:
             routers = self.get_router_inventory()
             if not routers:
                 logger.warning("No routers found in inventory.")
                 return
 
-            timestamp = datetime.utcnow()
-            logger.info(f"Iniciando recolección para {len(routers)} routers...")
-            
-            # Fan-out: Create tasks for all routers
-            tasks = [
-                self._collect_from_router(router, timestamp) 
-                for router in routers
-            ]
-            
-            # Wait for all tasks to complete (return_exceptions=True so one failure doesn't stop others)
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            routers = self._sync_schedule(routers)
+            logger.info(f"Iniciando recolección para {len(routers)} routers de este shard...")
+
+            # Los routers que ya están recolectando no se lanzan dos veces
+            results = await self.scheduler.run_now()
             
             # Process results (optional, logging summary)
             success_count = 0
             for res in results:
-                if not isinstance(res, Exception) and res is True:
-                    success_count += 1
-                elif isinstance(res, Exception):
+                if isinstance(res, Exception):
                     logger.error(f"Error inesperado en loop de recolección: {res}")
+                elif res:
+                    success_count += 1
             
             logger.info(f"Ciclo de recolección finalizado. Exitosos: {success_count}/{len(routers)}")
                 
         except Exception as e:
             logger.error(f"Error crítico en collector: {e}")
 
-    async def _collect_from_router(self, router: RouterConfig, timestamp: datetime) -> bool:
-        """Recolecta métricas de un solo router y escribe en InfluxDB"""
+    async def _collect_from_router(self, router: RouterConfig, timestamp: datetime) -> Optional[int]:
+        """
+        Recolecta métricas de un solo router y escribe en InfluxDB.
+        Devuelve la cantidad de colas leídas (el scheduler la usa como
+        prioridad), o None si el ciclo no se completó.
+
+        Las colas se consumen en streaming y se escriben en lotes de
+        COLLECTOR_WRITE_CHUNK_SIZE mientras el router sigue respondiendo.
+        El índice de contadores calcula los promedios del intervalo y, con
+        COLLECTOR_DELTA_ENABLED, deja solo las colas que cambiaron salvo en
+        los ciclos keyframe. El detector de anomalías revisa todas las colas
+        y sus alertas se escriben junto con las métricas.
+
+        Si el circuit breaker del router está abierto no se lo contacta. Al
+        breaker solo le cuentan los errores de la lectura del router: una
+        falla del almacenamiento o de la contabilidad corta el ciclo igual,
+        pero no es culpa del router.
+        """
+        breaker = router_breakers.for_router(router.alias)
+        if not breaker.allow():
+            # None: el scheduler conserva la cantidad de colas (prioridad) del último ciclo
+            logger.debug(f"Router '{router.alias}' omitido: circuito abierto")
+            return None
+        collected = 0
+        written = 0
+        router_failed = False
+        index = counter_index.for_router(router.alias)
+        index.begin_cycle()
+        latest_store.begin(router.alias, timestamp)
+        usage = usage_accounting.for_router(router.alias)
+        usage.begin_cycle(timestamp)
+        anomalies = anomaly_detector.for_router(router.alias)
+        anomalies.begin_cycle()
         try:
-            queues = await mikrotik_service.get_all_queues_metrics(router)
-            points = []
-            
-            for q in queues:
-                # Transformar QueueMetrics a InfluxPoint
-                fields = {
-                    "upload_bps": q.upload_bps,
-                    "download_bps": q.download_bps,
-                    "upload_bytes": q.upload_bytes,
-                    "download_bytes": q.download_bytes,
-                    "dropped_upload": q.dropped_packets_upload,
-                    "dropped_download": q.dropped_packets_download
-                }
-                
-                tags = {
-                    "user_name": q.name,
-                    "target_ip": q.target_ip,
-                    "plan_profile": q.plan_profile,
-                    "router_alias": router.alias # [NEW] Tag requirement
-                }
-                
-                point = InfluxPoint(
-                    measurement="mikrotik_traffic",
-                    tags=tags,
-                    fields=fields,
-                    time=timestamp
-                )
-                points.append(point)
-            
-            if points:
-                influx_db.write_batch(points)
-                return True
-            return False
-            
+            batches = mikrotik_service.stream_queue_batches(
+                router, settings.COLLECTOR_WRITE_CHUNK_SIZE, timestamp
+            )
+            async with aclosing(batches):
+                while True:
+                    try:
+                        samples = await anext(batches)
+                    except StopAsyncIteration:
+                        break
+                    except Exception:
+                        router_failed = True
+                        raise
+                    collected += len(samples)
+                    changed = index.update(samples, changed_only=settings.COLLECTOR_DELTA_ENABLED)
+                    # La foto en memoria lleva todas las colas, también las que no cambiaron
+                    latest_store.add(router.alias, samples)
+                    usage.add(samples)
+                    alerts = anomalies.check(samples)
+                    if len(changed):
+                        # Se invalida cuando el writer entregó el lote: antes, una consulta
+                        # todavía vería los datos viejos y los volvería a guardar
+                        names = changed.names
+                        await storage.write_samples_async(changed, lambda: history_cache.invalidate(names))
+                        written += len(changed)
+                    if alerts:
+                        await storage.write_payload_async(serialize_alerts(alerts))
         except Exception as e:
-            logger.error(f"Error recolectando de router '{router.alias}' ({router.host}): {e}")
-            return e
+            # Ciclo cortado: ningún índice debe darlo por completo
+            latest_store.abort(router.alias)
+            index.abort_cycle()
+            anomalies.abort_cycle()
+            await self._save_usage(router.alias, usage.abort_cycle)
+            if router_failed:
+                breaker.record_failure(e)
+                logger.error(f"Error recolectando de router '{router.alias}' ({router.host}): {e}")
+            else:
+                logger.error(f"Ciclo del router '{router.alias}' cortado al procesar o escribir las colas: {e}")
+            return None
+
+        index.end_cycle()
+        latest_store.commit(router.alias)
+        await self._save_usage(router.alias, usage.end_cycle)
+        breaker.record_success()
+        alerts = anomalies.end_cycle()
+        if alerts:
+            try:
+                await storage.write_payload_async(serialize_alerts(alerts))
+            except Exception as e:
+                logger.error(f"No se pudieron escribir las alertas del router '{router.alias}': {e}")
+        logger.debug(f"Router '{router.alias}': {written}/{collected} colas escritas")
+        return collected
+
+    @staticmethod
+    async def _save_usage(alias: str, close):
+        try:
+            await asyncio.to_thread(close)
+        except OSError as e:
+            logger.error(f"No se pudo guardar el consumo del router '{alias}': {e}")
 
     async def _loop(self):
+        """Mantenimiento: la recolección en sí la dispara el scheduler por router"""
         while self.is_running:
-            await self.collect_metrics()
-            await asyncio.sleep(settings.COLLECTOR_INTERVAL_SECONDS)
+            await asyncio.sleep(settings.INVENTORY_POLL_SECONDS)
+            diff = router_inventory.reload()
+            if diff:
+                await self.apply_inventory_changes(diff)
+            else:
+                # Reintenta leases que otro proceso haya liberado
+                self._sync_schedule(router_inventory.routers())
+            # Cerrar conexiones que quedaron ociosas más de lo permitido
+            await async_router_pool.evict_idle()
 
 # Global Instance
 collector_service = CollectorService()
@@ -0,0 +1,364 @@
+import routeros_api
+from routeros_api.exceptions import RouterOsApiCommunicationError
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, List, Tuple, Any
+import asyncio
+import threading
+import time
+import logging
+from core.config import settings
+from services.routeros_async import (
+    AsyncRouterOsApi, RouterOsFatalError, RouterOsTimeoutError, MAX_PENDING_SENTENCES,
+)
+
+logger = logging.getLogger(__name__)
+
+# (host, port, username, use_ssl, ssl_verify)
+PoolKey = Tuple[str, int, str, bool, bool]
+
+
+class RouterPoolTimeout(Exception):
+    """No hubo una conexión libre para el router dentro del tiempo de espera"""
+
+
+def resolve_port(port: int, use_ssl: bool) -> int:
+    """Si se usa SSL con el puerto por defecto no seguro, se cambia al 8729"""
+    if use_ssl and port == 8728:
+        return 8729
+    return port
+
+
+def pool_key(credentials: Any) -> PoolKey:
+    """Clave del pool a partir de RouterConfig o MikrotikCredentials"""
+    return (
+        credentials.host,
+        resolve_port(credentials.port, credentials.use_ssl),
+        credentials.username,
+        bool(credentials.use_ssl),
+        bool(getattr(credentials, 'ssl_verify', False)),
+    )
+
+
+class _PooledConnection:
+    __slots__ = ("pool", "api", "password", "created_at", "last_used")
+
+    def __init__(self, pool: routeros_api.RouterOsApiPool, api, password: str):
+        self.pool = pool
+        self.api = api
+        self.password = password
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    def close(self):
+        try:
+            self.pool.disconnect()
+        except Exception:
+            pass
+
+
+class RouterConnectionPool:
+    """
+    Pool de conexiones RouterOS de larga vida, una cola por router.
+
+    Evita el handshake TCP/TLS + login en cada llamada. Las conexiones ociosas
+    se validan antes de reutilizarse y se cierran tras `idle_timeout` segundos.
+    """
+
+    def __init__(
+        self,
+        max_per_router: int = 4,
+        idle_timeout: float = 300,
+        health_check_interval: float = 30,
+        acquire_timeout: float = 15,
+    ):
+        self.max_per_router = max_per_router
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._idle: Dict[PoolKey, List[_PooledConnection]] = {}
+        self._in_use: Dict[PoolKey, int] = {}
+
+    @contextmanager
+    def connection(self, credentials: Any):
+        """
+        Presta una conexión (`RouterOsApi`) para el router indicado.
+
+        Si el bloque lanza un error de red la conexión se descarta; los `!trap`
+        de RouterOS no invalidan el socket y la conexión vuelve al pool.
+        """
+        key = pool_key(credentials)
+        conn = self._acquire(key, credentials)
+        broken = False
+        try:
+            yield conn.api
+        except RouterOsApiCommunicationError:
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self._release(key, conn, broken)
+
+    def _acquire(self, key: PoolKey, credentials: Any) -> _PooledConnection:
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                self._evict_idle_locked(key)
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    break
+                if self._in_use.get(key, 0) < self.max_per_router:
+                    conn = None
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RouterPoolTimeout(
+                        f"Sin conexiones libres para {key[0]}:{key[1]} "
+                        f"({self.max_per_router} en uso)"
+                    )
+                self._cond.wait(remaining)
+
+        # La red se toca fuera del lock para no bloquear a otros routers
+        try:
+            if conn is not None and not self._is_reusable(conn, credentials):
+                conn.close()
+                conn = None
+            if conn is None:
+                conn = self._open(key, credentials)
+            return conn
+        except Exception:
+            with self._cond:
+                self._in_use[key] -= 1
+                self._cond.notify_all()
+            raise
+
+    def _is_reusable(self, conn: _PooledConnection, credentials: Any) -> bool:
+        if conn.password != credentials.password or not conn.pool.connected:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            conn.api.get_resource('/system/identity').get()
+            return True
+        except Exception as e:
+            logger.info(f"Conexión ociosa a {credentials.host} inválida, reconectando: {e}")
+            return False
+
+    def _open(self, key: PoolKey, credentials: Any) -> _PooledConnection:
+        host, port, username, use_ssl, ssl_verify = key
+        # Los routers suelen usar certificados autofirmados: el certificado
+        # solo se verifica si las credenciales lo piden (`ssl_verify`).
+        pool = routeros_api.RouterOsApiPool(
+            host=host,
+            username=username,
+            password=credentials.password,
+            port=port,
+            use_ssl=use_ssl,
+            ssl_verify=ssl_verify,
+            ssl_verify_hostname=ssl_verify,
+            plaintext_login=True  # Necesario para RouterOS 6.43+
+        )
+        api = pool.get_api()
+        return _PooledConnection(pool, api, credentials.password)
+
+    def _release(self, key: PoolKey, conn: _PooledConnection, broken: bool):
+        conn.last_used = time.monotonic()
+        if broken or not conn.pool.connected:
+            conn.close()
+            conn = None
+        with self._cond:
+            self._in_use[key] -= 1
+            if conn is not None:
+                self._idle.setdefault(key, []).append(conn)
+            self._cond.notify_all()
+
+    def _evict_idle_locked(self, key: PoolKey):
+        idle = self._idle.get(key)
+        if not idle:
+            return
+        now = time.monotonic()
+        keep = []
+        for conn in idle:
+            if now - conn.last_used > self.idle_timeout:
+                conn.close()
+            else:
+                keep.append(conn)
+        self._idle[key] = keep
+
+    def evict_idle(self):
+        """Cierra las conexiones ociosas vencidas de todos los routers"""
+        with self._cond:
+            for key in list(self._idle):
+                self._evict_idle_locked(key)
+
+    def discard(self, credentials: Any):
+        """Cierra las conexiones ociosas de un router (ej. cambió su configuración)"""
+        key = pool_key(credentials)
+        with self._cond:
+            for conn in self._idle.pop(key, []):
+                conn.close()
+
+    def close_all(self):
+        with self._cond:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            keys = set(self._idle) | set(self._in_use)
+            return {
+                f"{k[2]}@{k[0]}:{k[1]}": {
+                    "idle": len(self._idle.get(k, [])),
+                    "in_use": self._in_use.get(k, 0),
+                }
+                for k in keys
+            }
+
+
+# Errores que dejan la conexión multiplexada inutilizable
+_TRANSPORT_ERRORS = (
+    RouterOsFatalError, RouterOsTimeoutError, asyncio.TimeoutError, OSError, ConnectionError,
+)
+
+
+class AsyncRouterConnectionPool:
+    """
+    Pool asíncrono: una conexión multiplexada por router.
+
+    Las órdenes concurrentes al mismo router viajan por la misma conexión con
+    tags distintos; `max_per_router` limita cuántas hay en vuelo a la vez.
+    """
+
+    def __init__(
+        self,
+        max_per_router: int = 4,
+        idle_timeout: float = 300,
+        health_check_interval: float = 30,
+        connect_timeout: float = 10,
+        read_timeout: float = 30,
+        max_pending: int = MAX_PENDING_SENTENCES,
+    ):
+        self.max_per_router = max_per_router
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        # Valores por defecto; RouterConfig puede traer los suyos
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_pending = max_pending
+
+        self._conns: Dict[PoolKey, AsyncRouterOsApi] = {}
+        self._passwords: Dict[PoolKey, str] = {}
+        self._locks: Dict[PoolKey, asyncio.Lock] = {}
+        self._slots: Dict[PoolKey, asyncio.Semaphore] = {}
+        self._in_use: Dict[PoolKey, int] = {}
+
+    @asynccontextmanager
+    async def connection(self, credentials: Any):
+        """Presta la conexión del router; se reconecta si estaba caída"""
+        key = pool_key(credentials)
+        slots = self._slots.setdefault(key, asyncio.Semaphore(self.max_per_router))
+        async with slots:
+            api = await self._get(key, credentials)
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            try:
+                yield api
+            except _TRANSPORT_ERRORS:
+                # Error de red o timeout: la conexión puede haber quedado a medias.
+                # Los `!trap` y los errores del propio llamador no la invalidan.
+                await self._drop(key, api)
+                raise
+            finally:
+                self._in_use[key] -= 1
+
+    def _timeouts(self, credentials: Any) -> Tuple[float, float]:
+        return (
+            getattr(credentials, 'connect_timeout', None) or self.connect_timeout,
+            getattr(credentials, 'read_timeout', None) or self.read_timeout,
+        )
+
+    async def _get(self, key: PoolKey, credentials: Any) -> AsyncRouterOsApi:
+        connect_timeout, read_timeout = self._timeouts(credentials)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            api = self._conns.get(key)
+            if api is not None and not await self._is_reusable(key, api, credentials):
+                await self._drop(key, api)
+                api = None
+            if api is None:
+                host, port, username, use_ssl, ssl_verify = key
+                api = await AsyncRouterOsApi.connect(
+                    host, port, username, credentials.password,
+                    use_ssl=use_ssl, ssl_verify=ssl_verify, timeout=connect_timeout, read_timeout=read_timeout,
+                    max_pending=self.max_pending,
+                )
+                self._conns[key] = api
+                self._passwords[key] = credentials.password
+            api.read_timeout = read_timeout
+            return api
+
+    async def _is_reusable(self, key: PoolKey, api: AsyncRouterOsApi, credentials: Any) -> bool:
+        if api.closed or self._passwords.get(key) != credentials.password:
+            return False
+        if time.monotonic() - api.last_used < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(api.get_resource('/system/identity').get(), self._timeouts(credentials)[0])
+            return True
+        except Exception as e:
+            logger.info(f"Conexión ociosa a {credentials.host} inválida, reconectando: {e}")
+            return False
+
+    async def _drop(self, key: PoolKey, api: AsyncRouterOsApi):
+        if self._conns.get(key) is api:
+            del self._conns[key]
+        await api.close()
+
+    async def evict_idle(self):
+        """Cierra las conexiones sin uso por más de `idle_timeout`"""
+        now = time.monotonic()
+        for key, api in list(self._conns.items()):
+            if not self._in_use.get(key) and now - api.last_used > self.idle_timeout:
+                await self._drop(key, api)
+
+    async def discard(self, credentials: Any):
+        key = pool_key(credentials)
+        api = self._conns.get(key)
+        if api is not None:
+            await self._drop(key, api)
+
+    async def close_all(self):
+        for key, api in list(self._conns.items()):
+            await self._drop(key, api)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            f"{k[2]}@{k[0]}:{k[1]}": {
+                "connected": int(not api.closed),
+                "in_use": self._in_use.get(k, 0),
+            }
+            for k, api in self._conns.items()
+        }
+
+
+# Global instance
+router_pool = RouterConnectionPool(
+    max_per_router=settings.ROUTEROS_POOL_MAX_PER_ROUTER,
+    idle_timeout=settings.ROUTEROS_POOL_IDLE_SECONDS,
+    health_check_interval=settings.ROUTEROS_POOL_HEALTHCHECK_SECONDS,
+    acquire_timeout=settings.ROUTEROS_POOL_ACQUIRE_TIMEOUT,
+)
+async_router_pool = AsyncRouterConnectionPool(
+    max_per_router=settings.ROUTEROS_POOL_MAX_PER_ROUTER,
+    idle_timeout=settings.ROUTEROS_POOL_IDLE_SECONDS,
+    health_check_interval=settings.ROUTEROS_POOL_HEALTHCHECK_SECONDS,
+    connect_timeout=settings.ROUTEROS_CONNECT_TIMEOUT,
+    read_timeout=settings.ROUTEROS_READ_TIMEOUT,
+    max_pending=settings.ROUTEROS_MAX_PENDING_SENTENCES,
+)
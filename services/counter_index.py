@@ -0,0 +1,180 @@
+"""
+Índice en memoria de los últimos contadores por (router, cola).
+
+Permite que el collector escriba solo las colas cuyos contadores cambiaron
+desde el ciclo anterior. Cada router tiene su propio índice: un dict
+nombre -> slot y columnas `array('q')` con los últimos valores, así que
+5.000 colas ocupan unos cientos de KB.
+
+Cada COLLECTOR_KEYFRAME_CYCLES ciclos se escribe un "keyframe" con todas las
+colas, para que las consultas por rango siempre encuentren un valor reciente.
+Una cola que no se escribió en un ciclo conserva los valores de su último
+punto (la cola que deja de cambiar se escribe una vez más, con rate y
+promedios en 0): las consultas completan esos huecos con el último valor
+mientras no tenga más de `carry_seconds()`.
+
+Con los contadores y el instante de la muestra anterior también se calculan
+los promedios reales del intervalo (`*_avg_bps`, `*_pps`), en lugar de
+depender del `rate` instantáneo o de `derivative()` en Flux.
+"""
+import time
+from array import array
+from calendar import timegm
+from typing import Dict, List
+from core.config import settings
+from models.samples import QueueSamples
+
+# Contadores que se comparan para decidir si una cola cambió
+_COUNTERS = (
+    'upload_bytes', 'download_bytes',
+    'upload_packets', 'download_packets',
+    'dropped_upload', 'dropped_download',
+)
+
+
+class RouterCounterIndex:
+    """Últimos contadores de las colas de un router"""
+
+    def __init__(self, keyframe_cycles: int):
+        self.keyframe_cycles = max(1, keyframe_cycles)
+        self.cycle = 0
+        self.keyframe = True
+        self._slots: Dict[str, int] = {}
+        self._seen = array('q')  # Último ciclo en que apareció cada slot
+        self._counters = {name: array('q') for name in _COUNTERS}
+        self._last_ts = array('d')  # Instante (epoch) de la muestra anterior
+        self._active = array('b')  # 1 si el último punto escrito tenía rate o promedios > 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def begin_cycle(self) -> bool:
+        """Abre un ciclo de recolección; devuelve True si toca keyframe"""
+        self.cycle += 1
+        self.keyframe = not self._slots or self.cycle % self.keyframe_cycles == 0
+        return self.keyframe
+
+    def abort_cycle(self):
+        """Ciclo cortado por un error: el próximo repite el número (y el keyframe, si tocaba)"""
+        self.cycle -= 1
+
+    def end_cycle(self):
+        """En los keyframes se olvidan las colas que ya no existen en el router"""
+        if self.keyframe and len(self._seen) > sum(1 for s in self._seen if s == self.cycle):
+            self._compact()
+
+    def update(self, samples: QueueSamples, changed_only: bool = True) -> QueueSamples:
+        """
+        Actualiza el índice con el lote, completa los promedios del intervalo
+        y devuelve las filas a escribir.
+
+        Con `changed_only` solo quedan las colas nuevas, con contadores
+        distintos, o que dejaron de tener tráfico (para registrar el rate y
+        los promedios en 0). En un keyframe se devuelve todo el lote.
+        """
+        now = timegm(samples.timestamp.utctimetuple()) if samples.timestamp else time.time()
+        slots = self._slots
+        seen = self._seen
+        last_ts = self._last_ts
+        counters = [(self._counters[name], getattr(samples, name)) for name in _COUNTERS]
+        (last_up_bytes, up_bytes), (last_down_bytes, down_bytes), \
+            (last_up_packets, up_packets), (last_down_packets, down_packets) = counters[:4]
+        active = self._active
+        upload_bps = samples.upload_bps
+        download_bps = samples.download_bps
+        cycle = self.cycle
+        emit: List[int] = []
+
+        for i, name in enumerate(samples.names):
+            is_active = 1 if upload_bps[i] or download_bps[i] else 0
+            slot = slots.get(name)
+            if slot is None:
+                slots[name] = len(seen)
+                seen.append(cycle)
+                for last, current in counters:
+                    last.append(current[i])
+                last_ts.append(now)
+                active.append(is_active)
+                emit.append(i)
+                continue
+
+            elapsed = now - last_ts[slot]
+            if elapsed > 0:
+                samples.upload_avg_bps[i] = int(counter_delta(last_up_bytes[slot], up_bytes[i]) * 8 / elapsed)
+                samples.download_avg_bps[i] = int(counter_delta(last_down_bytes[slot], down_bytes[i]) * 8 / elapsed)
+                samples.upload_pps[i] = int(counter_delta(last_up_packets[slot], up_packets[i]) / elapsed)
+                samples.download_pps[i] = int(counter_delta(last_down_packets[slot], down_packets[i]) / elapsed)
+            last_ts[slot] = now
+
+            differs = False
+            for last, current in counters:
+                if last[slot] != current[i]:
+                    last[slot] = current[i]
+                    differs = True
+            seen[slot] = cycle
+            if not changed_only or self.keyframe or differs or is_active or active[slot]:
+                emit.append(i)
+            # Contadores que avanzaron dejan promedios > 0 en el punto escrito
+            active[slot] = is_active or differs
+
+        if len(emit) == len(samples):
+            return samples
+        return samples.take(emit)
+
+    def _compact(self):
+        keep = [(name, slot) for name, slot in self._slots.items() if self._seen[slot] == self.cycle]
+        self._slots = {name: new for new, (name, _) in enumerate(keep)}
+        self._seen = array('q', (self.cycle for _ in keep))
+        self._counters = {
+            column: array('q', (values[slot] for _, slot in keep))
+            for column, values in self._counters.items()
+        }
+        self._last_ts = array('d', (self._last_ts[slot] for _, slot in keep))
+        self._active = array('b', (self._active[slot] for _, slot in keep))
+
+
+def counter_delta(last: int, current: int) -> int:
+    """
+    Avance de un contador acumulativo. Si bajó, el contador se reinició
+    (reset de la cola o reboot del router): lo contado desde entonces es el
+    valor actual.
+    """
+    return current - last if current >= last else current
+
+
+def carry_seconds() -> int:
+    """
+    Hasta cuánto tiempo el último punto escrito de una cola sigue siendo su
+    valor actual. Con escritura delta, un keyframe (más un intervalo de
+    margen): un punto más viejo es de una cola borrada o de un corte de la
+    recolección. Sin delta se escribe todo en cada ciclo: dos intervalos.
+    """
+    interval = settings.COLLECTOR_INTERVAL_SECONDS
+    if not settings.COLLECTOR_DELTA_ENABLED:
+        return 2 * interval
+    return (max(1, settings.COLLECTOR_KEYFRAME_CYCLES) + 1) * interval
+
+
+class CounterIndex:
+    """Índices por router, creados a demanda"""
+
+    def __init__(self, keyframe_cycles: int):
+        self.keyframe_cycles = keyframe_cycles
+        self._routers: Dict[str, RouterCounterIndex] = {}
+
+    def for_router(self, alias: str) -> RouterCounterIndex:
+        index = self._routers.get(alias)
+        if index is None:
+            index = self._routers[alias] = RouterCounterIndex(self.keyframe_cycles)
+        return index
+
+    def discard(self, alias: str):
+        """Olvida un router (p. ej. al sacarlo del inventario)"""
+        self._routers.pop(alias, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {alias: len(index) for alias, index in self._routers.items()}
+
+
+# Global Instance
+counter_index = CounterIndex(settings.COLLECTOR_KEYFRAME_CYCLES)
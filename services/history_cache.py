@@ -0,0 +1,124 @@
+"""
+Caché de resultados de las consultas de historial.
+
+Los datos de un usuario cambian una vez por intervalo de recolección, así
+que refrescar el portal no debería repetir la misma consulta Flux. Las
+entradas se guardan por (usuario, rango, agregación) con TTL y límite de
+tamaño (LRU). Cuando el writer confirma la escritura de un lote del
+collector, se invalidan las entradas de los usuarios de ese lote.
+
+Si varias requests piden la misma clave a la vez, se hace una sola consulta
+y el resto espera su resultado.
+
+En modo multiproceso la escritura ocurre en otros procesos y no llega la
+invalidación: ahí las entradas duran solo el TTL.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Set, Tuple
+from core.config import settings
+
+CacheKey = Tuple[str, ...]  # (usuario, rango, every, fn)
+
+
+class HistoryCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._by_user: Dict[str, Set[CacheKey]] = {}
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._stale: Set[CacheKey] = set()  # Invalidadas mientras se consultaban
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    async def get_or_load(self, key: CacheKey, load: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await load()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if time.monotonic() < expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._remove(key)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await load()
+        except BaseException as e:
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()  # Marcada como leída si nadie más esperaba
+            else:
+                future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            # También si la consulta falló o se canceló, para no dejar la marca colgada
+            stale = key in self._stale
+            self._stale.discard(key)
+        future.set_result(value)
+        if not stale:
+            self._store(key, value)  # Si llegaron datos nuevos durante la consulta no se guarda
+        return value
+
+    def _store(self, key: CacheKey, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: CacheKey):
+        self._entries.pop(key, None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def invalidate(self, usernames: Iterable[str]):
+        """Descarta las entradas de los usuarios con datos recién escritos"""
+        if not self._by_user and not self._inflight:
+            return
+        names = set(usernames)
+        for name in names.intersection(self._by_user):
+            keys = self._by_user.pop(name)
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += len(keys)
+        if self._inflight:
+            self._stale.update(k for k in self._inflight if k[0] in names)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global Instance
+history_cache = HistoryCache(
+    ttl=settings.HISTORY_CACHE_TTL_SECONDS,
+    max_entries=settings.HISTORY_CACHE_MAX_ENTRIES,
+)
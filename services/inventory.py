@@ -0,0 +1,105 @@
+"""
+Inventario de routers con caché y recarga en caliente.
+
+El inventario se parsea y valida una sola vez. `reload()` se llama por
+polling: si el archivo no cambió (mtime y tamaño) no se lee, y si se leyó
+pero el contenido tiene el mismo hash no se vuelve a validar. Cuando cambia,
+devuelve la diferencia (routers agregados, quitados y modificados) para que
+el collector solo toque lo que cambió.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from models.router_config import RouterConfig
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryDiff:
+    __slots__ = ('added', 'removed', 'changed')
+
+    def __init__(self):
+        self.added: List[RouterConfig] = []
+        self.removed: List[RouterConfig] = []
+        self.changed: List[Tuple[RouterConfig, RouterConfig]] = []  # (anterior, nuevo)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self) -> str:
+        return f"+{len(self.added)} -{len(self.removed)} ~{len(self.changed)}"
+
+
+class RouterInventory:
+    def __init__(self, path: str, env_json: Optional[str] = None):
+        self.path = path
+        self.env_json = env_json
+        self._routers: Dict[str, RouterConfig] = {}
+        self._stamp: Optional[Tuple[int, int]] = None  # (mtime_ns, tamaño) del archivo leído
+        self._digest: Optional[str] = None
+        self._loaded = False
+
+    def routers(self) -> List[RouterConfig]:
+        """Inventario actual (se carga la primera vez que se pide)"""
+        if not self._loaded:
+            self.reload()
+        return list(self._routers.values())
+
+    def reload(self) -> InventoryDiff:
+        """Relee el inventario si cambió y devuelve la diferencia con el anterior"""
+        diff = InventoryDiff()
+        try:
+            raw = self._read_if_changed()
+            self._loaded = True
+            if raw is None:
+                return diff
+            digest = hashlib.sha256(raw).hexdigest()
+            if digest == self._digest:
+                return diff
+            routers = {}
+            for item in json.loads(raw):
+                router = RouterConfig(**item)
+                routers[router.alias] = router
+        except Exception as e:
+            # Un archivo a medio editar no vacía el inventario: se sigue con el anterior
+            logger.error(f"Error cargando inventario de routers: {e}")
+            self._loaded = True
+            return diff
+
+        for alias, router in routers.items():
+            previous = self._routers.get(alias)
+            if previous is None:
+                diff.added.append(router)
+            elif previous != router:
+                diff.changed.append((previous, router))
+        diff.removed = [r for alias, r in self._routers.items() if alias not in routers]
+
+        self._routers = routers
+        self._digest = digest
+        return diff
+
+    def _read_if_changed(self) -> Optional[bytes]:
+        # 1. Variable de entorno (no cambia en caliente, pero se carga igual)
+        if self.env_json:
+            return self.env_json.encode()
+
+        # 2. Archivo JSON
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._stamp = None
+            return b'[]'
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return None
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self._stamp = stamp
+        return data
+
+
+# Global Instance
+router_inventory = RouterInventory(settings.ROUTERS_JSON_PATH, settings.ROUTERS_JSON_ENV)
@@ -0,0 +1,213 @@
+"""
+Última foto de las colas de cada router, en memoria.
+
+El collector arma la foto de un router a medida que llegan los lotes y la
+publica completa al final del ciclo, con los totales ya sumados. Así las
+preguntas sobre el estado "actual" (carga de la red, consumo actual de un
+usuario) se responden sin consultar InfluxDB. Si un ciclo falla, queda
+publicada la foto anterior con su timestamp.
+
+Cada foto también lleva los top-N de colas por download_bps, upload_bps y
+paquetes descartados en el intervalo (`dropped`). Se arman con un min-heap
+acotado a medida que llegan los lotes, y al publicar una foto se recalcula
+el top global uniendo los top de cada router. Consultar un top no recorre
+las colas.
+"""
+import heapq
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from core.config import settings
+from models.samples import QueueSamples
+from services.counter_index import counter_delta
+
+# Columnas que se suman en los totales por router
+TOTAL_COLUMNS = ('upload_bps', 'download_bps', 'upload_avg_bps', 'download_avg_bps', 'upload_pps', 'download_pps')
+# Rankings de top talkers; `dropped` son los paquetes descartados desde la foto anterior
+TOP_METRICS = ('download_bps', 'upload_bps', 'dropped')
+
+
+def _push(heap: List[Tuple[int, str]], size: int, value: int, name: str):
+    """Agrega a un min-heap acotado a `size` (el llamador ya comparó con el mínimo)"""
+    if len(heap) < size:
+        heapq.heappush(heap, (value, name))
+    else:
+        heapq.heapreplace(heap, (value, name))
+
+
+class RouterSnapshot:
+    __slots__ = ('alias', 'timestamp', 'updated_at', 'chunks', 'index', 'totals', 'top', 'top_n', 'previous')
+
+    def __init__(self, alias: str, timestamp: Optional[datetime], top_n: int = 0,
+                 previous: Optional["RouterSnapshot"] = None):
+        self.alias = alias
+        self.timestamp = timestamp
+        self.updated_at = 0.0  # time.monotonic() al publicarse
+        self.chunks: List[QueueSamples] = []
+        self.index: Dict[str, Tuple[int, int]] = {}  # nombre -> (lote, fila)
+        self.totals: Dict[str, int] = {}
+        self.top_n = top_n
+        # Mientras se arma: min-heaps de (valor, nombre); al publicarse, listas de mayor a menor
+        self.top: Dict[str, List[Tuple[int, str]]] = {metric: [] for metric in TOP_METRICS}
+        self.previous = previous  # Foto anterior, para los descartes del intervalo
+
+    def add(self, samples: QueueSamples):
+        chunk = len(self.chunks)
+        self.chunks.append(samples)
+        for row, name in enumerate(samples.names):
+            self.index[name] = (chunk, row)
+        if self.top_n:
+            self._rank(samples)
+
+    def _rank(self, samples: QueueSamples):
+        size = self.top_n
+        for metric in ('download_bps', 'upload_bps'):
+            heap = self.top[metric]
+            for value, name in zip(getattr(samples, metric), samples.names):
+                if value and (len(heap) < size or value > heap[0][0]):
+                    _push(heap, size, value, name)
+
+        previous = self.previous
+        if previous is None:
+            return
+        heap = self.top['dropped']
+        for row, name in enumerate(samples.names):
+            position = previous.index.get(name)
+            if position is None:
+                continue
+            before = previous.chunks[position[0]]
+            value = (
+                counter_delta(before.dropped_upload[position[1]], samples.dropped_upload[row])
+                + counter_delta(before.dropped_download[position[1]], samples.dropped_download[row])
+            )
+            if value and (len(heap) < size or value > heap[0][0]):
+                _push(heap, size, value, name)
+
+    def seal(self):
+        self.totals = {column: sum(sum(getattr(c, column)) for c in self.chunks) for column in TOTAL_COLUMNS}
+        self.totals["queues"] = len(self.index)
+        self.top = {metric: sorted(heap, reverse=True) for metric, heap in self.top.items()}
+        self.previous = None  # No retener la foto anterior en memoria
+        self.updated_at = time.monotonic()
+
+    def queue(self, name: str) -> Optional[Dict[str, Any]]:
+        position = self.index.get(name)
+        if position is None:
+            return None
+        chunk, row = position
+        samples = self.chunks[chunk]
+        data = {"name": name, "target_ip": samples.target_ips[row], "router_alias": self.alias}
+        for column in QueueSamples.__slots__[4:]:
+            data[column] = getattr(samples, column)[row]
+        return data
+
+
+class LatestValueStore:
+    def __init__(self, top_n: int = 0):
+        self.top_n = top_n
+        self._current: Dict[str, RouterSnapshot] = {}
+        self._pending: Dict[str, RouterSnapshot] = {}
+        # Top global: (valor, nombre, router) de mayor a menor, y routers que lo componen
+        self._global_top: Dict[str, List[Tuple[int, str, str]]] = {}
+        self._global_routers: List[RouterSnapshot] = []
+
+    def begin(self, alias: str, timestamp: Optional[datetime]):
+        self._pending[alias] = RouterSnapshot(alias, timestamp, self.top_n, self._current.get(alias))
+
+    def add(self, alias: str, samples: QueueSamples):
+        """Agrega un lote completo (todas las colas, no solo las que se escribieron)"""
+        snapshot = self._pending.get(alias)
+        if snapshot is not None:
+            snapshot.add(samples)
+
+    def commit(self, alias: str):
+        snapshot = self._pending.pop(alias, None)
+        if snapshot is not None:
+            snapshot.seal()
+            self._current[alias] = snapshot
+            self._merge_top()
+
+    def abort(self, alias: str):
+        self._pending.pop(alias, None)
+
+    def discard(self, alias: str):
+        self._current.pop(alias, None)
+        self._pending.pop(alias, None)
+        self._merge_top()
+
+    def _merge_top(self, snapshots: Optional[List[RouterSnapshot]] = None):
+        snapshots = list(self._current.values()) if snapshots is None else snapshots
+        self._global_top = {
+            metric: heapq.nlargest(self.top_n, chain.from_iterable(
+                ((value, name, s.alias) for value, name in s.top[metric]) for s in snapshots
+            ))
+            for metric in TOP_METRICS
+        }
+        self._global_routers = snapshots
+
+    def __bool__(self) -> bool:
+        return bool(self._current)
+
+    def snapshots(self, max_age: Optional[float] = None) -> List[RouterSnapshot]:
+        """Fotos publicadas; con `max_age` se omiten las de routers que dejaron de responder"""
+        now = time.monotonic()
+        return [
+            s for s in self._current.values()
+            if max_age is None or now - s.updated_at <= max_age
+        ]
+
+    def totals(self, max_age: Optional[float] = None) -> Dict[str, int]:
+        result = dict.fromkeys(TOTAL_COLUMNS, 0)
+        result["queues"] = 0
+        for snapshot in self.snapshots(max_age):
+            for key, value in snapshot.totals.items():
+                result[key] += value
+        return result
+
+    def find_queue(self, name: str, routers: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Valores actuales de una cola (puede existir con el mismo nombre en varios routers)"""
+        snapshots = self._current.values() if routers is None else [
+            self._current[a] for a in routers if a in self._current
+        ]
+        found = []
+        for snapshot in snapshots:
+            data = snapshot.queue(name)
+            if data is not None:
+                data["timestamp"] = snapshot.timestamp
+                found.append(data)
+        return found
+
+    def router(self, alias: str) -> Optional[RouterSnapshot]:
+        return self._current.get(alias)
+
+    def is_fresh(self, alias: str, max_age: float) -> bool:
+        """Hay foto publicada del router y no tiene más de `max_age` segundos"""
+        snapshot = self._current.get(alias)
+        return snapshot is not None and time.monotonic() - snapshot.updated_at <= max_age
+
+    def top(self, metric: str, alias: Optional[str] = None, limit: Optional[int] = None,
+            max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Colas con mayor `metric`, de un router o de toda la red"""
+        limit = self.top_n if limit is None else min(limit, self.top_n)
+        if alias is not None:
+            snapshot = self._current.get(alias)
+            if snapshot is None:
+                return []
+            return [
+                {"name": name, "router_alias": alias, "value": value}
+                for value, name in snapshot.top[metric][:limit]
+            ]
+        if max_age is not None:
+            oldest = time.monotonic() - max_age
+            if any(s.updated_at < oldest for s in self._global_routers):
+                # Algún router dejó de responder: el top global sin él
+                self._merge_top(self.snapshots(max_age))
+        return [
+            {"name": name, "router_alias": router_alias, "value": value}
+            for value, name, router_alias in self._global_top.get(metric, [])[:limit]
+        ]
+
+
+# Global Instance
+latest_store = LatestValueStore(top_n=settings.TOP_TALKERS_SIZE)
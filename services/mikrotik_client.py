@@ -1,5 +1,5 @@
-import routeros_api
 import csv
+from contextlib import contextmanager
 from io import StringIO
 from typing import List, Optional, Dict, Any
 from models.mikrotik import (
@@ -13,6 +13,40 @@ from models.mikrotik import (
     DhcpLease,
     LogEntry
 )
+from services.connection_pool import router_pool
+
+# Columnas que usa el modelo Queue; el resto de atributos no viaja por la red
+QUEUE_PROPLIST = ('.id', 'name', 'target', 'max-limit', 'rate', 'bytes', 'packets', 'dropped', 'comment', 'disabled')
+
+
+def print_rows(resource, proplist=None, queries=None) -> List[Dict[str, Any]]:
+    """
+    '/print' con proyección ('=.proplist=') y filtro en el router ('?k=v').
+
+    Nota: routeros_api devuelve la clave '.id' como 'id'.
+    """
+    arguments = {'.proplist': ','.join(proplist)} if proplist else {}
+    return resource.call('print', arguments, queries or {})
+
+
+def find_row(resource, key: str, value: str, proplist) -> Optional[Dict[str, Any]]:
+    """
+    Busca una fila por `key` sin descargar la tabla completa.
+
+    Primero filtra en el router con '?key=value'; si no hay coincidencia exacta
+    compara sin distinguir mayúsculas descargando solo las columnas '.id' y `key`.
+    """
+    rows = print_rows(resource, proplist, {key: value})
+    if rows:
+        return rows[0]
+
+    wanted = value.lower()
+    for row in print_rows(resource, ('.id', key)):
+        if row.get(key, '').lower() == wanted:
+            row_id = row.get('.id') or row.get('id')
+            rows = print_rows(resource, proplist, {'.id': row_id})
+            return rows[0] if rows else None
+    return None
 
 
 class MikrotikClient:
@@ -20,71 +54,31 @@ class MikrotikClient:
 
     def __init__(self, credentials: MikrotikCredentials):
         self.credentials = credentials
-        self.connection = None
-
-    def connect(self) -> routeros_api.RouterOsApiPool:
-        """Establece conexión con el RouterOS"""
-        try:
-            port = self.credentials.port
-            use_ssl = self.credentials.use_ssl
-            ssl_verify = self.credentials.ssl_verify
-
-            if use_ssl:
-                # Si se usa SSL y el puerto es el por defecto no seguro, se cambia al puerto seguro por defecto
-                if port == 8728:
-                    port = 8729
-                # Para entornos de desarrollo o internos, es común usar certificados autofirmados
-                # no verificables. Forzamos la no verificación si se usa SSL.
-                ssl_verify = False
-
-                self.connection = routeros_api.RouterOsApiPool(
-                    host=self.credentials.host,
-                    username=self.credentials.username,
-                    password=self.credentials.password,
-                    port=port,
-                    use_ssl=True,
-                    ssl_verify=ssl_verify,
-                    plaintext_login=True
-                )
-            else:
-                self.connection = routeros_api.RouterOsApiPool(
-                    host=self.credentials.host,
-                    username=self.credentials.username,
-                    password=self.credentials.password,
-                    port=port,
-                    plaintext_login=True
-                )
-            return self.connection
-        except Exception as e:
-            raise Exception(f"Error al conectar con RouterOS: {str(e)}")
-
-    def disconnect(self):
-        """Cierra la conexión con el RouterOS"""
-        if self.connection:
-            try:
-                self.connection.disconnect()
-            except:
-                pass
-            finally:
-                self.connection = None
+        self._held = None
+        self._held_cm = None
+
+    @contextmanager
+    def _api(self):
+        """Presta una conexión del pool compartido (o la retenida por el context manager)"""
+        if self._held is not None:
+            yield self._held
+            return
+        with router_pool.connection(self.credentials) as api:
+            yield api
 
     def verify_connection(self) -> ConnectionStatus:
         """Verifica la conexión al RouterOS y obtiene información básica"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            # Obtener identidad del router
-            identity_resource = api.get_resource('/system/identity')
-            identity_data = identity_resource.get()
-            router_identity = identity_data[0].get('name', 'Unknown') if identity_data else 'Unknown'
+            with self._api() as api:
+                # Obtener identidad del router
+                identity_resource = api.get_resource('/system/identity')
+                identity_data = identity_resource.get()
+                router_identity = identity_data[0].get('name', 'Unknown') if identity_data else 'Unknown'
 
-            # Obtener versión de RouterOS
-            resource_resource = api.get_resource('/system/resource')
-            resource_data = resource_resource.get()
-            version = resource_data[0].get('version', 'Unknown') if resource_data else 'Unknown'
-
-            self.disconnect()
+                # Obtener versión de RouterOS
+                resource_resource = api.get_resource('/system/resource')
+                resource_data = resource_resource.get()
+                version = resource_data[0].get('version', 'Unknown') if resource_data else 'Unknown'
 
             return ConnectionStatus(
                 success=True,
@@ -101,23 +95,19 @@ class MikrotikClient:
     def get_queues(self) -> QueueListResponse:
         """Obtiene la lista de todas las queues simples"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            queue_resource = api.get_resource('/queue/simple')
-            queues_data = queue_resource.get()
-
-            queues = []
-            for queue_data in queues_data:
-                try:
-                    queue = Queue(**queue_data)
-                    queues.append(queue)
-                except Exception as e:
-                    # Log pero continúa con las demás queues
-                    print(f"Error procesando queue: {e}")
-                    continue
-
-            self.disconnect()
+            with self._api() as api:
+                queue_resource = api.get_resource('/queue/simple')
+                queues_data = print_rows(queue_resource, QUEUE_PROPLIST)
+
+                queues = []
+                for queue_data in queues_data:
+                    try:
+                        queue = Queue(**queue_data)
+                        queues.append(queue)
+                    except Exception as e:
+                        # Log pero continúa con las demás queues
+                        print(f"Error procesando queue: {e}")
+                        continue
 
             return QueueListResponse(
                 success=True,
@@ -134,20 +124,12 @@ class MikrotikClient:
     def search_queue_by_name(self, name: str) -> QueueSearchResponse:
         """Busca una queue por su nombre"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            queue_resource = api.get_resource('/queue/simple')
-            queues_data = queue_resource.get()
-
-            # Buscar queue por nombre (case insensitive)
-            found_queue = None
-            for queue_data in queues_data:
-                if queue_data.get('name', '').lower() == name.lower():
-                    found_queue = Queue(**queue_data)
-                    break
+            with self._api() as api:
+                queue_resource = api.get_resource('/queue/simple')
 
-            self.disconnect()
+                # Buscar queue por nombre (case insensitive) filtrando en el router
+                queue_data = find_row(queue_resource, 'name', name, QUEUE_PROPLIST)
+                found_queue = Queue(**queue_data) if queue_data else None
 
             if found_queue:
                 return QueueSearchResponse(
@@ -172,27 +154,23 @@ class MikrotikClient:
     def get_arp_list(self) -> Dict[str, Any]:
         """Obtiene la lista completa de entradas ARP"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            arp_resource = api.get_resource('/ip/arp')
-            arp_data = arp_resource.get()
-
-            arp_entries = []
-            for entry in arp_data:
-                arp_entries.append({
-                    'address': entry.get('address', ''),
-                    'mac_address': entry.get('mac-address', ''),
-                    'interface': entry.get('interface', ''),
-                    'status': entry.get('status', ''),
-                    'published': entry.get('published', ''),
-                    'invalid': entry.get('invalid', ''),
-                    'DHCP': entry.get('DHCP', ''),
-                    'dynamic': entry.get('dynamic', ''),
-                    'complete': entry.get('complete', '')
-                })
-
-            self.disconnect()
+            with self._api() as api:
+                arp_resource = api.get_resource('/ip/arp')
+                arp_data = arp_resource.get()
+
+                arp_entries = []
+                for entry in arp_data:
+                    arp_entries.append({
+                        'address': entry.get('address', ''),
+                        'mac_address': entry.get('mac-address', ''),
+                        'interface': entry.get('interface', ''),
+                        'status': entry.get('status', ''),
+                        'published': entry.get('published', ''),
+                        'invalid': entry.get('invalid', ''),
+                        'DHCP': entry.get('DHCP', ''),
+                        'dynamic': entry.get('dynamic', ''),
+                        'complete': entry.get('complete', '')
+                    })
 
             return {
                 'success': True,
@@ -210,34 +188,30 @@ class MikrotikClient:
     def export_arp_to_csv(self) -> Dict[str, Any]:
         """Exporta la tabla ARP a formato CSV"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            arp_resource = api.get_resource('/ip/arp')
-            arp_data = arp_resource.get()
-
-            # Crear CSV en memoria
-            output = StringIO()
-            csv_writer = csv.writer(output)
-
-            # Escribir encabezados
-            csv_writer.writerow(['IP Address', 'MAC Address', 'Interface', 'Status', 'Published', 'Invalid', 'DHCP', 'Dynamic', 'Complete'])
-
-            # Escribir datos
-            for entry in arp_data:
-                csv_writer.writerow([
-                    entry.get('address', ''),
-                    entry.get('mac-address', ''),
-                    entry.get('interface', ''),
-                    entry.get('status', ''),
-                    entry.get('published', ''),
-                    entry.get('invalid', ''),
-                    entry.get('DHCP', ''),
-                    entry.get('dynamic', ''),
-                    entry.get('complete', '')
-                ])
-
-            self.disconnect()
+            with self._api() as api:
+                arp_resource = api.get_resource('/ip/arp')
+                arp_data = arp_resource.get()
+
+                # Crear CSV en memoria
+                output = StringIO()
+                csv_writer = csv.writer(output)
+
+                # Escribir encabezados
+                csv_writer.writerow(['IP Address', 'MAC Address', 'Interface', 'Status', 'Published', 'Invalid', 'DHCP', 'Dynamic', 'Complete'])
+
+                # Escribir datos
+                for entry in arp_data:
+                    csv_writer.writerow([
+                        entry.get('address', ''),
+                        entry.get('mac-address', ''),
+                        entry.get('interface', ''),
+                        entry.get('status', ''),
+                        entry.get('published', ''),
+                        entry.get('invalid', ''),
+                        entry.get('DHCP', ''),
+                        entry.get('dynamic', ''),
+                        entry.get('complete', '')
+                    ])
 
             csv_content = output.getvalue()
             output.close()
@@ -256,29 +230,27 @@ class MikrotikClient:
             }
 
     def __enter__(self):
-        """Context manager support"""
-        self.connect()
+        """Context manager: retiene una sola conexión del pool para varias operaciones"""
+        self._held_cm = router_pool.connection(self.credentials)
+        self._held = self._held_cm.__enter__()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager support"""
-        self.disconnect()
+        cm, self._held_cm, self._held = self._held_cm, None, None
+        return cm.__exit__(exc_type, exc_val, exc_tb)
 
     def get_system_resources(self) -> Dict[str, Any]:
         """Obtiene información de recursos del sistema"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            # Obtener recursos (/system/resource)
-            resource_res = api.get_resource('/system/resource')
-            resource_data = resource_res.get()
-            
-            # Obtener info del board (/system/routerboard)
-            board_res = api.get_resource('/system/routerboard')
-            board_data = board_res.get()
+            with self._api() as api:
+                # Obtener recursos (/system/resource)
+                resource_res = api.get_resource('/system/resource')
+                resource_data = resource_res.get()
 
-            self.disconnect()
+                # Obtener info del board (/system/routerboard)
+                board_res = api.get_resource('/system/routerboard')
+                board_data = board_res.get()
 
             if not resource_data:
                 return {'success': False, 'message': 'No se pudo obtener system resource'}
@@ -308,17 +280,13 @@ class MikrotikClient:
     def get_interfaces(self) -> Dict[str, Any]:
         """Obtiene estadísticas de interfaces"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            # Obtener interfaces con stats
-            # El endpoint /interface/print devuelve stats por defecto en la API
-            # pero a veces es necesario solicitar detalle.
-            # En routeros_api .get() suele traer todo.
-            interface_res = api.get_resource('/interface')
-            interfaces_data = interface_res.get()
-
-            self.disconnect()
+            with self._api() as api:
+                # Obtener interfaces con stats
+                # El endpoint /interface/print devuelve stats por defecto en la API
+                # pero a veces es necesario solicitar detalle.
+                # En routeros_api .get() suele traer todo.
+                interface_res = api.get_resource('/interface')
+                interfaces_data = interface_res.get()
 
             stats_list = []
             for iface in interfaces_data:
@@ -356,13 +324,9 @@ class MikrotikClient:
     def get_dhcp_leases(self) -> Dict[str, Any]:
         """Obtiene leases DHCP"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            lease_res = api.get_resource('/ip/dhcp-server/lease')
-            leases_data = lease_res.get()
-
-            self.disconnect()
+            with self._api() as api:
+                lease_res = api.get_resource('/ip/dhcp-server/lease')
+                leases_data = lease_res.get()
 
             leases = []
             for l in leases_data:
@@ -387,13 +351,9 @@ class MikrotikClient:
     def get_dhcp_servers(self) -> Dict[str, Any]:
         """Obtiene la lista de servidores DHCP"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            server_res = api.get_resource('/ip/dhcp-server')
-            servers_data = server_res.get()
-
-            self.disconnect()
+            with self._api() as api:
+                server_res = api.get_resource('/ip/dhcp-server')
+                servers_data = server_res.get()
 
             servers = []
             for s in servers_data:
@@ -415,21 +375,17 @@ class MikrotikClient:
     def get_logs(self) -> Dict[str, Any]:
         """Obtiene logs del sistema"""
         try:
-            connection = self.connect()
-            api = connection.get_api()
-
-            # Obtener logs (limitado para no saturar)
-            log_res = api.get_resource('/log')
-            # routeros_api no tiene 'limit' nativo en get(), pero devuelve lista.
-            # Podríamos filtrar después, o confiar en que no sean demasiados.
-            # En producción, cuidado con miles de logs.
-            logs_data = log_res.get()
-
-            # Tomar los últimos 100
-            logs_data = logs_data[-100:]
-            logs_data.reverse() # Más recientes primero
-
-            self.disconnect()
+            with self._api() as api:
+                # Obtener logs (limitado para no saturar)
+                log_res = api.get_resource('/log')
+                # routeros_api no tiene 'limit' nativo en get(), pero devuelve lista.
+                # Podríamos filtrar después, o confiar en que no sean demasiados.
+                # En producción, cuidado con miles de logs.
+                logs_data = log_res.get()
+
+                # Tomar los últimos 100
+                logs_data = logs_data[-100:]
+                logs_data.reverse() # Más recientes primero
 
             logs_list = []
             for l in logs_data:
@@ -455,72 +411,63 @@ class MikrotikClient:
             if not mac_address or not ip_address:
                 return {'success': False, 'message': 'MAC address and IP address are required'}
 
-            connection = self.connect()
-            api = connection.get_api()
-            lease_resource = api.get_resource('/ip/dhcp-server/lease')
-
-            # Obtener todos los leases y filtrar manualmente por MAC
-            all_leases = lease_resource.get()
-
-            # Buscar lease existente por MAC (normalizar MAC address a minúsculas)
-            mac_normalized = mac_address.lower()
-            existing_lease = None
-
-            for lease in all_leases:
-                lease_mac = lease.get('mac-address', '').lower()
-                if lease_mac == mac_normalized:
-                    existing_lease = lease
-                    break
-
-            if existing_lease:
-                # Si existe, actualizamos
-                lease_id = existing_lease.get('.id')
-                
-                # Fallback: intentar con 'id' si '.id' no existe (por seguridad)
-                if not lease_id:
-                    lease_id = existing_lease.get('id')
-                
-                if not lease_id:
-                    # Si no hay ID, no podemos operar. Lanzamos error con detalles.
-                    raise Exception(f"No se pudo obtener el ID del lease para MAC {mac_address}. Datos: {existing_lease}")
-
-                # Si es dinámico, hacerlo estático primero
-                if existing_lease.get('dynamic') == 'true':
-                    lease_resource.call('make-static', {'numbers': lease_id})
-
-                # Actualizar datos - IMPORTANTE: no enviar parámetros vacíos
-                update_params = {'.id': lease_id, 'address': str(ip_address)}
-
-                # Solo agregar server si tiene valor y no es vacío
-                if server is not None and str(server).strip() != '':
-                    update_params['server'] = str(server).strip()
-
-                # Solo agregar comment si tiene valor y no es vacío
-                if comment is not None and str(comment).strip() != '':
-                    update_params['comment'] = str(comment).strip()
-
-                lease_resource.set(**update_params)
-                action = "updated"
-            else:
-                # Si no existe, creamos un nuevo lease estático
-                # IMPORTANTE: Solo parámetros obligatorios
-                add_params = {
-                    'mac-address': str(mac_address).strip(),
-                    'address': str(ip_address).strip()
-                }
+            with self._api() as api:
+                lease_resource = api.get_resource('/ip/dhcp-server/lease')
+
+                # Buscar lease existente por MAC filtrando en el router.
+                # RouterOS guarda las MAC en mayúsculas.
+                existing_lease = find_row(
+                    lease_resource, 'mac-address', mac_address.strip().upper(),
+                    ('.id', 'mac-address', 'dynamic')
+                )
+
+                if existing_lease:
+                    # Si existe, actualizamos
+                    lease_id = existing_lease.get('.id')
+
+                    # Fallback: intentar con 'id' si '.id' no existe (por seguridad)
+                    if not lease_id:
+                        lease_id = existing_lease.get('id')
+
+                    if not lease_id:
+                        # Si no hay ID, no podemos operar. Lanzamos error con detalles.
+                        raise Exception(f"No se pudo obtener el ID del lease para MAC {mac_address}. Datos: {existing_lease}")
 
-                # Solo agregar server si tiene valor y no es vacío
-                if server is not None and str(server).strip() != '':
-                    add_params['server'] = str(server).strip()
+                    # Si es dinámico, hacerlo estático primero
+                    if existing_lease.get('dynamic') == 'true':
+                        lease_resource.call('make-static', {'numbers': lease_id})
 
-                # Solo agregar comment si tiene valor y no es vacío
-                if comment is not None and str(comment).strip() != '':
-                    add_params['comment'] = str(comment).strip()
+                    # Actualizar datos - IMPORTANTE: no enviar parámetros vacíos
+                    update_params = {'.id': lease_id, 'address': str(ip_address)}
 
-                lease_resource.add(**add_params)
-                action = "created"
+                    # Solo agregar server si tiene valor y no es vacío
+                    if server is not None and str(server).strip() != '':
+                        update_params['server'] = str(server).strip()
 
-            self.disconnect()
+                    # Solo agregar comment si tiene valor y no es vacío
+                    if comment is not None and str(comment).strip() != '':
+                        update_params['comment'] = str(comment).strip()
+
+                    lease_resource.set(**update_params)
+                    action = "updated"
+                else:
+                    # Si no existe, creamos un nuevo lease estático
+                    # IMPORTANTE: Solo parámetros obligatorios
+                    add_params = {
+                        'mac-address': str(mac_address).strip(),
+                        'address': str(ip_address).strip()
+                    }
+
+                    # Solo agregar server si tiene valor y no es vacío
+                    if server is not None and str(server).strip() != '':
+                        add_params['server'] = str(server).strip()
+
+                    # Solo agregar comment si tiene valor y no es vacío
+                    if comment is not None and str(comment).strip() != '':
+                        add_params['comment'] = str(comment).strip()
+
+                    lease_resource.add(**add_params)
+                    action = "created"
 
             return {
                 'success': True,
@@ -540,51 +487,38 @@ class MikrotikClient:
             if not name or not target or not max_limit:
                 return {'success': False, 'message': 'Name, target, and max_limit are required'}
 
-            connection = self.connect()
-            api = connection.get_api()
-            queue_resource = api.get_resource('/queue/simple')
-
-            # Obtener todas las queues y filtrar manualmente por nombre
-            all_queues = queue_resource.get()
-
-            # Buscar queue existente por nombre (case insensitive)
-            name_normalized = name.lower()
-            existing_queue = None
-
-            for queue in all_queues:
-                queue_name = queue.get('name', '').lower()
-                if queue_name == name_normalized:
-                    existing_queue = queue
-                    break
-
-            if existing_queue:
-                # Actualizar queue existente
-                queue_id = existing_queue.get('.id')
-
-                update_params = {
-                    '.id': queue_id,
-                    'target': str(target),
-                    'max-limit': str(max_limit)
-                }
-                if comment and str(comment).strip():
-                    update_params['comment'] = str(comment)
-
-                queue_resource.set(**update_params)
-                action = "updated"
-            else:
-                # Crear nueva queue
-                add_params = {
-                    'name': str(name),
-                    'target': str(target),
-                    'max-limit': str(max_limit)
-                }
-                if comment and str(comment).strip():
-                    add_params['comment'] = str(comment)
-
-                queue_resource.add(**add_params)
-                action = "created"
-
-            self.disconnect()
+            with self._api() as api:
+                queue_resource = api.get_resource('/queue/simple')
+
+                # Buscar queue existente por nombre (case insensitive) filtrando en el router
+                existing_queue = find_row(queue_resource, 'name', name, ('.id', 'name'))
+
+                if existing_queue:
+                    # Actualizar queue existente
+                    queue_id = existing_queue.get('.id') or existing_queue.get('id')
+
+                    update_params = {
+                        '.id': queue_id,
+                        'target': str(target),
+                        'max-limit': str(max_limit)
+                    }
+                    if comment and str(comment).strip():
+                        update_params['comment'] = str(comment)
+
+                    queue_resource.set(**update_params)
+                    action = "updated"
+                else:
+                    # Crear nueva queue
+                    add_params = {
+                        'name': str(name),
+                        'target': str(target),
+                        'max-limit': str(max_limit)
+                    }
+                    if comment and str(comment).strip():
+                        add_params['comment'] = str(comment)
+
+                    queue_resource.add(**add_params)
+                    action = "created"
 
             return {
                 'success': True,
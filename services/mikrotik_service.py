@@ -1,120 +1,75 @@
-import routeros_api
-from typing import List, Optional
-from concurrent.futures import ThreadPoolExecutor
-import asyncio
+from typing import AsyncIterator, List, Optional
+from contextlib import aclosing
+from datetime import datetime
 import logging
-from models.mikrotik import QueueMetrics
 from models.router_config import RouterConfig
+from models.samples import QueueSamples
+from services.queue_parser import parse_queue_batch
+from services.connection_pool import async_router_pool
+from services.circuit_breaker import router_breakers
 
 # Configurar logger para ver errores reales en consola
 logger = logging.getLogger(__name__)
 
+# Únicas columnas que usa el collector ('/print' trae ~30 por cola)
+QUEUE_METRICS_PROPLIST = ('name', 'target', 'bytes', 'packets', 'dropped', 'rate', 'max-limit')
 
-class MikrotikService:
-    def __init__(self):
-        # 20 workers es bueno, pero cuidado si tienes muchos routers,
-        # no satures la CPU del servidor donde corre Docker.
-        self.executor = ThreadPoolExecutor(max_workers=20)
-
-    def _parse_queue_to_metrics(self, queue_data: dict) -> Optional[QueueMetrics]:
-        """Transforma datos crudos de Mikrotik a QueueMetrics"""
-        try:
-            name = queue_data.get('name')
-            target = queue_data.get('target')
-
-            # MikroTik devuelve strings tipo "1234/5678"
-            bytes_str = queue_data.get('bytes', '0/0')
-            packets_str = queue_data.get('packets', '0/0')
-            dropped_str = queue_data.get('dropped', '0/0')
-            rate_str = queue_data.get('rate', '0/0')  # Ojo: A veces MikroTik no envía 'rate' si es 0
-
-            def split_pair(s):
-                if not s: return 0, 0
-                try:
-                    parts = s.split('/')
-                    return int(parts[0]), int(parts[1])
-                except:
-                    return 0, 0
-
-            up_bytes, down_bytes = split_pair(bytes_str)
-            up_packets, down_packets = split_pair(packets_str)
-            up_dropped, down_dropped = split_pair(dropped_str)
-            up_bps, down_bps = split_pair(rate_str)
-
-            # Limpieza de IP (quitar máscara /32 si existe)
-            target_ip = target.split('/')[0] if target else "unknown"
-
-            return QueueMetrics(
-                name=name,
-                target_ip=target_ip,
-                plan_profile="unknown",  # Podrías usar queue_data.get('comment') si ahí pones el plan
-                upload_bps=up_bps,
-                download_bps=down_bps,
-                upload_bytes=up_bytes,  # InfluxDB calculará el consumo por hora con esto
-                download_bytes=down_bytes,  # InfluxDB calculará el consumo por hora con esto
-                packet_rate_upload=0,  # DEPRECADO: Usar contadores totales abajo
-                packet_rate_download=0,  # DEPRECADO: Usar contadores totales abajo
-                dropped_packets_upload=up_dropped,
-                dropped_packets_download=down_dropped,
-
-                # CAMPOS NUEVOS RECOMENDADOS (Asegúrate de agregarlos a tu modelo QueueMetrics)
-                total_packets_upload=up_packets,  # Nuevo campo para calcular PPS en Influx
-                total_packets_download=down_packets  # Nuevo campo para calcular PPS en Influx
-            )
-        except Exception as e:
-            logger.error(f"Error parseando cola {queue_data.get('name', '?')}: {e}")
-            return None
 
-    def _fetch_queues_sync(self, router_config: RouterConfig) -> List[QueueMetrics]:
-        """Sincrónico: Conecta y extrae colas"""
-        connection = None
-        metrics = []
+class MikrotikService:
+    async def stream_queue_rows(
+        self,
+        router_config: RouterConfig,
+        batch_size: int,
+    ) -> AsyncIterator[List[dict]]:
+        """Asíncrono: Filas crudas de '/queue/simple/print' en listas de hasta `batch_size`"""
+        async with async_router_pool.connection(router_config) as api:
+            rows = api.get_resource('/queue/simple').stream(proplist=QUEUE_METRICS_PROPLIST)
+            batch = []
+            async with aclosing(rows):
+                async for q in rows:
+                    batch.append(q)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+
+    async def stream_queue_batches(
+        self,
+        router_config: RouterConfig,
+        batch_size: int,
+        timestamp: Optional[datetime] = None,
+    ) -> AsyncIterator[QueueSamples]:
+        """
+        Asíncrono: Colas en lotes de hasta `batch_size`, parseadas en columnas
+        de una sola vez a medida que llegan. No se materializa la respuesta
+        completa de '/queue/simple/print': la memoria por router no crece
+        con la cantidad de colas.
+        """
+        batches = self.stream_queue_rows(router_config, batch_size)
+        async with aclosing(batches):
+            async for batch in batches:
+                yield parse_queue_batch(batch, router_config.alias, timestamp)
+
+    async def check_connection(self, router_config: RouterConfig) -> bool:
+        """
+        Asíncrono: Verificación de conectividad para el health check.
+
+        Respeta el circuit breaker: un router con el circuito abierto se da
+        por caído sin intentar conectar hasta que toque la prueba.
+        """
+        breaker = router_breakers.for_router(router_config.alias)
+        if not breaker.allow():
+            return False
         try:
-            port = router_config.port
-            # Ajuste automático de puerto SSL si es necesario
-            if router_config.use_ssl and port == 8728:
-                port = 8729
-
-            connection = routeros_api.RouterOsApiPool(
-                host=router_config.host,
-                username=router_config.username,  # Asegúrate que tu modelo usa 'user' o 'username'
-                password=router_config.password,
-                port=port,
-                use_ssl=router_config.use_ssl,
-                plaintext_login=True  # Necesario para versiones nuevas de RouterOS (6.43+) sin SSL
-            )
-
-            api = connection.get_api()
-
-            # Obtener recurso. IMPORTANTE: No hace la llamada a red todavía.
-            queue_resource = api.get_resource('/queue/simple')
-
-            # .get() hace el '/queue/simple/print'.
-            # Para 5000 usuarios, esto es pesado.
-            queues_data = queue_resource.get()
-
-            for q in queues_data:
-                m = self._parse_queue_to_metrics(q)
-                if m:
-                    metrics.append(m)
-
-            return metrics
-
+            async with async_router_pool.connection(router_config) as api:
+                await api.get_resource('/system/identity').get(proplist=('name',))
+            breaker.record_success()
+            return True
         except Exception as e:
-            logger.error(f"Error conectando a router {router_config.alias} ({router_config.host}): {e}")
-            # Retornamos lista vacía en lugar de romper todo el proceso,
-            # así los otros routers sí se procesan.
-            return []
-
-        finally:
-            if connection:
-                connection.disconnect()
-
-    async def get_all_queues_metrics(self, router_config: RouterConfig) -> List[QueueMetrics]:
-        """Asíncrono: Wrapper para no bloquear el event loop"""
-        loop = asyncio.get_running_loop()
-        # Esto envía la tarea pesada al ThreadPool
-        return await loop.run_in_executor(self.executor, self._fetch_queues_sync, router_config)
+            breaker.record_failure(e)
+            logger.warning(f"Router {router_config.alias} ({router_config.host}) no responde: {e}")
+            return False
 
 
-mikrotik_service = MikrotikService()
\ No newline at end of file
+mikrotik_service = MikrotikService()
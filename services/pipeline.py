@@ -0,0 +1,394 @@
+"""
+Modo multiproceso del collector (COLLECTOR_MODE=process).
+
+La recolección sale del proceso de la API y se reparte en etapas, cada una
+en sus propios procesos, unidas por colas acotadas:
+
+    API (coordinador) --routers--> I/O workers --filas--> CPU workers --line protocol--> writer
+
+- Coordinador (proceso de la API): recarga el inventario, resuelve shard y
+  leases, y reparte los routers entre los I/O workers con hashing consistente.
+- I/O workers: event loop con el scheduler, el pool y los circuit breakers;
+  solo leen filas crudas de los routers.
+- CPU workers: parsean, aplican el índice de contadores y el detector de
+  anomalías, y serializan line protocol. Cada router va siempre al mismo CPU worker, así su índice vive
+  en un solo proceso.
+- Writer: escribe en el backend de almacenamiento (InfluxDB con el buffer
+  en disco de siempre, o el almacén embebido).
+
+Los lotes no viajan serializados con pickle por el pipe de la cola: se
+copian a un bloque de `shared_memory` y por la cola solo pasa su nombre. El
+consumidor lo lee y lo libera (unlink). Si una cola se llena, el productor
+espera y la espera llega hasta el socket del router (backpressure). Al
+detener el pipeline, el coordinador vacía las colas y libera los bloques que
+quedaron sin consumir (p. ej. de un proceso que hubo que forzar a cerrar).
+
+Los índices y vistas en memoria de la recolección (scheduler, breakers,
+contadores) viven en los procesos hijos y no se ven desde la API.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_module
+from contextlib import aclosing
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from core.config import settings
+from models.router_config import RouterConfig
+from services.inventory import router_inventory
+from services.sharding import HashRing, shard_assignment
+
+logger = logging.getLogger(__name__)
+
+# Mismas columnas que QUEUE_METRICS_PROPLIST, en orden fijo para el empaquetado
+_ROW_FIELDS = ('name', 'target', 'bytes', 'packets', 'dropped', 'rate', 'max-limit')
+_FIELD_SEP = '\x1f'
+_ROW_SEP = '\x1e'
+
+
+# --- Bloques en memoria compartida ---
+
+def put_shared(queue: Any, payload: bytes, *meta: Any):
+    """Copia el payload a un bloque compartido y encola (meta..., nombre, tamaño)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+    shm.buf[:len(payload)] = payload
+    name = shm.name
+    shm.close()
+    queue.put((*meta, name, len(payload)))
+
+
+def take_shared(name: str, size: int) -> bytes:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def unlink_shared(name: str) -> bool:
+    """Libera un bloque que nadie va a leer; False si ya no existía"""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    shm.unlink()
+    return True
+
+
+def drain_shared(queue: Any, block_name: Callable[[tuple], Optional[str]]) -> int:
+    """Vacía una cola y libera los bloques de sus mensajes; devuelve cuántos liberó"""
+    freed = 0
+    while True:
+        try:
+            message = queue.get(timeout=0.1)
+        except queue_module.Empty:
+            return freed
+        except (EOFError, OSError, ValueError) as e:
+            # Mensaje a medias de un proceso que se forzó a cerrar
+            logger.warning(f"No se pudo vaciar una cola del pipeline: {e}")
+            return freed
+        name = block_name(message) if message is not None else None
+        if name is not None and unlink_shared(name):
+            freed += 1
+
+
+def encode_rows(rows: List[Dict[str, str]]) -> bytes:
+    return _ROW_SEP.join(
+        _FIELD_SEP.join(row.get(field) or '' for field in _ROW_FIELDS) for row in rows
+    ).encode('utf-8')
+
+
+def decode_rows(data: bytes) -> List[Dict[str, str]]:
+    if not data:
+        return []
+    return [dict(zip(_ROW_FIELDS, line.split(_FIELD_SEP))) for line in data.decode('utf-8').split(_ROW_SEP)]
+
+
+# --- I/O worker ---
+
+def _io_worker_main(control: Any, parse_queues: List[Any]):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_io_worker(control, parse_queues))
+
+
+async def _io_worker(control: Any, parse_queues: List[Any]):
+    from services.circuit_breaker import router_breakers
+    from services.connection_pool import async_router_pool
+    from services.mikrotik_service import mikrotik_service
+    from services.scheduler import PollingScheduler
+
+    cpu_ring = HashRing(len(parse_queues))
+
+    async def collect(router: RouterConfig, timestamp: datetime) -> Optional[int]:
+        breaker = router_breakers.for_router(router.alias)
+        if not breaker.allow():
+            return None
+        target = parse_queues[cpu_ring.shard_for(router.alias)]
+        collected = 0
+        begun = False
+        router_failed = False
+        try:
+            await asyncio.to_thread(target.put, ('begin', router.alias, timestamp))
+            begun = True
+            batches = mikrotik_service.stream_queue_rows(router, settings.COLLECTOR_WRITE_CHUNK_SIZE)
+            async with aclosing(batches):
+                while True:
+                    try:
+                        rows = await anext(batches)
+                    except StopAsyncIteration:
+                        break
+                    except Exception:
+                        router_failed = True
+                        raise
+                    collected += len(rows)
+                    await asyncio.to_thread(put_shared, target, encode_rows(rows), 'rows', router.alias, timestamp)
+            await asyncio.to_thread(target.put, ('end', router.alias))
+            breaker.record_success()
+            return collected
+        except Exception as e:
+            if begun:
+                # El CPU worker cierra el ciclo como cortado
+                await asyncio.to_thread(target.put, ('abort', router.alias))
+            if router_failed:
+                # Solo los errores del router cuentan para el breaker, no los de las colas internas
+                breaker.record_failure(e)
+                logger.error(f"Error recolectando de router '{router.alias}' ({router.host}): {e}")
+            else:
+                logger.error(f"Ciclo del router '{router.alias}' cortado al pasar las filas al CPU worker: {e}")
+            return None
+
+    scheduler = PollingScheduler(
+        collect,
+        default_interval=settings.COLLECTOR_INTERVAL_SECONDS,
+        max_concurrent=settings.COLLECTOR_MAX_CONCURRENT_ROUTERS,
+    )
+    await scheduler.start()
+    assigned: Dict[str, RouterConfig] = {}
+    try:
+        while True:
+            message = await asyncio.to_thread(control.get)
+            if message[0] == 'stop':
+                break
+            if message[0] == 'run_now':
+                asyncio.create_task(scheduler.run_now())
+            elif message[0] == 'routers':
+                routers = {r.alias: r for r in (RouterConfig(**item) for item in message[1])}
+                for alias, previous in assigned.items():
+                    if routers.get(alias) != previous:
+                        # Router quitado o con datos nuevos: la conexión vieja ya no sirve
+                        await async_router_pool.discard(previous)
+                        router_breakers.discard(alias)
+                    if alias not in routers:
+                        # Quitado o movido a otro shard: el CPU worker olvida su estado
+                        target = parse_queues[cpu_ring.shard_for(alias)]
+                        await asyncio.to_thread(target.put, ('discard', alias))
+                assigned = routers
+                scheduler.sync(list(routers.values()))
+    finally:
+        await scheduler.stop()
+        await async_router_pool.close_all()
+        for target in parse_queues:
+            target.put(None)
+
+
+# --- CPU worker ---
+
+def _save_usage(alias: str, close):
+    try:
+        close()
+    except OSError as e:
+        logger.error(f"No se pudo guardar el consumo del router '{alias}': {e}")
+
+
+def _cpu_worker_main(parse_queue: Any, write_queue: Any, producers: int):
+    from core.line_protocol import serialize_alerts, serialize_samples
+    from services.anomaly_detector import anomaly_detector
+    from services.counter_index import counter_index
+    from services.queue_parser import parse_queue_batch
+    from services.usage_accounting import usage_accounting
+
+    finished = 0
+    while finished < producers:
+        message = parse_queue.get()
+        if message is None:
+            finished += 1
+            continue
+        kind, alias = message[0], message[1]
+        if kind == 'discard':
+            counter_index.discard(alias)
+            usage_accounting.discard(alias)
+            anomaly_detector.discard(alias)
+            continue
+        index = counter_index.for_router(alias)
+        usage = usage_accounting.for_router(alias)
+        anomalies = anomaly_detector.for_router(alias)
+        alerts = []
+        if kind == 'begin':
+            index.begin_cycle()
+            usage.begin_cycle(message[2])
+            anomalies.begin_cycle()
+        elif kind == 'end':
+            index.end_cycle()
+            alerts = anomalies.end_cycle()
+            _save_usage(alias, usage.end_cycle)
+        elif kind == 'abort':
+            index.abort_cycle()
+            anomalies.abort_cycle()
+            _save_usage(alias, usage.abort_cycle)
+        elif kind == 'rows':
+            timestamp, name, size = message[2:]
+            samples = parse_queue_batch(decode_rows(take_shared(name, size)), alias, timestamp)
+            usage.add(samples)
+            changed = index.update(samples, changed_only=settings.COLLECTOR_DELTA_ENABLED)
+            alerts = anomalies.check(samples)
+            payload = serialize_samples(changed)
+            if payload:
+                put_shared(write_queue, payload)
+        if alerts:
+            put_shared(write_queue, serialize_alerts(alerts))
+    write_queue.put(None)
+
+
+# --- Writer ---
+
+def _writer_main(write_queue: Any, producers: int):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_writer(write_queue, producers))
+
+
+async def _writer(write_queue: Any, producers: int):
+    from core.database import storage
+
+    await storage.start_writer()
+    finished = 0
+    try:
+        while finished < producers:
+            message = await asyncio.to_thread(write_queue.get)
+            if message is None:
+                finished += 1
+                continue
+            await storage.write_payload_async(take_shared(*message))
+    finally:
+        await storage.stop_writer()
+        storage.close()
+
+
+# --- Coordinador (proceso de la API) ---
+
+class CollectorPipeline:
+    def __init__(self, io_workers: int, cpu_workers: int, queue_size: int):
+        self.io_workers = max(1, io_workers)
+        self.cpu_workers = max(1, cpu_workers)
+        self.queue_size = queue_size
+        self.io_ring = HashRing(self.io_workers)
+        self._processes: List[multiprocessing.Process] = []
+        self._controls: List[Any] = []
+        self._parse_queues: List[Any] = []
+        self._write_queue: Optional[Any] = None
+        self._assignment: List[Tuple[str, ...]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task:
+            return
+        # Los hijos heredan por entorno el shard reclamado (COLLECTOR_SHARD_ID)
+        shard_assignment.claim()
+        # spawn: los hijos no heredan el event loop ni los hilos del cliente de InfluxDB
+        ctx = multiprocessing.get_context('spawn')
+        self._controls = [ctx.Queue() for _ in range(self.io_workers)]
+        self._parse_queues = [ctx.Queue(self.queue_size) for _ in range(self.cpu_workers)]
+        self._write_queue = ctx.Queue(self.queue_size)
+
+        self._processes = [
+            ctx.Process(target=_writer_main, args=(self._write_queue, self.cpu_workers), name="collector-writer"),
+        ] + [
+            ctx.Process(target=_cpu_worker_main, args=(q, self._write_queue, self.io_workers), name=f"collector-cpu-{i}")
+            for i, q in enumerate(self._parse_queues)
+        ] + [
+            ctx.Process(target=_io_worker_main, args=(c, self._parse_queues), name=f"collector-io-{i}")
+            for i, c in enumerate(self._controls)
+        ]
+        for process in self._processes:
+            process.daemon = True
+            process.start()
+
+        self._assign(router_inventory.routers())
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Collector multiproceso: {self.io_workers} I/O, {self.cpu_workers} CPU, 1 writer")
+
+    def _assign(self, routers: List[RouterConfig]):
+        """Reparte entre los I/O workers los routers de este shard (solo si cambió algo)"""
+        owned = shard_assignment.owned(routers)
+        parts: List[List[RouterConfig]] = [[] for _ in range(self.io_workers)]
+        for router in owned:
+            parts[self.io_ring.shard_for(router.alias)].append(router)
+        assignment = [tuple(r.model_dump_json() for r in part) for part in parts]
+        if assignment == self._assignment:
+            return
+        for control, part, previous, current in zip(self._controls, parts, self._assignment or [()] * self.io_workers, assignment):
+            if previous != current:
+                control.put(('routers', [r.model_dump() for r in part]))
+        self._assignment = assignment
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.INVENTORY_POLL_SECONDS)
+            diff = router_inventory.reload()
+            if diff:
+                logger.info(f"Inventario de routers actualizado ({diff})")
+            self._assign(router_inventory.routers())
+
+    def run_now(self):
+        """Pide a los I/O workers una recolección inmediata"""
+        for control in self._controls:
+            control.put(('run_now',))
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Las etapas se cierran en cascada: I/O -> CPU -> writer
+        for control in self._controls:
+            control.put(('stop',))
+        for process in reversed(self._processes):
+            await asyncio.to_thread(process.join, settings.COLLECTOR_PIPELINE_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"{process.name} no terminó a tiempo, se fuerza el cierre")
+                process.terminate()
+        # Con todos los procesos cerrados, lo que quedó en las colas no lo va a leer nadie
+        freed = sum(drain_shared(q, lambda m: m[3] if m[0] == 'rows' else None) for q in self._parse_queues)
+        freed += drain_shared(self._write_queue, lambda m: m[0])
+        if freed:
+            logger.warning(f"Liberados {freed} bloques de memoria compartida sin consumir")
+        shard_assignment.release_all()
+        self._assignment = []
+
+    def stats(self) -> Dict[str, Any]:
+        def depth(q: Any) -> Optional[int]:
+            try:
+                return q.qsize()
+            except (NotImplementedError, OSError):  # macOS no implementa qsize
+                return None
+
+        return {
+            "processes": {p.name: p.is_alive() for p in self._processes},
+            "parse_queue_depth": [depth(q) for q in self._parse_queues],
+            "write_queue_depth": depth(self._write_queue) if self._write_queue else None,
+            "assigned_routers": [len(part) for part in self._assignment],
+        }
+
+
+# Global Instance
+collector_pipeline = CollectorPipeline(
+    io_workers=settings.COLLECTOR_IO_WORKERS,
+    cpu_workers=settings.COLLECTOR_CPU_WORKERS,
+    queue_size=settings.COLLECTOR_PIPELINE_QUEUE_SIZE,
+)
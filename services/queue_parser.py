@@ -0,0 +1,83 @@
+"""
+Parser por lotes de '/queue/simple/print'.
+
+En lugar de partir cada "1234/5678" por cola y construir un modelo pydantic
+por fila, se parsea un lote completo a columnas `array('q')`: los contadores
+de todas las colas se unen en un solo string, se parten una vez y se
+convierten con `map(int, ...)`, todo en C.
+"""
+from array import array
+from datetime import datetime
+from itertools import repeat
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from models.samples import PAIR_COLUMNS, QueueSamples
+
+
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _split_pair(value: str) -> Tuple[int, int]:
+    """Camino lento para un valor inválido: mismo criterio que antes (0, 0)"""
+    try:
+        parts = value.split('/')
+        up, down = int(parts[0]), int(parts[1])
+    except (AttributeError, IndexError, ValueError):
+        return 0, 0
+    # Las columnas son int64: un valor fuera de rango se trata como inválido
+    if not (_INT64_MIN <= up <= _INT64_MAX and _INT64_MIN <= down <= _INT64_MAX):
+        return 0, 0
+    return up, down
+
+
+def _parse_pairs(values: Sequence[str], up_col: array, down_col: array):
+    # Solo si cada valor tiene exactamente una '/': contar el total no alcanza,
+    # "1/2/3" junto a "5" daría la misma cantidad y correría las columnas
+    if set(map(str.count, values, repeat('/'))) == {1}:
+        flat = '/'.join(values).split('/')
+        try:
+            up_col.extend(map(int, flat[0::2]))
+            down_col.extend(map(int, flat[1::2]))
+            return
+        except (ValueError, OverflowError):
+            del up_col[:], down_col[:]
+    # Algún valor malformado: se parsea fila por fila
+    for value in values:
+        up, down = _split_pair(value)
+        up_col.append(up)
+        down_col.append(down)
+
+
+def parse_queue_batch(
+    rows: Iterable[Dict[str, str]],
+    router_alias: str = "",
+    timestamp: Optional[datetime] = None,
+) -> QueueSamples:
+    """Parsea un lote de filas crudas de '/queue/simple/print' en una pasada"""
+    columns = QueueSamples(router_alias, timestamp)
+    raw: Dict[str, List[str]] = {key: [] for key, _, _ in PAIR_COLUMNS}
+    names = columns.names
+    target_ips = columns.target_ips
+
+    for row in rows:
+        name = row.get('name')
+        if not name:
+            continue
+        names.append(name)
+        # Limpieza de IP (quitar máscara /32 si existe)
+        target = row.get('target')
+        target_ips.append(target.split('/', 1)[0] if target else "unknown")
+        for key, values in raw.items():
+            # Ojo: A veces MikroTik no envía 'rate' si es 0
+            values.append(row.get(key) or '0/0')
+
+    for key, up, down in PAIR_COLUMNS:
+        _parse_pairs(raw[key], getattr(columns, up), getattr(columns, down))
+
+    # Sin historial todavía: promedio = rate instantáneo y pps en 0. El
+    # índice de contadores los reemplaza por valores calculados con deltas.
+    columns.upload_avg_bps.extend(columns.upload_bps)
+    columns.download_avg_bps.extend(columns.download_bps)
+    zeros = bytes(len(names) * columns.upload_pps.itemsize)
+    columns.upload_pps.frombytes(zeros)
+    columns.download_pps.frombytes(zeros)
+    return columns
@@ -0,0 +1,244 @@
+"""
+Niveles de rollup (downsampling) de `mikrotik_traffic`.
+
+Por cada nivel de INFLUX_ROLLUP_TIERS (p. ej. "1h,1d") el servicio crea o
+actualiza en InfluxDB una tarea que agrega upload_bps/download_bps en
+ventanas de ese tamaño. Cada tarea escribe dos measurements en el mismo
+bucket: `mikrotik_traffic_1h` (promedio) y `mikrotik_traffic_1h_max` (máximo).
+Cada nivel se calcula desde el anterior (1d desde 1h) y no desde los datos
+crudos.
+
+Las consultas de historial se dirigen al nivel más grueso cuya ventana
+divide a la resolución pedida (`every`), siempre que la agregación sea
+`mean` o `max` y que el nivel tenga datos desde el inicio del rango. Así
+un rango de 30d con every=1d lee 30 puntos por serie en lugar de todos los
+crudos. Los niveles no se completan hacia atrás: se consulta el primer
+punto de cada uno y, hasta que cubra el rango pedido, se leen los datos
+crudos. Cada tarea relee dos ventanas para completar la ventana en curso:
+el último punto de un nivel puede atrasarse hasta un intervalo de la tarea.
+
+Con escritura delta (COLLECTOR_DELTA_ENABLED) una cola sin cambios no tiene
+punto en ese ciclo. Antes de agregar datos crudos (historial o tarea del
+primer nivel) se completan esos huecos con el último valor escrito
+(`gap_fill_flux`); si no, `mean` promediaría solo los intervalos con cambios.
+"""
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from core.line_protocol import TRAFFIC_MEASUREMENT
+from services.counter_index import carry_seconds
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FIELDS = ("upload_bps", "download_bps")
+ROLLUP_FUNCTIONS = ("mean", "max")
+TASK_PREFIX = "mikrotik_rollup_"
+
+_DURATION = re.compile(r"^(\d+)(s|m|h|d|w|mo|y)$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "mo": 30 * 86400, "y": 365 * 86400}
+
+
+def duration_seconds(value: str) -> Optional[int]:
+    """Segundos de una duración Flux simple (mo y y son aproximados)"""
+    match = _DURATION.match(value)
+    if not match:
+        return None
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+
+def gap_fill_flux(step: int, start: str) -> str:
+    """
+    Pasos Flux que completan los huecos de la escritura delta: cada `step`
+    segundos, el último punto o, si no hubo, el último escrito mientras no
+    tenga más de `carry_seconds()`. La consulta tiene que leer desde
+    `carry_seconds()` antes de `start` para encontrar ese punto; después del
+    relleno se recorta a `start`.
+    """
+    return f'''
+  |> duplicate(column: "_time", as: "written")
+  |> aggregateWindow(every: {step}s, fn: last, createEmpty: true, timeSrc: "_start")
+  |> fill(column: "written", usePrevious: true)
+  |> fill(usePrevious: true)
+  |> filter(fn: (r) => exists r.written and int(v: r._time) - int(v: r.written) <= {carry_seconds() * 10 ** 9})
+  |> drop(columns: ["written"])
+  |> range(start: {start})'''
+
+
+class RollupTier:
+    __slots__ = ('every', 'seconds', 'source', 'start')
+
+    def __init__(self, every: str, source: Optional["RollupTier"]):
+        self.every = every
+        self.seconds = duration_seconds(every)
+        self.source = source  # None: se agrega desde los datos crudos
+        self.start: Optional[int] = None  # Epoch del primer punto del nivel (None: todavía vacío)
+
+    def covers(self, since: float) -> bool:
+        """True si el nivel tiene datos desde `since` (la primera ventana cierra un intervalo después)"""
+        return self.start is not None and self.start <= since + self.seconds
+
+    def measurement(self, fn: str) -> str:
+        base = f"{TRAFFIC_MEASUREMENT}_{self.every}"
+        return base if fn == "mean" else f"{base}_{fn}"
+
+    def task_name(self) -> str:
+        return f"{TASK_PREFIX}{self.every}"
+
+    def start_flux(self, bucket: str) -> str:
+        """Consulta del primer punto del nivel"""
+        return f'''
+from(bucket: "{bucket}")
+  |> range(start: 0)
+  |> filter(fn: (r) => r["_measurement"] == "{self.measurement("mean")}" and r["_field"] == "{ROLLUP_FIELDS[0]}")
+  |> first()
+  |> keep(columns: ["_time"])
+  |> group()
+  |> sort(columns: ["_time"])
+  |> limit(n: 1)
+'''
+
+    def task_flux(self, bucket: str) -> str:
+        fields = " or ".join(f'r["_field"] == "{f}"' for f in ROLLUP_FIELDS)
+        span = self.seconds * 2
+        lookback = span
+        fill = ""
+        if self.source is None and settings.COLLECTOR_DELTA_ENABLED:
+            lookback += carry_seconds()
+            fill = gap_fill_flux(min(self.seconds, settings.COLLECTOR_INTERVAL_SECONDS), f"-{span}s")
+        steps = []
+        for fn in ROLLUP_FUNCTIONS:
+            source = self.source.measurement(fn) if self.source else TRAFFIC_MEASUREMENT
+            steps.append(f'''
+data
+  |> filter(fn: (r) => r["_measurement"] == "{source}"){fill}
+  |> aggregateWindow(every: {self.every}, fn: {fn}, createEmpty: false)
+  |> set(key: "_measurement", value: "{self.measurement(fn)}")
+  |> to(bucket: "{bucket}")''')
+        return f'''option task = {{name: "{self.task_name()}", every: {self.every}, offset: 1m}}
+
+data = from(bucket: "{bucket}")
+  |> range(start: -{lookback}s)
+  |> filter(fn: (r) => {fields})
+''' + "\n".join(steps) + "\n"
+
+
+class RollupManager:
+    def __init__(self, tiers: str):
+        self.tiers: List[RollupTier] = []
+        previous = None
+        for every in sorted(
+            {t.strip() for t in tiers.split(",") if t.strip()},
+            key=lambda t: duration_seconds(t) or 0,
+        ):
+            if duration_seconds(every) is None:
+                logger.error(f"Nivel de rollup inválido: '{every}'")
+                continue
+            previous = RollupTier(every, previous)
+            self.tiers.append(previous)
+        self.active = False  # Solo se enrutan consultas si las tareas quedaron creadas
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, client, bucket: str):
+        """Crea las tareas en segundo plano; si InfluxDB no responde se reintenta"""
+        if self.tiers and not self._task:
+            self._task = asyncio.create_task(self._provision_loop(client, bucket))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _provision_loop(self, client, bucket: str):
+        # Primero se crean las tareas; después se espera a que cada nivel tenga su primer punto
+        while True:
+            if not self.active:
+                await asyncio.to_thread(self.provision, client, bucket)
+            if self.active:
+                await asyncio.to_thread(self.refresh_coverage, client, bucket)
+                if all(t.start is not None for t in self.tiers):
+                    return
+            await asyncio.sleep(settings.INFLUX_ROLLUP_RETRY_SECONDS)
+
+    def provision(self, client, bucket: str):
+        """Crea o actualiza las tareas de InfluxDB (idempotente; corre en un hilo)"""
+        if not self.tiers:
+            return
+        tasks_api = client.tasks_api()
+        try:
+            for tier in self.tiers:
+                self._ensure_task(tasks_api, tier.task_name(), tier.task_flux(bucket), client.org)
+            self.active = True
+            self.last_error = None
+            logger.info(f"Rollups activos: {', '.join(t.every for t in self.tiers)}")
+        except Exception as e:
+            # Sin permiso para tareas, o InfluxDB caído: el historial sigue con los datos crudos
+            self.active = False
+            self.last_error = str(e)
+            logger.error(f"No se pudieron crear las tareas de rollup: {e}")
+
+    def refresh_coverage(self, client, bucket: str):
+        """Busca el primer punto de los niveles que todavía no tienen datos (corre en un hilo)"""
+        query_api = client.query_api()
+        for tier in self.tiers:
+            if tier.start is not None:
+                continue
+            try:
+                tables = query_api.query(tier.start_flux(bucket), org=client.org)
+            except Exception as e:
+                logger.error(f"No se pudo consultar el inicio del nivel '{tier.every}': {e}")
+                continue
+            for table in tables:
+                for record in table.records:
+                    tier.start = int(record.get_time().timestamp())
+                    logger.info(f"Nivel de rollup '{tier.every}' con datos desde {record.get_time().isoformat()}")
+
+    @staticmethod
+    def _ensure_task(tasks_api, name: str, flux: str, org: str):
+        from influxdb_client.domain.task_create_request import TaskCreateRequest
+        from influxdb_client.domain.task_update_request import TaskUpdateRequest
+
+        existing = tasks_api.find_tasks(name=name, org=org)
+        if not existing:
+            tasks_api.create_task(task_create_request=TaskCreateRequest(org=org, flux=flux, status="active"))
+            logger.info(f"Tarea de rollup '{name}' creada")
+            return
+        task = existing[0]
+        if task.flux != flux or task.status != "active":
+            tasks_api.update_task_request(task.id, TaskUpdateRequest(flux=flux, status="active"))
+            logger.info(f"Tarea de rollup '{name}' actualizada")
+
+    def select(self, every: str, fn: str, range: str) -> Tuple[str, Optional[str]]:
+        """
+        Measurement a consultar para una resolución, agregación y rango.
+        Devuelve (measurement, nivel) con nivel None si se usan los datos crudos.
+        """
+        if not self.active or fn not in ROLLUP_FUNCTIONS:
+            return TRAFFIC_MEASUREMENT, None
+        seconds = duration_seconds(every)
+        span = duration_seconds(range)
+        if not seconds or span is None:
+            return TRAFFIC_MEASUREMENT, None
+        since = time.time() - span
+        for tier in reversed(self.tiers):
+            if seconds >= tier.seconds and seconds % tier.seconds == 0 and tier.covers(since):
+                return tier.measurement(fn), tier.every
+        return TRAFFIC_MEASUREMENT, None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tiers": {t.every: {"start": t.start} for t in self.tiers},
+            "active": self.active,
+            "last_error": self.last_error,
+        }
+
+
+# Global Instance
+rollup_manager = RollupManager(settings.INFLUX_ROLLUP_TIERS)
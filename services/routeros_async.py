@@ -0,0 +1,372 @@
+"""
+Cliente asyncio nativo del protocolo API de RouterOS (sentencias/palabras).
+
+Permite atender cientos de routers desde un solo event loop, sin un hilo
+bloqueado por cada router lento. Varias órdenes pueden compartir la misma
+conexión: cada una viaja con su propio `.tag` y las respuestas se reparten
+por tag. El lector de la conexión nunca espera a un consumidor: una orden
+que acumula más de `max_pending` sentencias sin consumir se cancela sola
+(RouterOsOverflowError) y las demás siguen.
+
+Referencia del formato: https://help.mikrotik.com/docs/display/ROS/API
+"""
+import asyncio
+import binascii
+import hashlib
+import itertools
+import logging
+import socket
+import ssl
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cota por defecto de sentencias sin consumir por orden. Alcanza para un
+# `/print` completo de un router grande aunque el consumidor se atrase.
+MAX_PENDING_SENTENCES = 50_000
+
+_CLOSED = object()
+
+
+class RouterOsError(Exception):
+    """Error base del cliente asíncrono"""
+
+
+class RouterOsTrapError(RouterOsError):
+    """El router respondió `!trap` a una orden"""
+
+    def __init__(self, message: str, category: Optional[str] = None):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+
+class RouterOsFatalError(RouterOsError):
+    """`!fatal` o conexión cerrada: la conexión ya no es utilizable"""
+
+
+class RouterOsTimeoutError(RouterOsError):
+    """El router dejó de responder a una orden por más de `read_timeout`"""
+
+
+class RouterOsOverflowError(RouterOsError):
+    """El consumidor de una orden no dio abasto; la orden se canceló y la conexión sigue"""
+
+
+# --- Codificación del protocolo ---
+
+def encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes((length,))
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def encode_word(word: str) -> bytes:
+    data = word.encode('utf-8')
+    return encode_length(len(data)) + data
+
+
+def encode_sentence(words: List[str]) -> bytes:
+    return b''.join(encode_word(w) for w in words) + b'\x00'
+
+
+async def read_length(reader: asyncio.StreamReader) -> int:
+    b = (await reader.readexactly(1))[0]
+    if b < 0x80:
+        return b
+    if b < 0xC0:
+        return ((b & 0x3F) << 8) | (await reader.readexactly(1))[0]
+    if b < 0xE0:
+        return ((b & 0x1F) << 16) | int.from_bytes(await reader.readexactly(2), 'big')
+    if b < 0xF0:
+        return ((b & 0x0F) << 24) | int.from_bytes(await reader.readexactly(3), 'big')
+    if b == 0xF0:
+        return int.from_bytes(await reader.readexactly(4), 'big')
+    raise RouterOsFatalError(f"Byte de control no soportado: {b:#x}")
+
+
+async def read_sentence(reader: asyncio.StreamReader) -> List[str]:
+    words = []
+    while True:
+        length = await read_length(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode('utf-8', errors='replace'))
+
+
+def parse_sentence(words: List[str]) -> Tuple[str, Optional[str], Dict[str, str]]:
+    """Convierte una sentencia en (tipo de respuesta, tag, atributos)"""
+    reply = words[0] if words else ''
+    tag = None
+    attrs = {}
+    for word in words[1:]:
+        if word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attrs[key] = value
+        elif word.startswith('.tag='):
+            tag = word[5:]
+    return reply, tag, attrs
+
+
+def _ssl_context(verify: bool = False) -> ssl.SSLContext:
+    # Igual que el cliente síncrono: los routers suelen usar certificados
+    # autofirmados, así que el certificado solo se verifica si se pide.
+    ctx = ssl.create_default_context()
+    if not verify:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+# --- Conexión ---
+
+class AsyncRouterOsApi:
+    """Una conexión API autenticada, multiplexada por tags"""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        read_timeout: Optional[float] = None,
+        max_pending: int = MAX_PENDING_SENTENCES,
+    ):
+        self._reader = reader
+        self._writer = writer
+        self._tags = itertools.count(1)
+        self._pending: Dict[str, asyncio.Queue] = {}
+        self._write_lock = asyncio.Lock()
+        self._reader_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.last_used = time.monotonic()
+        # Máximo silencio entre dos sentencias de una misma orden (no el total)
+        self.read_timeout = read_timeout
+        self.max_pending = max_pending
+
+    @classmethod
+    async def connect(
+        cls,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        use_ssl: bool = False,
+        ssl_verify: bool = False,
+        timeout: float = 10,
+        read_timeout: Optional[float] = None,
+        max_pending: int = MAX_PENDING_SENTENCES,
+    ) -> "AsyncRouterOsApi":
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port,
+                ssl=_ssl_context(ssl_verify) if use_ssl else None,
+                server_hostname=host if use_ssl else None,
+            ),
+            timeout=timeout,
+        )
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        api = cls(reader, writer, read_timeout, max_pending)
+        api._reader_task = asyncio.create_task(api._read_loop())
+        try:
+            await asyncio.wait_for(api._login(username, password), timeout=timeout)
+        except BaseException:
+            await api.close()
+            raise
+        return api
+
+    async def _login(self, username: str, password: str):
+        # RouterOS 6.43+: login en texto plano
+        done = await self._talk('/login', {'name': username, 'password': password})
+        if 'ret' in done:
+            # RouterOS < 6.43: challenge MD5
+            token = binascii.unhexlify(done['ret'])
+            hasher = hashlib.md5()
+            hasher.update(b'\x00')
+            hasher.update(password.encode())
+            hasher.update(token)
+            await self._talk('/login', {'name': username, 'response': '00' + hasher.hexdigest()})
+
+    async def _read_loop(self):
+        error: Any = RouterOsFatalError("Conexión cerrada por el router")
+        try:
+            while True:
+                words = await read_sentence(self._reader)
+                reply, tag, attrs = parse_sentence(words)
+                if reply == '!fatal':
+                    error = RouterOsFatalError(attrs.get('message') or ' '.join(words[1:]))
+                    break
+                queue = self._pending.get(tag)
+                if queue is None:
+                    continue  # Las respuestas de órdenes canceladas se descartan
+                if queue.qsize() >= self.max_pending:
+                    self._overflow(tag, queue)
+                else:
+                    queue.put_nowait((reply, attrs))
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            error = RouterOsFatalError(f"Conexión perdida: {e}")
+        except Exception as e:
+            error = RouterOsFatalError(f"Respuesta inválida: {e}")
+        finally:
+            self.closed = True
+            for queue in self._pending.values():
+                queue.put_nowait((_CLOSED, error))
+            self._writer.close()
+
+    def _overflow(self, tag: str, queue: asyncio.Queue):
+        """Corta una orden cuyo consumidor se atrasó, sin frenar al lector ni a las otras órdenes"""
+        del self._pending[tag]
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait((_CLOSED, RouterOsOverflowError(
+            f"Más de {self.max_pending} respuestas sin consumir; orden cancelada"
+        )))
+        # `write` no espera: una sentencia entera queda en el buffer sin mezclarse con otra
+        self._writer.write(encode_sentence(['/cancel', f'=tag={tag}']))
+
+    async def _send(self, words: List[str]):
+        if self.closed:
+            raise RouterOsFatalError("La conexión está cerrada")
+        async with self._write_lock:
+            self._writer.write(encode_sentence(words))
+            await self._writer.drain()
+
+    async def execute(
+        self,
+        command: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        queries: Optional[List[str]] = None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
+        """
+        Envía una orden y produce ('!re', attrs) por cada fila a medida que
+        llega, terminando con ('!done', attrs). Un `!trap` se lanza como
+        RouterOsTrapError una vez que el router cierra la orden con `!done`.
+        """
+        tag = str(next(self._tags))
+        words = [command]
+        for key, value in (arguments or {}).items():
+            words.append(f'={key}={value}')
+        words.extend(queries or [])
+        words.append(f'.tag={tag}')
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[tag] = queue
+        finished = False
+        trap = None
+        try:
+            await self._send(words)
+            while True:
+                try:
+                    if queue.empty():
+                        reply, attrs = await asyncio.wait_for(queue.get(), self.read_timeout)
+                    else:
+                        # Camino rápido: no crear un timer por cada fila ya recibida
+                        reply, attrs = queue.get_nowait()
+                except asyncio.TimeoutError:
+                    raise RouterOsTimeoutError(
+                        f"Sin respuesta a {command} en {self.read_timeout}s"
+                    ) from None
+                if reply is _CLOSED:
+                    finished = True
+                    raise attrs
+                if reply == '!re':
+                    yield reply, attrs
+                elif reply == '!trap':
+                    trap = trap or RouterOsTrapError(attrs.get('message', 'error'), attrs.get('category'))
+                elif reply == '!done':
+                    finished = True
+                    if trap:
+                        raise trap
+                    yield reply, attrs
+                    return
+                # '!empty' (RouterOS 7.18+) no aporta nada
+        finally:
+            self.last_used = time.monotonic()
+            self._pending.pop(tag, None)
+            if not finished and not self.closed:
+                # El consumidor abandonó la orden: pedir al router que la corte
+                try:
+                    await self._send(['/cancel', f'=tag={tag}'])
+                except Exception:
+                    pass
+
+    async def _talk(
+        self,
+        command: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        queries: Optional[List[str]] = None,
+    ) -> Dict[str, str]:
+        """Ejecuta una orden sin filas de respuesta y devuelve los atributos del `!done`"""
+        done: Dict[str, str] = {}
+        async for reply, attrs in self.execute(command, arguments, queries):
+            if reply == '!done':
+                done = attrs
+        return done
+
+    def get_resource(self, path: str) -> "AsyncRouterOsResource":
+        return AsyncRouterOsResource(self, path)
+
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.closed = True
+        self._writer.close()
+
+
+class AsyncRouterOsResource:
+    """Equivalente asíncrono de `api.get_resource(path)` de routeros_api"""
+
+    def __init__(self, api: AsyncRouterOsApi, path: str):
+        self.api = api
+        self.path = '/' + path.strip('/')
+
+    async def stream(
+        self,
+        command: str = 'print',
+        arguments: Optional[Dict[str, Any]] = None,
+        queries: Optional[List[str]] = None,
+        proplist: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[Dict[str, str]]:
+        """
+        Produce cada fila (`!re`) en cuanto se decodifica.
+
+        `proplist` limita las columnas que envía el router ('=.proplist=') y
+        `queries` son palabras de filtro ya armadas ('?name=x').
+        """
+        if proplist:
+            arguments = dict(arguments or {}, **{'.proplist': ','.join(proplist)})
+        async for reply, attrs in self.api.execute(f'{self.path}/{command}', arguments, queries):
+            if reply == '!re':
+                yield attrs
+
+    async def call(self, command: str, arguments=None, queries=None, proplist=None) -> List[Dict[str, str]]:
+        return [row async for row in self.stream(command, arguments, queries, proplist)]
+
+    async def get(self, proplist: Optional[Sequence[str]] = None, **queries) -> List[Dict[str, str]]:
+        """'/print' filtrado en el router: get(name='x') envía '?name=x'"""
+        return await self.call('print', queries=[f'?{k}={v}' for k, v in queries.items()], proplist=proplist)
+
+    async def add(self, **arguments) -> Optional[str]:
+        """Crea un elemento y devuelve su `.id`"""
+        done = await self.api._talk(f'{self.path}/add', arguments)
+        return done.get('ret')
+
+    async def set(self, **arguments):
+        await self.api._talk(f'{self.path}/set', arguments)
+
+    async def remove(self, **arguments):
+        await self.api._talk(f'{self.path}/remove', arguments)
@@ -0,0 +1,160 @@
+"""
+Planificador de recolección por router.
+
+Cada router tiene su propio intervalo y un deadline absoluto: el siguiente
+tick se calcula sumando el intervalo al deadline anterior (no al momento en
+que terminó la recolección), así que el ciclo no se corre por routers lentos.
+
+- El primer tick de cada router se desplaza dentro del intervalo según un
+  hash estable del alias, para que no salgan todos al mismo instante.
+- Si la recolección anterior de un router sigue corriendo, el tick se salta.
+- Cuando hay más routers vencidos que cupos, arrancan primero los que tenían
+  más colas en la última recolección.
+"""
+import asyncio
+import logging
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from models.router_config import RouterConfig
+
+logger = logging.getLogger(__name__)
+
+# Recibe el router y el timestamp del tick; devuelve la cantidad de colas leídas
+RunCallback = Callable[[RouterConfig, datetime], Awaitable[int]]
+
+
+class _RouterSchedule:
+    __slots__ = (
+        'router', 'interval', 'deadline', 'task',
+        'queue_count', 'last_duration', 'runs', 'skipped',
+    )
+
+    def __init__(self, router: RouterConfig, interval: float, deadline: float):
+        self.router = router
+        self.interval = interval
+        self.deadline = deadline
+        self.task: Optional[asyncio.Task] = None
+        self.queue_count = 0
+        self.last_duration: Optional[float] = None
+        self.runs = 0
+        self.skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+
+class PollingScheduler:
+    def __init__(self, run: RunCallback, default_interval: float, max_concurrent: int):
+        self._run = run
+        self.default_interval = default_interval
+        self.max_concurrent = max_concurrent
+        self._entries: Dict[str, _RouterSchedule] = {}
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _interval_for(self, router: RouterConfig) -> float:
+        return router.interval_seconds or self.default_interval
+
+    def _first_deadline(self, alias: str, interval: float) -> float:
+        offset = (zlib.crc32(alias.encode()) % 1000) / 1000 * interval
+        return time.monotonic() + offset
+
+    def sync(self, routers: List[RouterConfig]):
+        """Ajusta las entradas al inventario: agrega, actualiza y quita routers"""
+        current = {r.alias: r for r in routers}
+        for alias in list(self._entries):
+            if alias not in current:
+                # Si está recolectando se deja terminar; solo no se vuelve a planificar
+                del self._entries[alias]
+        for alias, router in current.items():
+            interval = self._interval_for(router)
+            entry = self._entries.get(alias)
+            if entry is None:
+                self._entries[alias] = _RouterSchedule(router, interval, self._first_deadline(alias, interval))
+            else:
+                entry.router = router
+                if entry.interval != interval:
+                    entry.deadline += interval - entry.interval
+                    entry.interval = interval
+        self._wakeup.set()
+
+    async def start(self):
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if not self._task:
+            return
+        tasks = [self._task] + [e.task for e in self._entries.values() if e.running]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            due = [e for e in self._entries.values() if e.deadline <= now]
+            # Los routers más grandes primero: toman los cupos libres antes
+            for entry in sorted(due, key=lambda e: -e.queue_count):
+                self._dispatch(entry, now)
+
+            next_deadline = min((e.deadline for e in self._entries.values()), default=now + self.default_interval)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, entry: _RouterSchedule, now: float):
+        # Deadline absoluto: si se perdieron ticks se saltan, sin acumular deriva
+        missed = int((now - entry.deadline) // entry.interval)
+        entry.deadline += (missed + 1) * entry.interval
+        if entry.running:
+            entry.skipped += 1
+            logger.warning(f"Router '{entry.router.alias}': recolección anterior sigue en curso, se salta el tick")
+            return
+        entry.task = asyncio.create_task(self._execute(entry))
+
+    async def _execute(self, entry: _RouterSchedule) -> Any:
+        async with self._slots:
+            started = time.monotonic()
+            try:
+                result = await self._run(entry.router, datetime.utcnow())
+            except Exception as e:
+                result = e
+            entry.runs += 1
+            entry.last_duration = time.monotonic() - started
+            if isinstance(result, int) and not isinstance(result, bool):
+                entry.queue_count = result
+            return result
+
+    async def run_now(self, alias: Optional[str] = None) -> List[Any]:
+        """Recolecta ya (todos o un router); si alguno ya está corriendo, espera esa ejecución"""
+        entries = [e for a, e in self._entries.items() if alias is None or a == alias]
+        tasks = []
+        for entry in entries:
+            if not entry.running:
+                entry.task = asyncio.create_task(self._execute(entry))
+            tasks.append(entry.task)
+        return list(await asyncio.gather(*tasks, return_exceptions=True))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            alias: {
+                "interval_seconds": e.interval,
+                "next_in_seconds": round(max(0.0, e.deadline - now), 1),
+                "running": e.running,
+                "queue_count": e.queue_count,
+                "last_duration_seconds": round(e.last_duration, 2) if e.last_duration is not None else None,
+                "runs": e.runs,
+                "skipped_ticks": e.skipped,
+            }
+            for alias, e in self._entries.items()
+        }
@@ -0,0 +1,191 @@
+"""
+Reparto de routers entre varios procesos o nodos del collector.
+
+- Cada router se asigna a un shard con hashing consistente sobre su alias
+  (anillo con nodos virtuales): al cambiar COLLECTOR_SHARD_COUNT solo se
+  mueve la fracción mínima de routers.
+- Además, el proceso toma un lease (archivo con `flock`) por cada router que
+  recolecta, así que aunque dos procesos se configuren con el mismo shard
+  nunca escriben el mismo router dos veces. Si el dueño muere, el sistema
+  operativo libera el lock y otro proceso del mismo shard lo toma en el
+  siguiente polling.
+- Con COLLECTOR_SHARD_ID sin definir, el proceso reclama al arrancar el
+  collector (`claim`, no al importar el módulo) el primer shard libre
+  (`shard-<n>.lock`), útil con `uvicorn --workers N`, y lo conserva hasta
+  terminar. Un proceso que no consiguió shard no
+  recolecta; el shard de un worker que muere lo reclama el worker que lo
+  reemplaza. El shard reclamado se pasa por entorno a los procesos hijos
+  del collector multiproceso.
+- Con más de un shard, el buffer en disco de InfluxDB de cada proceso va en
+  `<dir>/shard-<n>` (`state_dir`). El almacén embebido no admite shards.
+
+Los leases son locales a la máquina (o a un volumen compartido con soporte
+de `flock`); entre nodos distintos la exclusión la da el shard id.
+"""
+import bisect
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional
+from core.config import settings
+from models.router_config import RouterConfig
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin leases, solo hashing
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, shard_count: int, vnodes: int = 64):
+        self.shard_count = max(1, shard_count)
+        points = sorted(
+            (_hash(f"shard-{shard}-{v}"), shard)
+            for shard in range(self.shard_count)
+            for v in range(vnodes)
+        )
+        self._keys = [p[0] for p in points]
+        self._shards = [p[1] for p in points]
+
+    def shard_for(self, alias: str) -> int:
+        i = bisect.bisect(self._keys, _hash(alias)) % len(self._keys)
+        return self._shards[i]
+
+
+class _Lease:
+    """Lock exclusivo sobre un archivo mientras el descriptor esté abierto"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # Cerrar el descriptor libera el flock
+            self._fd = None
+
+
+class ShardAssignment:
+    def __init__(self, shard_id: Optional[int], shard_count: int, lease_dir: Optional[str]):
+        self.ring = HashRing(shard_count)
+        self.configured_shard = shard_id
+        self.shard_id = shard_id
+        self.lease_dir = lease_dir if fcntl is not None else None
+        self._shard_lease: Optional[_Lease] = None
+        self._leases: Dict[str, _Lease] = {}
+        self._claimed = False
+
+    def claim(self) -> Optional[int]:
+        """
+        Shard fijo o, si no se configuró, el primero cuyo lease esté libre.
+        Se reclama una sola vez, al arrancar el collector.
+        """
+        if self._claimed:
+            return self.shard_id
+        self._claimed = True
+        if self.lease_dir:
+            os.makedirs(self.lease_dir, exist_ok=True)
+        if self.configured_shard is not None:
+            return self.shard_id
+        if not self.lease_dir:
+            self.shard_id = 0
+            return self.shard_id
+        for shard in range(self.ring.shard_count):
+            lease = _Lease(os.path.join(self.lease_dir, f"shard-{shard}.lock"))
+            if lease.acquire():
+                self._shard_lease = lease
+                self.shard_id = shard
+                # Los procesos hijos (COLLECTOR_MODE=process) heredan el shard sin volver a reclamarlo
+                os.environ["COLLECTOR_SHARD_ID"] = str(shard)
+                logger.info(f"Collector: shard {shard}/{self.ring.shard_count} reclamado (pid {os.getpid()})")
+                return shard
+        logger.warning(f"Collector: sin shard libre en {self.lease_dir}, este proceso no recolecta")
+        return None
+
+    def state_dir(self, base: str) -> str:
+        """Directorio de estado en disco de este proceso (uno por shard si hay varios)"""
+        if self.ring.shard_count == 1:
+            return base
+        shard = self.claim()
+        return os.path.join(base, f"shard-{shard}" if shard is not None else "standby")
+
+    def owned(self, routers: List[RouterConfig]) -> List[RouterConfig]:
+        """Routers que este proceso debe recolectar; toma o suelta leases según corresponda"""
+        shard = self.claim()
+        owned = []
+        wanted = set()
+        for router in routers:
+            if shard is None or self.ring.shard_for(router.alias) != shard:
+                continue
+            wanted.add(router.alias)
+            if self._acquire(router.alias):
+                owned.append(router)
+        for alias in list(self._leases):
+            if alias not in wanted:
+                self.release(alias)
+        return owned
+
+    def holds_all(self, routers: List[RouterConfig]) -> bool:
+        """True si este proceso recolecta todos los routers (los de su shard y con lease)"""
+        if self.shard_id is None:
+            return False
+        if not self.lease_dir:
+            return all(self.ring.shard_for(r.alias) == self.shard_id for r in routers)
+        return all(r.alias in self._leases for r in routers)
+
+    def _acquire(self, alias: str) -> bool:
+        if not self.lease_dir:
+            return True
+        lease = self._leases.get(alias)
+        if lease is None:
+            name = hashlib.sha1(alias.encode()).hexdigest()  # El alias puede traer '/' u otros caracteres
+            lease = _Lease(os.path.join(self.lease_dir, f"router-{name}.lock"))
+        if not lease.acquire():
+            return False
+        self._leases[alias] = lease
+        return True
+
+    def release(self, alias: str):
+        lease = self._leases.pop(alias, None)
+        if lease:
+            lease.release()
+
+    def release_all(self):
+        """Suelta los routers; el shard se conserva hasta que termina el proceso"""
+        for alias in list(self._leases):
+            self.release(alias)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {
+            "shard_id": self.shard_id,
+            "shard_count": self.ring.shard_count,
+            "leased_routers": len(self._leases) if self.lease_dir else None,
+        }
+
+
+# Global Instance
+shard_assignment = ShardAssignment(
+    shard_id=settings.COLLECTOR_SHARD_ID,
+    shard_count=settings.COLLECTOR_SHARD_COUNT,
+    lease_dir=settings.COLLECTOR_LEASE_DIR or None,
+)
@@ -0,0 +1,319 @@
+"""
+Contabilidad de consumo por cola (bytes de subida y bajada) por hora, día y mes.
+
+En cada ciclo se suma a los totales del período el avance de los contadores
+`bytes` de cada cola. Si un contador bajó, la cola se reinició o el router
+se reinició (o el contador dio la vuelta), y se cuenta el valor actual, igual
+que en el índice de contadores. Una cola que aparece después del primer
+ciclo del router se creó en el medio, así que su contador entero es consumo.
+
+Cuando un ciclo cruza el cambio de hora (y por lo tanto de día o mes), el
+avance se reparte entre los dos períodos en proporción al tiempo. El período
+que termina se guarda en disco como archivo propio, y el estado del período
+en curso se guarda al final de cada ciclo. Así, tras un reinicio del servicio,
+se sigue desde los últimos contadores sin perder el intervalo intermedio:
+
+    <USAGE_DIR>/<router>/state.json            contadores y totales en curso
+    <USAGE_DIR>/<router>/<período>-<clave>.json   totales cerrados (hour-2026-10-17T22, day-..., month-2026-10)
+
+Los períodos se calculan en USAGE_TIMEZONE. En cada cambio de período se
+olvidan las colas que ya no están en el router (no aparecieron en un ciclo
+completo) y no tienen consumo en ningún período en curso.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+from core.config import settings
+from models.samples import QueueSamples
+from services.counter_index import counter_delta
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("hour", "day", "month")
+_KEY_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+# Cuánto se conservan los archivos de períodos cerrados (los meses no se borran)
+_RETENTION = {"hour": timedelta(days=7), "day": timedelta(days=400)}
+
+
+def _router_dir(base: str, alias: str) -> str:
+    # El alias puede traer '/' u otros caracteres
+    return os.path.join(base, hashlib.sha1(alias.encode()).hexdigest()[:16])
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    temp = f"{path}.tmp"
+    with open(temp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp, path)
+
+
+class RouterUsage:
+    """Contadores y totales de un router"""
+
+    def __init__(self, alias: str, directory: str, tz: ZoneInfo):
+        self.alias = alias
+        self.directory = directory
+        self.tz = tz
+        self.last_cycle: Optional[float] = None  # Epoch del último ciclo completo
+        self._slots: Dict[str, int] = {}
+        self.cycle = 0
+        self._seen = array('q')  # Último ciclo en que apareció cada slot
+        self._last_up = array('q')
+        self._last_down = array('q')
+        self.keys: Dict[str, str] = {}
+        self.totals: Dict[str, Tuple[array, array]] = {p: (array('q'), array('q')) for p in PERIODS}
+        # Durante un ciclo que cruza el cambio de período: (clave, subida, bajada) del que termina
+        self._closing: Dict[str, Tuple[str, array, array]] = {}
+        self._before = 0.0  # Fracción del avance que corresponde al período que termina
+        self._now = 0.0
+        self._new_count = False
+        # Timestamp del ciclo abierto; el ciclo empieza con el primer lote (False: ninguno abierto)
+        self._pending: Any = False
+        self._started = False
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # --- Ciclo ---
+
+    def _period_keys(self, epoch: float) -> Dict[str, str]:
+        local = datetime.fromtimestamp(epoch, tz=self.tz)
+        return {p: local.strftime(fmt) for p, fmt in _KEY_FORMATS.items()}
+
+    def begin_cycle(self, timestamp: Optional[datetime]):
+        """
+        Abre un ciclo. Los períodos recién se cierran con el primer lote: si
+        el router no responde, el cambio de hora queda para el ciclo que sí
+        traiga datos (y el avance se reparte con el último ciclo completo).
+        """
+        self._pending = timestamp
+        self._started = False
+
+    def _start(self, timestamp: Optional[datetime]):
+        self._started = True
+        self.cycle += 1
+        now = timestamp.replace(tzinfo=timestamp.tzinfo or timezone.utc).timestamp() if timestamp else time.time()
+        keys = self._period_keys(now)
+        self._now = now
+        self._new_count = self.last_cycle is not None
+        self._before = 0.0
+        if not self.keys:
+            self.keys = keys
+            return
+        changed = [p for p in PERIODS if keys[p] != self.keys[p]]
+        if not changed:
+            return
+        if self.last_cycle is not None and now > self.last_cycle:
+            hour_start = datetime.fromtimestamp(now, tz=self.tz).replace(minute=0, second=0, microsecond=0)
+            self._before = max(0.0, min(1.0, (hour_start.timestamp() - self.last_cycle) / (now - self.last_cycle)))
+        for period in changed:
+            up, down = self.totals[period]
+            self._closing[period] = (self.keys[period], up, down)
+            self.totals[period] = (array('q', bytes(8 * len(up))), array('q', bytes(8 * len(down))))
+            self.keys[period] = keys[period]
+
+    def add(self, samples: QueueSamples):
+        if not self._started:
+            self._start(self._pending if self._pending is not False else None)
+        slots = self._slots
+        seen = self._seen
+        cycle = self.cycle
+        last_up, last_down = self._last_up, self._last_down
+        current = [self.totals[p] for p in PERIODS]
+        closing = [self._closing.get(p) for p in PERIODS]
+        before = self._before
+        for i, name in enumerate(samples.names):
+            up_bytes = samples.upload_bytes[i]
+            down_bytes = samples.download_bytes[i]
+            slot = slots.get(name)
+            if slot is None:
+                slot = slots[name] = len(last_up)
+                seen.append(cycle)
+                last_up.append(up_bytes)
+                last_down.append(down_bytes)
+                for up, down in current:
+                    up.append(0)
+                    down.append(0)
+                for entry in closing:
+                    if entry is not None:
+                        entry[1].append(0)
+                        entry[2].append(0)
+                if not self._new_count:
+                    continue  # Primer ciclo: el contador es la línea de base
+                up_delta, down_delta = up_bytes, down_bytes
+            else:
+                seen[slot] = cycle
+                up_delta = counter_delta(last_up[slot], up_bytes)
+                down_delta = counter_delta(last_down[slot], down_bytes)
+                last_up[slot] = up_bytes
+                last_down[slot] = down_bytes
+            if not up_delta and not down_delta:
+                continue
+            up_before = int(up_delta * before)
+            down_before = int(down_delta * before)
+            for (up, down), entry in zip(current, closing):
+                if entry is None:
+                    up[slot] += up_delta
+                    down[slot] += down_delta
+                else:
+                    entry[1][slot] += up_before
+                    entry[2][slot] += down_before
+                    up[slot] += up_delta - up_before
+                    down[slot] += down_delta - down_before
+
+    def end_cycle(self):
+        """Cierra el ciclo y persiste (se llama desde un hilo)"""
+        self._finish(complete=True)
+
+    def abort_cycle(self):
+        """
+        Ciclo cortado por un error. Lo sumado hasta ahí es consumo real y
+        sus contadores ya son la nueva línea de base, así que se persiste
+        igual que un ciclo completo (incluido un período que se cerró).
+        Solo no se olvidan colas: las que faltan pueden no haber llegado.
+        """
+        self._finish(complete=False)
+
+    def _finish(self, complete: bool):
+        started, self._started, self._pending = self._started, False, False
+        if not started:
+            return  # Sin lotes: no cambió nada
+        self.last_cycle = self._now
+        closing, self._closing = self._closing, {}
+        os.makedirs(self.directory, exist_ok=True)
+        for period, (key, up, down) in closing.items():
+            _write_json(os.path.join(self.directory, f"{period}-{key}.json"), {
+                "router_alias": self.alias, "period": period, "key": key,
+                "usage": self._usage(up, down),
+            })
+            self._prune(period)
+        if closing and complete:
+            self._compact()
+        _write_json(os.path.join(self.directory, "state.json"), self.to_state())
+
+    def _compact(self):
+        """Olvida las colas que no vinieron en el ciclo y no tienen consumo en los períodos en curso"""
+        totals = [column for pair in self.totals.values() for column in pair]
+        keep = [
+            (name, slot) for name, slot in self._slots.items()
+            if self._seen[slot] == self.cycle or any(column[slot] for column in totals)
+        ]
+        if len(keep) == len(self._slots):
+            return
+        self._slots = {name: new for new, (name, _) in enumerate(keep)}
+        self._seen = array('q', (self._seen[slot] for _, slot in keep))
+        self._last_up = array('q', (self._last_up[slot] for _, slot in keep))
+        self._last_down = array('q', (self._last_down[slot] for _, slot in keep))
+        self.totals = {
+            period: (array('q', (up[slot] for _, slot in keep)), array('q', (down[slot] for _, slot in keep)))
+            for period, (up, down) in self.totals.items()
+        }
+
+    def _prune(self, period: str):
+        retention = _RETENTION.get(period)
+        if retention is None:
+            return
+        oldest = (datetime.now(self.tz) - retention).strftime(_KEY_FORMATS[period])
+        prefix = f"{period}-"
+        for entry in os.listdir(self.directory):
+            if entry.startswith(prefix) and entry.endswith(".json") and entry[len(prefix):-5] < oldest:
+                os.remove(os.path.join(self.directory, entry))
+
+    # --- Consultas y persistencia ---
+
+    def _usage(self, up: array, down: array) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"upload_bytes": up[slot], "download_bytes": down[slot]}
+            for name, slot in self._slots.items()
+            if up[slot] or down[slot]
+        }
+
+    def current(self, period: str) -> Dict[str, Any]:
+        up, down = self.totals[period]
+        return {
+            "router_alias": self.alias, "period": period, "key": self.keys.get(period),
+            "usage": self._usage(up, down),
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "router_alias": self.alias,
+            "last_cycle": self.last_cycle,
+            "keys": self.keys,
+            "names": list(self._slots),
+            "last_up": self._last_up.tolist(),
+            "last_down": self._last_down.tolist(),
+            "totals": {p: [up.tolist(), down.tolist()] for p, (up, down) in self.totals.items()},
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        self.last_cycle = state["last_cycle"]
+        self.keys = state["keys"]
+        self._slots = {name: slot for slot, name in enumerate(state["names"])}
+        self._seen = array('q', bytes(8 * len(self._slots)))
+        self._last_up = array('q', state["last_up"])
+        self._last_down = array('q', state["last_down"])
+        self.totals = {p: (array('q', up), array('q', down)) for p, (up, down) in state["totals"].items()}
+
+
+class UsageAccounting:
+    def __init__(self, directory: str, tz_name: str):
+        self.directory = directory
+        self.tz = ZoneInfo(tz_name)
+        self._routers: Dict[str, RouterUsage] = {}
+
+    def _load(self, alias: str) -> RouterUsage:
+        usage = RouterUsage(alias, _router_dir(self.directory, alias), self.tz)
+        path = os.path.join(usage.directory, "state.json")
+        try:
+            with open(path) as f:
+                usage.load_state(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Estado de consumo ilegible para '{alias}', se empieza de cero: {e}")
+        return usage
+
+    def for_router(self, alias: str) -> RouterUsage:
+        """Acumuladores del router (se cargan de disco la primera vez)"""
+        usage = self._routers.get(alias)
+        if usage is None:
+            usage = self._routers[alias] = self._load(alias)
+        return usage
+
+    def discard(self, alias: str):
+        """Deja de seguir un router; sus archivos quedan para consulta"""
+        self._routers.pop(alias, None)
+
+    def report(self, alias: str, period: str, key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Consumo de todas las colas de un router en un período. Sin `key`, el
+        período en curso (de memoria o, si el collector corre en otro
+        proceso, del último estado guardado).
+        """
+        usage = self._routers.get(alias)
+        if key is None or (usage is not None and usage.keys.get(period) == key):
+            if usage is None:
+                usage = self._load(alias)
+                if not usage.keys:
+                    return None
+            report = usage.current(period)
+            report["complete"] = False
+            return report
+        try:
+            with open(os.path.join(_router_dir(self.directory, alias), f"{period}-{key}.json")) as f:
+                report = json.load(f)
+        except FileNotFoundError:
+            return None
+        report["complete"] = True
+        return report
+
+
+# Global Instance
+usage_accounting = UsageAccounting(settings.USAGE_DIR, settings.USAGE_TIMEZONE)
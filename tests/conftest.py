@@ -0,0 +1,18 @@
+"""
+Los módulos del servicio crean sus instancias globales al importarse. Antes
+de eso, los directorios de estado se apuntan a un directorio temporal para
+que los tests no escriban en `data/`, y el backend por defecto es el almacén
+embebido (no hace falta InfluxDB).
+"""
+import os
+import tempfile
+
+_STATE = tempfile.mkdtemp(prefix="mikrotik-tests-")
+for _name, _sub in (
+    ("INFLUX_SPILL_DIR", "spill"),
+    ("EMBEDDED_STORE_DIR", "tsdb"),
+    ("COLLECTOR_LEASE_DIR", "leases"),
+    ("USAGE_DIR", "usage"),
+):
+    os.environ.setdefault(_name, os.path.join(_STATE, _sub))
+os.environ.setdefault("STORAGE_BACKEND", "embedded")
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from services.anomaly_detector import AnomalyDetector
+from services.queue_parser import parse_queue_batch
+
+T0 = datetime(2026, 10, 17, 10, 0, 0)
+
+
+def detector(alpha=1.0, **overrides):
+    options = dict(enabled=True, alpha=alpha, saturation_ratio=0.9, clear_ratio=0.7,
+                   drop_min_pps=10, drop_zscore=3, max_events=100)
+    options.update(overrides)
+    return AnomalyDetector(**options)
+
+
+def cycle(anomalies, minute, queues):
+    """{nombre: (bajada bps, max-limit de bajada, descartes acumulados)}; devuelve (tipo, estado)"""
+    rows = [
+        {"name": name, "target": "10.0.0.1", "rate": f"0/{rate}", "max-limit": f"0/{limit}", "dropped": f"0/{dropped}"}
+        for name, (rate, limit, dropped) in queues.items()
+    ]
+    anomalies.begin_cycle()
+    events = anomalies.check(parse_queue_batch(rows, anomalies.alias, T0 + timedelta(minutes=minute)))
+    events += anomalies.end_cycle()
+    return [(event.kind, event.state) for event in events]
+
+
+def test_saturation_opens_and_closes_with_hysteresis():
+    anomalies = detector().for_router("r1")
+    assert cycle(anomalies, 0, {"a": (50, 100, 0)}) == []  # Primera muestra: solo inicia el promedio
+    assert cycle(anomalies, 1, {"a": (89, 100, 0)}) == []
+    assert cycle(anomalies, 2, {"a": (90, 100, 0)}) == [("download_saturation", "start")]
+    # Entre los dos umbrales la alerta sigue abierta
+    assert cycle(anomalies, 3, {"a": (75, 100, 0)}) == []
+    assert cycle(anomalies, 4, {"a": (69, 100, 0)}) == [("download_saturation", "end")]
+
+
+def test_saturation_uses_the_moving_average():
+    anomalies = detector(alpha=0.5).for_router("r1")
+    cycle(anomalies, 0, {"a": (0, 100, 0)})
+    # Un pico aislado solo lleva el promedio a la mitad
+    assert cycle(anomalies, 1, {"a": (100, 100, 0)}) == []
+    assert cycle(anomalies, 2, {"a": (100, 100, 0)}) == []  # 0.75
+    assert cycle(anomalies, 3, {"a": (100, 100, 0)}) == []  # 0.875
+    assert cycle(anomalies, 4, {"a": (100, 100, 0)}) == [("download_saturation", "start")]  # 0.9375
+
+
+def test_queue_without_limit_is_not_evaluated_and_closes_its_alert():
+    anomalies = detector().for_router("r1")
+    assert cycle(anomalies, 0, {"a": (10 ** 9, 0, 0)}) == []
+    cycle(anomalies, 1, {"a": (95, 100, 0)})
+    assert cycle(anomalies, 2, {"a": (95, 100, 0)}) == [("download_saturation", "start")]
+    assert cycle(anomalies, 3, {"a": (95, 0, 0)}) == [("download_saturation", "end")]
+
+
+def test_drops_need_the_minimum_and_the_zscore():
+    anomalies = detector(alpha=0.5).for_router("r1")
+    cycle(anomalies, 0, {"a": (0, 0, 0)})
+    # 5 pps: por debajo del mínimo, solo alimenta el promedio
+    assert cycle(anomalies, 1, {"a": (0, 0, 300)}) == []
+    # 20 pps: muy por encima de lo habitual
+    assert cycle(anomalies, 2, {"a": (0, 0, 1500)}) == [("drops", "start")]
+    assert cycle(anomalies, 3, {"a": (0, 0, 2700)}) == []
+    assert cycle(anomalies, 4, {"a": (0, 0, 3000)}) == [("drops", "end")]
+    # Otra vez 20 pps, pero dentro de la variación aprendida
+    assert cycle(anomalies, 5, {"a": (0, 0, 4200)}) == []
+
+
+def test_deleted_queue_closes_its_alerts():
+    detection = detector()
+    anomalies = detection.for_router("r1")
+    cycle(anomalies, 0, {"a": (95, 100, 0), "b": (0, 100, 0)})
+    cycle(anomalies, 1, {"a": (95, 100, 0), "b": (0, 100, 0)})
+    assert [e.user_name for e in detection.active()] == ["a"]
+    assert cycle(anomalies, 2, {"b": (0, 100, 0)}) == [("download_saturation", "end")]
+    assert len(anomalies) == 1 and detection.active() == []
+
+
+def test_aborted_cycle_keeps_missing_queues():
+    anomalies = detector().for_router("r1")
+    cycle(anomalies, 0, {"a": (0, 100, 0), "b": (0, 100, 0)})
+    anomalies.begin_cycle()
+    anomalies.abort_cycle()
+    assert cycle(anomalies, 1, {"a": (0, 100, 0), "b": (0, 100, 0)}) == []
+    assert len(anomalies) == 2
+
+
+def test_disabled_detector_returns_nothing():
+    anomalies = detector(enabled=False).for_router("r1")
+    cycle(anomalies, 0, {"a": (95, 100, 0)})
+    assert cycle(anomalies, 1, {"a": (95, 100, 0)}) == []
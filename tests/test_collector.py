@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime
+import pytest
+from models.router_config import RouterConfig
+from services import collector_service as collector_module
+from services.circuit_breaker import router_breakers
+from services.queue_parser import parse_queue_batch
+
+ROUTER = RouterConfig(host="10.0.0.1", username="u", password="p", alias="r-collector")
+T0 = datetime(2026, 10, 17, 10, 0, 0)
+
+
+def fake_stream(error=None):
+    async def stream(router, batch_size, timestamp):
+        yield parse_queue_batch([{"name": "a", "target": "10.0.0.1", "bytes": "10/10"}], router.alias, timestamp)
+        if error:
+            raise error
+
+    return stream
+
+
+class FailingStorage:
+    async def write_samples_async(self, samples, on_written=None):
+        raise OSError("disco lleno")
+
+    async def write_payload_async(self, payload):
+        raise OSError("disco lleno")
+
+
+@pytest.fixture
+def collect():
+    service = collector_module.CollectorService()
+    yield lambda: asyncio.run(service._collect_from_router(ROUTER, T0))
+    router_breakers.discard(ROUTER.alias)
+    service._forget(ROUTER.alias)
+
+
+def test_router_error_counts_against_the_breaker(monkeypatch, collect):
+    monkeypatch.setattr(collector_module.mikrotik_service, "stream_queue_batches", fake_stream(ConnectionError("reset")))
+    assert collect() is None
+    assert router_breakers.for_router(ROUTER.alias).failures == 1
+
+
+def test_storage_error_aborts_the_cycle_but_not_the_breaker(monkeypatch, collect):
+    monkeypatch.setattr(collector_module.mikrotik_service, "stream_queue_batches", fake_stream())
+    monkeypatch.setattr(collector_module, "storage", FailingStorage())
+    assert collect() is None
+    breaker = router_breakers.for_router(ROUTER.alias)
+    assert (breaker.failures, breaker.last_error) == (0, None)
+
+
+def test_open_breaker_skips_the_router_without_a_queue_count(monkeypatch, collect):
+    monkeypatch.setattr(collector_module.mikrotik_service, "stream_queue_batches", fake_stream(ConnectionError("reset")))
+    for _ in range(router_breakers.failure_threshold):
+        collect()
+    assert router_breakers.for_router(ROUTER.alias).state == "open"
+    assert collect() is None
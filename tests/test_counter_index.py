@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from services.counter_index import RouterCounterIndex, counter_delta
+from services.queue_parser import parse_queue_batch
+
+T0 = datetime(2026, 10, 17, 10, 0, 0)
+
+
+def batch(timestamp, queues, rate="0/0"):
+    """Lote como lo entrega el router: {nombre: "subida/bajada" de bytes}"""
+    rows = [
+        {"name": name, "target": "10.0.0.1/32", "bytes": counters, "packets": "0/0", "dropped": "0/0", "rate": rate}
+        for name, counters in queues.items()
+    ]
+    return parse_queue_batch(rows, "r1", timestamp)
+
+
+def cycle(index, timestamp, queues, rate="0/0"):
+    index.begin_cycle()
+    written = index.update(batch(timestamp, queues, rate))
+    index.end_cycle()
+    return written
+
+
+def test_counter_delta_advances():
+    assert counter_delta(100, 250) == 150
+    assert counter_delta(100, 100) == 0
+
+
+def test_counter_delta_after_wrap_or_reset_counts_current_value():
+    # Un contador que bajó se reinició (o dio la vuelta): lo contado es el valor actual
+    assert counter_delta(2 ** 32 - 10, 5) == 5
+    assert counter_delta(5000, 0) == 0
+
+
+def test_update_computes_interval_averages():
+    index = RouterCounterIndex(keyframe_cycles=100)
+    cycle(index, T0, {"a": "0/0"})
+    written = cycle(index, T0 + timedelta(seconds=60), {"a": "600/1200"})
+    assert written.names == ["a"]
+    assert written.upload_avg_bps[0] == 600 * 8 // 60
+    assert written.download_avg_bps[0] == 1200 * 8 // 60
+
+
+def test_update_after_counter_reset_uses_current_value():
+    index = RouterCounterIndex(keyframe_cycles=100)
+    cycle(index, T0, {"a": "6000/6000"})
+    written = cycle(index, T0 + timedelta(seconds=60), {"a": "120/60"})
+    assert written.upload_avg_bps[0] == 120 * 8 // 60
+    assert written.download_avg_bps[0] == 60 * 8 // 60
+
+
+def test_update_skips_unchanged_queues():
+    index = RouterCounterIndex(keyframe_cycles=100)
+    first = cycle(index, T0, {"a": "10/10", "b": "10/10"})
+    assert first.names == ["a", "b"]
+    written = cycle(index, T0 + timedelta(seconds=60), {"a": "10/10", "b": "20/10"})
+    assert written.names == ["b"]
+
+
+def test_queue_that_stops_is_written_once_more():
+    index = RouterCounterIndex(keyframe_cycles=100)
+    cycle(index, T0, {"a": "10/10"}, rate="5/5")
+    # Sin tráfico: se escribe una vez para registrar el rate en 0, y después no
+    assert cycle(index, T0 + timedelta(seconds=60), {"a": "10/10"}).names == ["a"]
+    assert cycle(index, T0 + timedelta(seconds=120), {"a": "10/10"}).names == []
+
+
+def test_keyframe_emits_every_queue():
+    index = RouterCounterIndex(keyframe_cycles=3)
+    queues = {"a": "10/10", "b": "10/10"}
+    emitted = [len(cycle(index, T0 + timedelta(seconds=60 * i), queues)) for i in range(6)]
+    # Ciclo 1: primer ciclo (todo es nuevo); ciclos 3 y 6: keyframes
+    assert emitted == [2, 0, 2, 0, 0, 2]
+
+
+def test_keyframe_forgets_removed_queues():
+    index = RouterCounterIndex(keyframe_cycles=3)
+    cycle(index, T0, {"a": "10/10", "b": "10/10"})
+    cycle(index, T0 + timedelta(seconds=60), {"a": "10/10"})
+    assert len(index) == 2  # Fuera de un keyframe no se compacta
+    cycle(index, T0 + timedelta(seconds=120), {"a": "10/10"})
+    assert len(index) == 1
+
+
+def test_aborted_cycle_repeats_the_keyframe():
+    index = RouterCounterIndex(keyframe_cycles=2)
+    cycle(index, T0, {"a": "10/10"})
+    assert index.begin_cycle() is True
+    index.abort_cycle()
+    assert index.begin_cycle() is True
+
+
+def test_queue_with_advancing_counters_is_written_once_more_when_it_stops():
+    index = RouterCounterIndex(keyframe_cycles=100)
+    cycle(index, T0, {"a": "10/10"})
+    # Rate en 0 pero los contadores avanzaron: el punto lleva promedios > 0
+    assert cycle(index, T0 + timedelta(seconds=60), {"a": "610/10"}).names == ["a"]
+    # Sin cambios: se escribe una vez más con los promedios en 0
+    written = cycle(index, T0 + timedelta(seconds=120), {"a": "610/10"})
+    assert (written.names, written.upload_avg_bps[0]) == (["a"], 0)
+    assert cycle(index, T0 + timedelta(seconds=180), {"a": "610/10"}).names == []
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from core.config import settings
+from core.embedded_store import EmbeddedStore
+
+
+def line(timestamp, user="a", upload=0, download=0, router="r1"):
+    return (
+        f"mikrotik_traffic,plan_profile=p,router_alias={router},target_ip=10.0.0.1,user_name={user} "
+        f"upload_bps={upload}i,download_bps={download}i {timestamp}"
+    )
+
+
+def write(store, *lines):
+    store._write_payload("\n".join(lines).encode())
+
+
+def latest(store, user="a", max_age=3600):
+    return asyncio.run(store.latest_values(user, max_age))
+
+
+def history(store, every, fn="mean", range="1h"):
+    async def collect():
+        return [point async for chunk in store.history_stream(["a"], None, range, every, fn) for point in chunk]
+
+    return asyncio.run(collect())
+
+
+def test_append_and_latest_values(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    now = int(time.time())
+    write(store, line(now - 20, upload=1), line(now - 10, upload=2), line(now - 10, user="b", upload=5))
+
+    queues = latest(store)
+    assert [(q["name"], q["upload_bps"]) for q in queues] == [("a", 2)]
+    assert asyncio.run(store.current_load(3600))["upload_bps"] == 7
+    # Fuera de max_age no aparece
+    assert latest(store, max_age=5) == []
+    store.close()
+
+
+def test_same_timestamp_replaces_last_point(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    now = int(time.time())
+    write(store, line(now - 20, upload=1), line(now - 10, upload=2))
+    write(store, line(now - 10, upload=3))
+
+    assert latest(store)[0]["upload_bps"] == 3
+    assert (tmp_path / "series" / "0.bin").stat().st_size == 2 * 11 * 8
+    store.close()
+
+
+def test_out_of_order_point_is_dropped(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    now = int(time.time())
+    write(store, line(now - 10, upload=2))
+    write(store, line(now - 20, upload=1))
+
+    assert store.out_of_order == 1
+    assert latest(store)[0]["upload_bps"] == 2
+    store.close()
+
+
+def upload_points(store, every, fn="mean"):
+    return [(p.time.timestamp(), p.value) for p in history(store, every, fn) if p.field == "upload_bps"]
+
+
+def test_history_windows_are_aligned_to_epoch(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "COLLECTOR_DELTA_ENABLED", False)
+    store = EmbeddedStore(str(tmp_path))
+    base = (int(time.time()) // 600 - 2) * 600
+    write(store, line(base, upload=10), line(base + 60, upload=30), line(base + 600, upload=50))
+
+    assert upload_points(store, "10m") == [(base + 600, 20), (base + 1200, 50)]
+    store.close()
+
+
+def test_history_fills_delta_gaps_with_the_last_value(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "COLLECTOR_DELTA_ENABLED", True)
+    monkeypatch.setattr(settings, "COLLECTOR_INTERVAL_SECONDS", 60)
+    store = EmbeddedStore(str(tmp_path))
+    base = (int(time.time()) // 600 - 2) * 600
+    # Cola activa un ciclo; al siguiente se escribe en 0 y después no cambia más
+    write(store, line(base, upload=100), line(base + 60, upload=0))
+
+    # Diez slots de 60 s en la primera ventana: uno con 100 y nueve en 0
+    assert upload_points(store, "10m") == [(base + 600, 10), (base + 1200, 0)]
+    assert upload_points(store, "10m", "max")[0] == (base + 600, 100)
+    store.close()
+
+
+def test_history_does_not_carry_values_past_a_keyframe(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "COLLECTOR_DELTA_ENABLED", True)
+    monkeypatch.setattr(settings, "COLLECTOR_INTERVAL_SECONDS", 60)
+    monkeypatch.setattr(settings, "COLLECTOR_KEYFRAME_CYCLES", 2)
+    store = EmbeddedStore(str(tmp_path))
+    base = (int(time.time()) // 600 - 2) * 600
+    # Cola borrada: su último punto vale hasta tres intervalos
+    write(store, line(base, upload=40))
+
+    assert upload_points(store, "1m") == [(base + 60 * (i + 1), 40) for i in range(4)]
+    store.close()
+
+
+def test_history_carries_the_point_before_the_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "COLLECTOR_DELTA_ENABLED", True)
+    monkeypatch.setattr(settings, "COLLECTOR_INTERVAL_SECONDS", 60)
+    monkeypatch.setattr(settings, "COLLECTOR_KEYFRAME_CYCLES", 100)
+    store = EmbeddedStore(str(tmp_path))
+    now = int(time.time())
+    write(store, line(now - 7200, upload=0), line(now - 3660, upload=70))
+
+    points = upload_points(store, "1m")
+    assert len(points) >= 59 and {value for _, value in points} == {70}
+    store.close()
+
+
+def test_compaction_drops_old_records_and_keeps_appending(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    now = int(time.time())
+    write(store, line(now - 7200, upload=1), line(now - 60, upload=2))
+    assert store.compact(3600) == 1
+
+    # El descriptor abierto apuntaba al archivo reemplazado: se escribe en el nuevo
+    write(store, line(now - 30, upload=3))
+    assert (tmp_path / "series" / "0.bin").stat().st_size == 2 * 11 * 8
+    assert latest(store)[0]["upload_bps"] == 3
+    store.close()
+
+
+def test_index_is_shared_between_instances(tmp_path):
+    writer = EmbeddedStore(str(tmp_path))
+    reader = EmbeddedStore(str(tmp_path))
+    write(writer, line(int(time.time()) - 10, upload=4))
+    assert latest(reader)[0]["upload_bps"] == 4
+    writer.close()
@@ -0,0 +1,27 @@
+from core.database import flux_string
+
+
+def test_plain_value_is_quoted():
+    assert flux_string("cliente_4") == '"cliente_4"'
+
+
+def test_utf8_is_kept_as_is():
+    # Flux no tiene escapes \uXXXX: "José" no coincidiría con el tag
+    assert flux_string("José Peña") == '"José Peña"'
+
+
+def test_quotes_and_backslashes_are_escaped():
+    assert flux_string('a"b') == '"a\\"b"'
+    assert flux_string('c\\d') == '"c\\\\d"'
+    assert flux_string('x\\"') == '"x\\\\\\""'
+
+
+def test_interpolation_is_escaped():
+    assert flux_string("${token}") == '"\\${token}"'
+    assert flux_string("$x {y}") == '"$x {y}"'
+
+
+def test_value_cannot_close_the_literal():
+    literal = flux_string('") |> drop() //')
+    assert literal.startswith('"\\")')
+    assert literal.count('"') - literal.count('\\"') == 2
@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from services import history_cache as cache_module
+from services.history_cache import HistoryCache
+
+
+def key(user="a"):
+    return (user, "1h", "1m", "mean")
+
+
+def loader(value, calls, started=None, release=None, error=None):
+    async def load():
+        calls.append(value)
+        if started is not None:
+            started.set()
+        if release is not None:
+            await release.wait()
+        if error:
+            raise error
+        return value
+
+    return load
+
+
+def test_hit_until_the_ttl_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache, calls = HistoryCache(ttl=10, max_entries=8), []
+
+    async def run():
+        assert await cache.get_or_load(key(), loader(1, calls)) == 1
+        assert await cache.get_or_load(key(), loader(2, calls)) == 1
+        now[0] += 10
+        assert await cache.get_or_load(key(), loader(3, calls)) == 3
+
+    asyncio.run(run())
+    assert calls == [1, 3]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache, calls = HistoryCache(ttl=60, max_entries=2), []
+
+    async def run():
+        await cache.get_or_load(key("a"), loader("a", calls))
+        await cache.get_or_load(key("b"), loader("b", calls))
+        await cache.get_or_load(key("a"), loader("a", calls))  # a pasa a ser la más reciente
+        await cache.get_or_load(key("c"), loader("c", calls))
+
+    asyncio.run(run())
+    assert list(cache._entries) == [key("a"), key("c")]
+    assert set(cache._by_user) == {"a", "c"}
+
+
+def test_concurrent_requests_share_one_query():
+    cache, calls = HistoryCache(ttl=60, max_entries=8), []
+
+    async def run():
+        release = asyncio.Event()
+        first = asyncio.create_task(cache.get_or_load(key(), loader(1, calls, release=release)))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_load(key(), loader(2, calls)))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == [1, 1]
+    assert calls == [1]
+
+
+def test_concurrent_requests_share_the_error():
+    cache, calls = HistoryCache(ttl=60, max_entries=8), []
+
+    async def run():
+        release = asyncio.Event()
+        first = asyncio.create_task(cache.get_or_load(key(), loader(1, calls, release=release, error=OSError("caído"))))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_load(key(), loader(2, calls)))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, OSError) for result in results)
+    assert calls == [1] and not cache._entries and not cache._inflight
+
+
+def test_invalidation_during_the_query_is_not_stored():
+    cache, calls = HistoryCache(ttl=60, max_entries=8), []
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+        task = asyncio.create_task(cache.get_or_load(key(), loader(1, calls, started, release)))
+        await started.wait()
+        cache.invalidate(["a"])
+        release.set()
+        assert await task == 1
+        # Los datos cambiaron durante la consulta: la siguiente vuelve a consultar
+        assert await cache.get_or_load(key(), loader(2, calls)) == 2
+
+    asyncio.run(run())
+    assert calls == [1, 2]
+
+
+def test_invalidate_drops_only_the_written_users():
+    cache, calls = HistoryCache(ttl=60, max_entries=8), []
+
+    async def run():
+        await cache.get_or_load(key("a"), loader("a", calls))
+        await cache.get_or_load(key("b"), loader("b", calls))
+        cache.invalidate(["a", "z"])
+
+    asyncio.run(run())
+    assert list(cache._entries) == [key("b")]
+    assert cache.invalidations == 1
+
+
+@pytest.mark.parametrize("ttl,max_entries", [(0, 8), (60, 0)])
+def test_disabled_cache_always_loads(ttl, max_entries):
+    cache, calls = HistoryCache(ttl=ttl, max_entries=max_entries), []
+
+    async def run():
+        await cache.get_or_load(key(), loader(1, calls))
+        await cache.get_or_load(key(), loader(2, calls))
+
+    asyncio.run(run())
+    assert calls == [1, 2] and not cache._entries
@@ -0,0 +1,87 @@
+from datetime import datetime
+from services import latest_store as store_module
+from services.latest_store import LatestValueStore
+from services.queue_parser import parse_queue_batch
+
+T0 = datetime(2026, 10, 17, 10, 0, 0)
+
+
+def batch(alias, queues):
+    """{nombre: (download_bps, descartados de bajada)}"""
+    rows = [
+        {"name": name, "target": "10.0.0.1", "rate": f"0/{rate}", "dropped": f"0/{dropped}"}
+        for name, (rate, dropped) in queues.items()
+    ]
+    return parse_queue_batch(rows, alias, T0)
+
+
+def publish(store, alias, *batches):
+    store.begin(alias, T0)
+    for queues in batches:
+        store.add(alias, batch(alias, queues))
+    store.commit(alias)
+
+
+def ranking(rows):
+    return [(row["name"], row["value"]) for row in rows]
+
+
+def test_router_top_spans_batches_and_skips_zeros():
+    store = LatestValueStore(top_n=3)
+    publish(store, "r1", {"a": (10, 0), "b": (50, 0), "c": (0, 0)}, {"d": (30, 0), "e": (40, 0)})
+    assert ranking(store.top("download_bps", "r1")) == [("b", 50), ("e", 40), ("d", 30)]
+    assert store.top("upload_bps", "r1") == []
+    assert ranking(store.top("download_bps", "r1", limit=1)) == [("b", 50)]
+    # El límite no puede pasar de N
+    assert len(store.top("download_bps", "r1", limit=10)) == 3
+
+
+def test_global_top_merges_routers():
+    store = LatestValueStore(top_n=2)
+    publish(store, "r1", {"a": (10, 0), "b": (50, 0)})
+    publish(store, "r2", {"a": (40, 0), "c": (5, 0)})
+    top = store.top("download_bps")
+    assert [(row["router_alias"], row["name"], row["value"]) for row in top] == [("r1", "b", 50), ("r2", "a", 40)]
+
+    store.discard("r1")
+    assert ranking(store.top("download_bps")) == [("a", 40), ("c", 5)]
+
+
+def test_dropped_top_uses_the_interval_delta():
+    store = LatestValueStore(top_n=5)
+    publish(store, "r1", {"a": (0, 100), "b": (0, 5)})
+    # Primera foto: sin foto anterior no hay intervalo
+    assert store.top("dropped", "r1") == []
+    publish(store, "r1", {"a": (0, 130), "b": (0, 5), "c": (0, 9)})
+    # c es nueva y b no descartó nada en el intervalo
+    assert ranking(store.top("dropped", "r1")) == [("a", 30)]
+
+
+def test_aborted_cycle_keeps_the_previous_top():
+    store = LatestValueStore(top_n=2)
+    publish(store, "r1", {"a": (10, 0)})
+    store.begin("r1", T0)
+    store.add("r1", batch("r1", {"b": (99, 0)}))
+    store.abort("r1")
+    assert ranking(store.top("download_bps")) == [("a", 10)]
+
+
+def test_global_top_leaves_out_stale_routers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(store_module.time, "monotonic", lambda: now[0])
+    store = LatestValueStore(top_n=2)
+    publish(store, "r1", {"a": (10, 0)})
+    now[0] += 100
+    publish(store, "r2", {"b": (5, 0)})
+    assert ranking(store.top("download_bps", max_age=60)) == [("b", 5)]
+    assert ranking(store.top("download_bps")) == [("b", 5)]
+
+    # Al volver a publicar, el router vuelve al top global
+    publish(store, "r1", {"a": (10, 0)})
+    assert ranking(store.top("download_bps", max_age=60)) == [("a", 10), ("b", 5)]
+
+
+def test_disabled_top_is_empty():
+    store = LatestValueStore(top_n=0)
+    publish(store, "r1", {"a": (10, 0)})
+    assert store.top("download_bps") == [] and store.top("download_bps", "r1") == []
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from influxdb_client import Point, WritePrecision
+from core.embedded_store import parse_line
+from core.line_protocol import escape_tag, escape_tags, serialize_alerts, serialize_samples, to_epoch_seconds
+from models.alerts import AlertEvent
+from services.queue_parser import parse_queue_batch
+
+T0 = datetime(2026, 10, 17, 10, 0, 0)
+
+
+def samples(name, target="10.0.0.1/32", router="r1"):
+    row = {"name": name, "target": target, "bytes": "100/200", "packets": "1/2", "dropped": "0/0", "rate": "8/16"}
+    return parse_queue_batch([row], router, T0)
+
+
+def test_escape_tag_matches_influxdb_client():
+    for value in ("plain", "con espacio", "a,b=c", "línea\nnueva", "tab\there", "retorno\r"):
+        point = Point("m").tag("t", value).field("f", 1)
+        assert point.to_line_protocol() == f"m,t={escape_tag(value)} f=1i"
+
+
+def test_escape_tags_batch():
+    values = ["plain", "con espacio", "a,b=c"]
+    assert escape_tags(values) == [escape_tag(v) for v in values]
+    # Sin nada que escapar se devuelve la misma lista
+    assert escape_tags(["a", "b"]) == ["a", "b"]
+
+
+def test_escape_tags_with_nul_falls_back_to_one_by_one():
+    values = ["a\x00b c", "d"]
+    assert escape_tags(values) == ["a\x00b\\ c", "d"]
+
+
+def test_naive_datetime_is_utc():
+    assert to_epoch_seconds(T0) == to_epoch_seconds(T0.replace(tzinfo=timezone.utc))
+
+
+def test_serialize_samples_matches_influxdb_client():
+    batch = samples("José Pérez, casa", target="10.0.0.1/32")
+    point = (
+        Point("mikrotik_traffic")
+        .tag("plan_profile", "unknown").tag("router_alias", "r1")
+        .tag("target_ip", "10.0.0.1").tag("user_name", "José Pérez, casa")
+        .time(T0, WritePrecision.S)
+    )
+    for field in ("download_avg_bps", "download_bps", "download_bytes", "download_pps", "dropped_download",
+                  "dropped_upload", "upload_avg_bps", "upload_bps", "upload_bytes", "upload_pps"):
+        point.field(field, getattr(batch, field)[0])
+    assert serialize_samples(batch) == point.to_line_protocol(WritePrecision.S).encode()
+
+
+def test_serialize_samples_round_trip():
+    payload = serialize_samples(samples("a b,c=d", router="core 1"))
+    measurement, tags, values, timestamp = parse_line(payload.decode())
+    assert measurement == "mikrotik_traffic"
+    assert (tags["user_name"], tags["router_alias"]) == ("a b,c=d", "core 1")
+    assert (values["upload_bytes"], values["download_bytes"], timestamp) == (100, 200, to_epoch_seconds(T0))
+
+
+def test_serialize_empty_batch():
+    assert serialize_samples(parse_queue_batch([], "r1", T0)) == b""
+
+
+def test_serialize_alerts():
+    event = AlertEvent(1760000000, "core 1", "a,b", "saturation", "start", 95, 90)
+    assert serialize_alerts([event]) == (
+        b"mikrotik_alerts,kind=saturation,router_alias=core\\ 1,state=start,user_name=a\\,b"
+        b" limit=90i,value=95i 1760000000"
+    )
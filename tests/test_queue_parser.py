@@ -0,0 +1,46 @@
+from datetime import datetime
+from services.queue_parser import _split_pair, parse_queue_batch
+
+T0 = datetime(2026, 10, 17, 10, 0, 0)
+
+
+def parse(*values, key="bytes"):
+    rows = [{"name": f"q{i}", "target": "10.0.0.1/32", key: value} for i, value in enumerate(values)]
+    return parse_queue_batch(rows, "r1", T0)
+
+
+def test_batch_is_parsed_to_columns():
+    batch = parse_queue_batch([
+        {"name": "a", "target": "10.0.0.1/32", "bytes": "10/20", "packets": "1/2", "dropped": "0/3", "rate": "8/16"},
+        {"name": "b", "target": "10.0.0.2", "bytes": "30/40"},
+    ], "r1", T0)
+    assert batch.names == ["a", "b"]
+    assert batch.target_ips == ["10.0.0.1", "10.0.0.2"]
+    assert (list(batch.upload_bytes), list(batch.download_bytes)) == ([10, 30], [20, 40])
+    assert (list(batch.dropped_upload), list(batch.dropped_download)) == ([0, 0], [3, 0])
+    # Sin historial: el promedio es el rate instantáneo
+    assert (list(batch.upload_avg_bps), list(batch.download_avg_bps)) == ([8, 0], [16, 0])
+
+
+def test_rows_without_name_are_skipped():
+    batch = parse_queue_batch([{"target": "10.0.0.1", "bytes": "1/1"}, {"name": "a"}], "r1", T0)
+    assert batch.names == ["a"]
+    assert batch.target_ips == ["unknown"]
+
+
+def test_malformed_value_only_zeroes_its_row():
+    batch = parse("10/20", "basura", "30/40")
+    assert (list(batch.upload_bytes), list(batch.download_bytes)) == ([10, 0, 30], [20, 0, 40])
+
+
+def test_extra_slash_does_not_shift_the_columns():
+    # Misma cantidad total de '/' que dos valores válidos
+    batch = parse("1/2/3", "5", "7/8")
+    assert (list(batch.upload_bytes), list(batch.download_bytes)) == ([1, 0, 7], [2, 0, 8])
+
+
+def test_value_outside_int64_is_zeroed():
+    batch = parse("10/20", f"{2 ** 63}/1")
+    assert (list(batch.upload_bytes), list(batch.download_bytes)) == ([10, 0], [20, 0])
+    assert _split_pair(f"1/{-2 ** 63 - 1}") == (0, 0)
+    assert _split_pair(f"{2 ** 63 - 1}/0") == (2 ** 63 - 1, 0)
@@ -0,0 +1,64 @@
+import pytest
+from core.line_protocol import TRAFFIC_MEASUREMENT
+from services import rollups as rollups_module
+from services.rollups import RollupManager
+
+NOW = 1_800_000_000
+RAW = (TRAFFIC_MEASUREMENT, None)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(rollups_module.time, "time", lambda: NOW)
+    manager = RollupManager("1h, 5m,bogus,5m")
+    manager.active = True
+    for tier in manager.tiers:
+        tier.start = NOW - 30 * 86400  # Ambos niveles con datos de 30 días
+    return manager
+
+
+def test_tiers_are_sorted_and_chained():
+    manager = RollupManager("1h, 5m,bogus,5m")
+    assert [t.every for t in manager.tiers] == ["5m", "1h"]
+    assert manager.tiers[0].source is None
+    assert manager.tiers[1].source is manager.tiers[0]
+
+
+def test_inactive_manager_uses_raw_data(manager):
+    manager.active = False
+    assert manager.select("1h", "mean", "7d") == RAW
+
+
+def test_only_rolled_up_functions_are_routed(manager):
+    assert manager.select("1h", "max", "7d") == (f"{TRAFFIC_MEASUREMENT}_1h_max", "1h")
+    assert manager.select("1h", "last", "7d") == RAW
+
+
+@pytest.mark.parametrize("every,expected", [
+    ("1m", RAW),  # Más fino que cualquier nivel
+    ("5m", (f"{TRAFFIC_MEASUREMENT}_5m", "5m")),
+    ("7m", RAW),  # No es múltiplo de 5m
+    ("10m", (f"{TRAFFIC_MEASUREMENT}_5m", "5m")),
+    ("90m", (f"{TRAFFIC_MEASUREMENT}_5m", "5m")),  # Múltiplo de 5m pero no de 1h
+    ("2h", (f"{TRAFFIC_MEASUREMENT}_1h", "1h")),
+    ("1d", (f"{TRAFFIC_MEASUREMENT}_1h", "1h")),
+])
+def test_coarsest_dividing_tier_is_chosen(manager, every, expected):
+    assert manager.select(every, "mean", "7d") == expected
+
+
+def test_invalid_durations_use_raw_data(manager):
+    assert manager.select("bogus", "mean", "7d") == RAW
+    assert manager.select("1h", "mean", "bogus") == RAW
+
+
+def test_tier_is_used_only_if_it_covers_the_range(manager):
+    hour, five = manager.tiers[1], manager.tiers[0]
+    hour.start = NOW - 86400
+    # El nivel 1h solo tiene un día: para 7 días se baja al nivel 5m
+    assert manager.select("1h", "mean", "7d") == (f"{TRAFFIC_MEASUREMENT}_5m", "5m")
+    # La primera ventana cierra un intervalo después del inicio del rango
+    assert manager.select("1h", "mean", "25h") == (f"{TRAFFIC_MEASUREMENT}_1h", "1h")
+    assert manager.select("1h", "mean", "26h") == (f"{TRAFFIC_MEASUREMENT}_5m", "5m")
+    five.start = None  # Nivel todavía vacío
+    assert manager.select("1h", "mean", "7d") == RAW
@@ -0,0 +1,202 @@
+import asyncio
+import pytest
+from services.routeros_async import (
+    AsyncRouterOsApi,
+    RouterOsOverflowError,
+    RouterOsTrapError,
+    encode_sentence,
+    parse_sentence,
+    read_sentence,
+)
+
+
+class FakeRouterOsServer:
+    """Servidor API mínimo: login, /queue/simple y /system/identity"""
+
+    def __init__(self, queues: int = 10, username: str = "admin", password: str = "secret"):
+        self.username = username
+        self.password = password
+        self.queues = [
+            {
+                ".id": f"*{i + 1:X}",
+                "name": f"cliente_{i}",
+                "target": f"10.0.{i // 250}.{i % 250 + 1}/32",
+                "max-limit": "10000000/20000000",
+                "rate": f"{i * 10}/{i * 20}",
+                "bytes": f"{i * 1000}/{i * 2000}",
+                "packets": f"{i * 10}/{i * 20}",
+                "dropped": f"{i % 3}/{i % 5}",
+                "comment": f"Plan {i}",
+                "disabled": "false",
+            }
+            for i in range(queues)
+        ]
+        self.logins = 0
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        authenticated = False
+        try:
+            while True:
+                words = await read_sentence(reader)
+                command, tag, attrs = parse_sentence(words)
+                queries = [w[1:] for w in words[1:] if w.startswith("?")]
+                suffix = [f".tag={tag}"] if tag is not None else []
+
+                def reply(*sentence):
+                    writer.write(encode_sentence(list(sentence) + suffix))
+
+                if command == "/login":
+                    if attrs.get("name") == self.username and attrs.get("password") == self.password:
+                        authenticated = True
+                        self.logins += 1
+                        reply("!done")
+                    else:
+                        reply("!trap", "=message=invalid user name or password (6)")
+                        reply("!done")
+                elif not authenticated:
+                    reply("!fatal", "=message=not logged in")
+                    break
+                elif command == "/cancel":
+                    reply("!done")
+                elif command == "/system/identity/print":
+                    reply("!re", "=name=FakeRouter")
+                    reply("!done")
+                elif command == "/queue/simple/print":
+                    proplist = attrs[".proplist"].split(",") if ".proplist" in attrs else None
+                    for q in self.queues:
+                        if all(q.get(k) == v for k, _, v in (x.partition("=") for x in queries)):
+                            row = {k: q[k] for k in proplist if k in q} if proplist else q
+                            reply("!re", *[f"={k}={v}" for k, v in row.items()])
+                    reply("!done")
+                elif command == "/queue/simple/add":
+                    new_id = f"*{len(self.queues) + 1:X}"
+                    self.queues.append(dict(attrs, **{".id": new_id}))
+                    reply("!done", f"=ret={new_id}")
+                elif command == "/queue/simple/set":
+                    for q in self.queues:
+                        if q[".id"] == attrs.get(".id"):
+                            q.update(attrs)
+                    reply("!done")
+                else:
+                    reply("!trap", "=category=0", "=message=no such command")
+                    reply("!done")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def with_api(scenario, queues=1000, **options):
+    """Corre `scenario(api, server)` contra un servidor falso local"""
+    async def run():
+        server = FakeRouterOsServer(queues=queues)
+        port = await server.start()
+        api = await AsyncRouterOsApi.connect("127.0.0.1", port, "admin", "secret", **options)
+        try:
+            await scenario(api, server)
+        finally:
+            await api.close()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_login_and_print():
+    async def scenario(api, server):
+        rows = await api.get_resource("/queue/simple").get()
+        assert len(rows) == 1000
+        assert rows[5]["bytes"] == "5000/10000"
+        assert server.logins == 1
+
+    with_api(scenario)
+
+
+def test_query_and_proplist():
+    async def scenario(api, server):
+        rows = await api.get_resource("/queue/simple").get(name="cliente_42")
+        assert [r["name"] for r in rows] == ["cliente_42"]
+        rows = await api.get_resource("/queue/simple").get(proplist=("name", "bytes"), name="cliente_7")
+        assert rows == [{"name": "cliente_7", "bytes": "7000/14000"}]
+
+    with_api(scenario)
+
+
+def test_add_and_set():
+    async def scenario(api, server):
+        queues = api.get_resource("/queue/simple")
+        new_id = await queues.add(name="nuevo", target="10.9.9.9/32")
+        assert new_id == "*3E9"
+        await queues.set(**{".id": new_id, "max-limit": "5M/5M"})
+        rows = await queues.get(name="nuevo")
+        assert rows[0]["max-limit"] == "5M/5M"
+
+    with_api(scenario)
+
+
+def test_concurrent_commands_share_the_connection():
+    async def scenario(api, server):
+        results = await asyncio.gather(*[
+            api.get_resource("/queue/simple").get(name=f"cliente_{i}") for i in range(50)
+        ])
+        assert [r[0]["name"] for r in results] == [f"cliente_{i}" for i in range(50)]
+
+    with_api(scenario)
+
+
+def test_trap_keeps_the_connection_usable():
+    async def scenario(api, server):
+        with pytest.raises(RouterOsTrapError) as error:
+            await api.get_resource("/nope").call("frobnicate")
+        assert error.value.message == "no such command"
+        rows = await api.get_resource("/system/identity").get()
+        assert rows[0]["name"] == "FakeRouter"
+
+    with_api(scenario)
+
+
+def test_abandoned_stream_is_cancelled():
+    async def scenario(api, server):
+        async for _ in api.get_resource("/queue/simple").stream():
+            break
+        rows = await api.get_resource("/system/identity").get()
+        assert rows[0]["name"] == "FakeRouter"
+
+    with_api(scenario)
+
+
+def test_stalled_consumer_only_aborts_its_own_command():
+    async def scenario(api, server):
+        rows = api.get_resource("/queue/simple").stream()
+        await anext(rows)
+        # El consumidor del print se detuvo: las demás órdenes siguen respondiendo
+        identity = await asyncio.wait_for(api.get_resource("/system/identity").get(), 5)
+        assert identity[0]["name"] == "FakeRouter"
+        with pytest.raises(RouterOsOverflowError):
+            async for _ in rows:
+                pass
+        assert len(await api.get_resource("/queue/simple").get(name="cliente_3")) == 1
+
+    with_api(scenario, queues=200, max_pending=50)
+
+
+def test_invalid_login_is_rejected():
+    async def run():
+        server = FakeRouterOsServer()
+        port = await server.start()
+        try:
+            with pytest.raises(RouterOsTrapError):
+                await AsyncRouterOsApi.connect("127.0.0.1", port, "admin", "wrong")
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
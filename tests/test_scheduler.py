@@ -0,0 +1,148 @@
+import asyncio
+import time
+from models.router_config import RouterConfig
+from services.scheduler import PollingScheduler, _RouterSchedule
+
+
+def router(alias, interval=None):
+    return RouterConfig(host="10.0.0.1", username="u", password="p", alias=alias, interval_seconds=interval)
+
+
+def test_deadline_advances_from_previous_deadline():
+    async def run(router, timestamp):
+        return 0
+
+    async def scenario():
+        scheduler = PollingScheduler(run, default_interval=10, max_concurrent=4)
+        entry = _RouterSchedule(router("r1"), 10, deadline=100.0)
+        # La recolección arranca 2 s tarde: el próximo tick no se corre
+        scheduler._dispatch(entry, now=102.0)
+        assert entry.deadline == 110.0
+        await entry.task
+
+    asyncio.run(scenario())
+
+
+def test_missed_ticks_are_skipped_without_drift():
+    async def run(router, timestamp):
+        return 0
+
+    async def scenario():
+        scheduler = PollingScheduler(run, default_interval=10, max_concurrent=4)
+        entry = _RouterSchedule(router("r1"), 10, deadline=100.0)
+        # Se perdieron dos ticks (110 y 120): se corre una vez y se sigue en 130
+        scheduler._dispatch(entry, now=125.0)
+        assert entry.deadline == 130.0
+        await entry.task
+        assert entry.runs == 1
+
+    asyncio.run(scenario())
+
+
+def test_tick_is_skipped_while_previous_run_is_in_progress():
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def run(router, timestamp):
+            calls.append(router.alias)
+            await release.wait()
+            return 42
+
+        scheduler = PollingScheduler(run, default_interval=10, max_concurrent=4)
+        entry = _RouterSchedule(router("r1"), 10, deadline=100.0)
+        scheduler._dispatch(entry, now=100.0)
+        first = entry.task
+        await asyncio.sleep(0)
+        scheduler._dispatch(entry, now=110.0)
+        assert entry.task is first
+        assert entry.skipped == 1
+        assert entry.deadline == 120.0
+
+        release.set()
+        await first
+        assert calls == ["r1"]
+        assert entry.queue_count == 42
+
+    asyncio.run(scenario())
+
+
+def test_due_routers_run_and_are_rescheduled():
+    async def scenario():
+        runs = []
+
+        async def run(router, timestamp):
+            runs.append(router.alias)
+            return 0
+
+        scheduler = PollingScheduler(run, default_interval=10, max_concurrent=4)
+        scheduler.sync([router("r1"), router("r2", interval=30)])
+        for entry in scheduler._entries.values():
+            entry.deadline = time.monotonic()
+        await scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+        assert sorted(runs) == ["r1", "r2"]
+        stats = scheduler.stats()
+        assert 9 < stats["r1"]["next_in_seconds"] <= 10
+        assert 29 < stats["r2"]["next_in_seconds"] <= 30
+
+    asyncio.run(scenario())
+
+
+def test_first_deadline_is_spread_within_the_interval():
+    async def run(router, timestamp):
+        return 0
+
+    async def scenario():
+        scheduler = PollingScheduler(run, default_interval=60, max_concurrent=4)
+        scheduler.sync([router(f"r{i}") for i in range(20)])
+        offsets = [e.deadline - time.monotonic() for e in scheduler._entries.values()]
+        assert all(-1 < offset < 60 for offset in offsets)
+        assert len({round(offset) for offset in offsets}) > 1
+
+    asyncio.run(scenario())
+
+
+def test_run_now_waits_for_the_run_in_progress():
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def run(router, timestamp):
+            calls.append(router.alias)
+            await release.wait()
+            return 7
+
+        scheduler = PollingScheduler(run, default_interval=10, max_concurrent=4)
+        scheduler.sync([router("r1")])
+        first = asyncio.create_task(scheduler.run_now("r1"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(scheduler.run_now("r1"))
+        await asyncio.sleep(0)
+        release.set()
+        assert await first == [7]
+        assert await second == [7]
+        assert calls == ["r1"]
+
+    asyncio.run(scenario())
+
+
+def test_result_without_queue_count_keeps_the_priority():
+    results = iter([42, None])
+
+    async def run(router, timestamp):
+        return next(results)
+
+    async def scenario():
+        scheduler = PollingScheduler(run, default_interval=10, max_concurrent=4)
+        entry = _RouterSchedule(router("r1"), 10, deadline=100.0)
+        scheduler._dispatch(entry, now=100.0)
+        await entry.task
+        # Circuito abierto: el router no se consultó y conserva su prioridad
+        scheduler._dispatch(entry, now=110.0)
+        await entry.task
+        assert entry.queue_count == 42
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import os
+from models.router_config import RouterConfig
+from services.sharding import HashRing, ShardAssignment
+
+ALIASES = [f"router-{i}" for i in range(2000)]
+
+
+def router(alias):
+    return RouterConfig(host="10.0.0.1", username="u", password="p", alias=alias)
+
+
+def test_ring_is_deterministic_and_covers_every_shard():
+    ring = HashRing(4)
+    shards = [ring.shard_for(alias) for alias in ALIASES]
+    assert shards == [HashRing(4).shard_for(alias) for alias in ALIASES]
+    counts = [shards.count(shard) for shard in range(4)]
+    # 64 nodos virtuales por shard: ninguno se queda con mucho más que su parte
+    assert min(counts) > 0.5 * len(ALIASES) / 4
+    assert max(counts) < 1.5 * len(ALIASES) / 4
+
+
+def test_adding_a_shard_moves_only_routers_to_the_new_one():
+    before, after = HashRing(4), HashRing(5)
+    moved = [alias for alias in ALIASES if before.shard_for(alias) != after.shard_for(alias)]
+    assert all(after.shard_for(alias) == 4 for alias in moved)
+    assert len(moved) < 0.35 * len(ALIASES)
+
+
+def test_single_shard_owns_everything():
+    ring = HashRing(1)
+    assert {ring.shard_for(alias) for alias in ALIASES} == {0}
+
+
+def test_shard_is_claimed_lazily(tmp_path, monkeypatch):
+    monkeypatch.delenv("COLLECTOR_SHARD_ID", raising=False)
+    lease_dir = tmp_path / "leases"
+    first = ShardAssignment(None, 2, str(lease_dir))
+    assert not lease_dir.exists() and first.shard_id is None
+
+    assert first.claim() == 0
+    assert os.environ["COLLECTOR_SHARD_ID"] == "0"
+    second = ShardAssignment(None, 2, str(lease_dir))
+    assert second.claim() == 1
+    assert ShardAssignment(None, 2, str(lease_dir)).claim() is None
+
+
+def test_holds_all_requires_every_lease(tmp_path):
+    routers = [router("a"), router("b")]
+    first = ShardAssignment(0, 1, str(tmp_path))
+    assert not first.holds_all(routers)
+    assert first.owned(routers) == routers
+    assert first.holds_all(routers)
+
+    # Otro proceso del mismo shard no consigue los leases
+    second = ShardAssignment(0, 1, str(tmp_path))
+    assert second.owned(routers) == []
+    assert not second.holds_all(routers)
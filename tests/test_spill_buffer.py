@@ -0,0 +1,84 @@
+from core.spill_buffer import SpillBuffer
+
+# Cada registro ocupa 6 bytes de encabezado más el payload
+HEADER = 6
+
+
+def drain(spill):
+    payloads = []
+    while True:
+        record = spill.peek()
+        if record is None:
+            return payloads
+        seq, next_offset, payload, _ = record
+        payloads.append(payload)
+        spill.ack(seq, next_offset)
+
+
+def test_append_peek_ack(tmp_path):
+    spill = SpillBuffer(str(tmp_path), max_bytes=10_000, segment_bytes=1_000)
+    assert not spill
+    spill.append(b"m v=1 1", "s")
+    spill.append(b"m v=2 2", "ms")
+    assert spill.pending_bytes == 2 * (HEADER + 7)
+
+    seq, next_offset, payload, precision = spill.peek()
+    assert (payload, precision) == (b"m v=1 1", "s")
+    # Sin ack, peek devuelve el mismo registro
+    assert spill.peek()[2] == b"m v=1 1"
+    spill.ack(seq, next_offset)
+    assert spill.peek()[2:] == (b"m v=2 2", "ms")
+    assert drain(spill) == [b"m v=2 2"]
+    assert not spill
+    assert spill.stats()["replayed_batches"] == 2
+
+
+def test_order_across_segments(tmp_path):
+    spill = SpillBuffer(str(tmp_path), max_bytes=10_000, segment_bytes=30)
+    payloads = [b"batch-%02d" % i for i in range(8)]
+    for payload in payloads:
+        spill.append(payload, "s")
+    assert spill.stats()["segments"] > 1
+    assert drain(spill) == payloads
+    assert spill.stats()["segments"] == 0
+
+
+def test_unacked_records_survive_a_restart(tmp_path):
+    spill = SpillBuffer(str(tmp_path), max_bytes=10_000, segment_bytes=30)
+    for i in range(4):
+        spill.append(b"batch-%d" % i, "s")
+    spill.close()
+
+    reopened = SpillBuffer(str(tmp_path), max_bytes=10_000, segment_bytes=30)
+    assert drain(reopened) == [b"batch-%d" % i for i in range(4)]
+
+
+def test_cap_drops_oldest_segments(tmp_path):
+    # Un registro de 26 bytes por segmento; el tope deja lugar para tres
+    spill = SpillBuffer(str(tmp_path), max_bytes=100, segment_bytes=40)
+    payloads = [b"%020d" % i for i in range(5)]
+    for payload in payloads:
+        spill.append(payload, "s")
+
+    assert spill.pending_bytes <= 100
+    assert spill.stats()["dropped_bytes"] == 2 * (HEADER + 20)
+    assert drain(spill) == payloads[2:]
+
+
+def test_ack_of_a_segment_dropped_by_the_cap_is_ignored(tmp_path):
+    spill = SpillBuffer(str(tmp_path), max_bytes=100, segment_bytes=40)
+    spill.append(b"%020d" % 0, "s")
+    seq, next_offset, _, _ = spill.peek()
+    for i in range(1, 5):
+        spill.append(b"%020d" % i, "s")
+    spill.ack(seq, next_offset)
+    assert drain(spill) == [b"%020d" % i for i in range(2, 5)]
+
+
+def test_quarantine_is_capped(tmp_path):
+    spill = SpillBuffer(str(tmp_path), max_bytes=1_000, segment_bytes=50)
+    spill.quarantine(b"bad line 1", "400")
+    spill.quarantine(b"x" * 60, "400")
+    assert (tmp_path / "rejected.lp").read_bytes() == b"bad line 1\n"
+    assert spill.stats()["rejected_batches"] == 2
+    assert not spill
@@ -0,0 +1,123 @@
+from datetime import datetime
+from services.queue_parser import parse_queue_batch
+from services.usage_accounting import UsageAccounting
+
+
+def batch(timestamp, queues):
+    rows = [{"name": name, "target": "10.0.0.1", "bytes": counters} for name, counters in queues.items()]
+    return parse_queue_batch(rows, "r1", timestamp)
+
+
+def cycle(usage, timestamp, queues):
+    usage.begin_cycle(timestamp)
+    usage.add(batch(timestamp, queues))
+    usage.end_cycle()
+
+
+def upload(report, name="a"):
+    return report["usage"].get(name, {}).get("upload_bytes", 0)
+
+
+def test_first_cycle_is_baseline(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 17, 10, 50), {"a": "1000/0"})
+    cycle(usage, datetime(2026, 10, 17, 10, 55), {"a": "1600/0"})
+    assert upload(accounting.report("r1", "hour")) == 600
+
+
+def test_cycle_across_the_hour_splits_by_time(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 17, 10, 50), {"a": "0/0"})
+    cycle(usage, datetime(2026, 10, 17, 10, 55), {"a": "1000/0"})
+    # 10:55 -> 11:05: la mitad del avance es de la hora 10 y la otra mitad de la 11
+    cycle(usage, datetime(2026, 10, 17, 11, 5), {"a": "2000/0"})
+
+    closed = accounting.report("r1", "hour", "2026-10-17T10")
+    assert closed["complete"] is True
+    assert upload(closed) == 1500
+    current = accounting.report("r1", "hour")
+    assert current["key"] == "2026-10-17T11"
+    assert upload(current) == 500
+    # El día no cambió: lleva todo
+    assert upload(accounting.report("r1", "day")) == 2000
+
+
+def test_cycle_across_midnight_closes_hour_day_and_month(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 31, 23, 50), {"a": "0/0"})
+    cycle(usage, datetime(2026, 10, 31, 23, 55), {"a": "400/0"})
+    cycle(usage, datetime(2026, 11, 1, 0, 5), {"a": "1400/0"})
+
+    assert upload(accounting.report("r1", "hour", "2026-10-31T23")) == 900
+    assert upload(accounting.report("r1", "day", "2026-10-31")) == 900
+    assert upload(accounting.report("r1", "month", "2026-10")) == 900
+    for period in ("hour", "day", "month"):
+        assert upload(accounting.report("r1", period)) == 500
+
+
+def test_periods_use_the_configured_timezone(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "America/Bogota")  # UTC-5
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 18, 4, 50), {"a": "0/0"})
+    assert accounting.report("r1", "day")["key"] == "2026-10-17"
+
+
+def test_cycle_without_batches_does_not_roll_periods(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 17, 10, 50), {"a": "0/0"})
+    cycle(usage, datetime(2026, 10, 17, 10, 55), {"a": "1000/0"})
+    # Router caído durante el cambio de hora: el ciclo no trae lotes
+    usage.begin_cycle(datetime(2026, 10, 17, 11, 0))
+    usage.abort_cycle()
+    current = accounting.report("r1", "hour")
+    assert (current["key"], current["complete"]) == ("2026-10-17T10", False)
+    assert upload(current) == 1000
+
+    cycle(usage, datetime(2026, 10, 17, 11, 5), {"a": "2000/0"})
+    assert upload(accounting.report("r1", "hour", "2026-10-17T10")) == 1500
+    assert upload(accounting.report("r1", "hour")) == 500
+
+
+def test_state_survives_a_restart(tmp_path):
+    usage = UsageAccounting(str(tmp_path), "UTC").for_router("r1")
+    cycle(usage, datetime(2026, 10, 17, 10, 50), {"a": "0/0"})
+    cycle(usage, datetime(2026, 10, 17, 10, 55), {"a": "1000/0"})
+
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    cycle(accounting.for_router("r1"), datetime(2026, 10, 17, 10, 58), {"a": "1300/0"})
+    assert upload(accounting.report("r1", "hour")) == 1300
+
+
+def test_rollover_forgets_deleted_queues_without_usage_in_course(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 31, 22, 50), {"a": "0/0", "b": "0/0", "c": "0/0"})
+    cycle(usage, datetime(2026, 10, 31, 22, 55), {"a": "0/0", "b": "100/0", "c": "0/0"})
+    # b y c se borran: c no consumió nada y se olvida; b sigue en el día y el mes
+    cycle(usage, datetime(2026, 10, 31, 23, 5), {"a": "0/0"})
+    assert len(usage) == 2
+    assert upload(accounting.report("r1", "month"), "b") == 100
+
+    # Al cerrar el mes ya no queda consumo en curso de b
+    cycle(usage, datetime(2026, 11, 1, 0, 5), {"a": "0/0"})
+    assert len(usage) == 1
+    assert upload(accounting.report("r1", "month", "2026-10"), "b") == 100
+
+
+def test_aborted_rollover_keeps_missing_queues(tmp_path):
+    accounting = UsageAccounting(str(tmp_path), "UTC")
+    usage = accounting.for_router("r1")
+    cycle(usage, datetime(2026, 10, 17, 10, 55), {"a": "0/0", "b": "500/0"})
+    # Ciclo cortado: b puede no haber llegado todavía
+    usage.begin_cycle(datetime(2026, 10, 17, 11, 5))
+    usage.add(batch(datetime(2026, 10, 17, 11, 5), {"a": "0/0"}))
+    usage.abort_cycle()
+    assert len(usage) == 2
+
+    # Si b se olvidara, su contador entero se contaría como consumo
+    cycle(usage, datetime(2026, 10, 17, 11, 10), {"a": "0/0", "b": "500/0"})
+    assert upload(accounting.report("r1", "hour"), "b") == 0